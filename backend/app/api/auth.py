@@ -2,57 +2,78 @@ from datetime import timedelta
 from typing import Any
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from ...database import get_db
-from ..schemas.user import User, UserCreate, Token
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
+from ..schemas.user import CurrentUser, User, UserCreate, Token
 from ..models.user import User as UserModel
 from ..utils.auth import (
-    verify_password,
-    get_password_hash,
     create_access_token,
     ACCESS_TOKEN_EXPIRE_MINUTES,
     get_current_active_user
 )
+from ..utils.passwords import HashingBusy, get_password_hasher
 
 router = APIRouter()
 
+def _hashing_busy(e: HashingBusy) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(e),
+        headers={"Retry-After": "1"},
+    )
+
 @router.post("/register", response_model=User)
-def register_user(
+async def register_user(
     user_in: UserCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> Any:
     """
     Register a new user.
     """
-    user = db.query(UserModel).filter(UserModel.email == user_in.email).first()
+    result = await db.execute(select(UserModel).where(UserModel.email == user_in.email))
+    user = result.scalar_one_or_none()
     if user:
         raise HTTPException(
             status_code=400,
             detail="The user with this email already exists in the system.",
         )
     
+    try:
+        hashed_password = await get_password_hasher().hash(user_in.password)
+    except HashingBusy as e:
+        raise _hashing_busy(e)
     user = UserModel(
         email=user_in.email,
-        hashed_password=get_password_hash(user_in.password),
+        hashed_password=hashed_password,
         full_name=user_in.full_name,
         phone_number=user_in.phone_number,
-        role=user_in.role
+        role=user_in.user_type
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 @router.post("/token", response_model=Token)
-def login_access_token(
-    db: Session = Depends(get_db),
+async def login_access_token(
+    db: AsyncSession = Depends(get_async_db),
     form_data: OAuth2PasswordRequestForm = Depends()
 ) -> Any:
     """
     OAuth2 compatible token login, get an access token for future requests.
     """
-    user = db.query(UserModel).filter(UserModel.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    result = await db.execute(select(UserModel).where(UserModel.email == form_data.username))
+    user = result.scalar_one_or_none()
+    valid, new_hash = False, None
+    if user:
+        try:
+            valid, new_hash = await get_password_hasher().verify(
+                form_data.password, user.hashed_password
+            )
+        except HashingBusy as e:
+            raise _hashing_busy(e)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -63,6 +84,10 @@ def login_access_token(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Inactive user"
         )
+    if new_hash:
+        # Stored with an outdated cost factor; upgrade it while we have the password
+        user.hashed_password = new_hash
+        await db.commit()
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     return {
@@ -73,8 +98,8 @@ def login_access_token(
     }
 
 @router.get("/me", response_model=User)
-def read_users_me(
-    current_user: UserModel = Depends(get_current_active_user),
+async def read_users_me(
+    current_user: CurrentUser = Depends(get_current_active_user),
 ) -> Any:
     """
     Get current user.
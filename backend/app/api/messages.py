@@ -1,19 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from app.database import AsyncSessionLocal, get_async_db, get_async_read_db
 from app.models.message import Message
-from app.schemas.message import MessageCreate, Message as MessageSchema, Conversation
-from app.api.auth import get_current_user
-from app.models.user import User
+from app.schemas.export import ExportFormat
+from app.schemas.message import MessageCreate, Message as MessageSchema, Conversation, TypingEvent
+from app.utils.auth import authenticate_token, get_current_user
+from app.schemas.user import CurrentUser
+from app.services import message as message_service
+from app.services.broker import Broker, Subscription, get_broker
+from app.services.export import export_response
+from app.utils.pagination import InvalidCursor, NEXT_CURSOR_HEADER
+from app.utils.query_detector import query_budget
+from app.utils.responses import model_response
 
 router = APIRouter()
 
 @router.post("/", response_model=MessageSchema)
 async def create_message(
     message: MessageCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     db_message = Message(
         sender_id=current_user.id,
@@ -22,56 +31,146 @@ async def create_message(
         content=message.content
     )
     db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    await db.commit()
+    await db.refresh(db_message)
+
+    payload = MessageSchema.model_validate(db_message).model_dump(mode="json")
+    await get_broker().publish_many(
+        [db_message.receiver_id, db_message.sender_id],
+        {"type": "message", "message": payload}
+    )
     return db_message
 
 @router.get("/conversations", response_model=List[Conversation])
+@query_budget(2)
 async def get_conversations(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    try:
+        conversations, next_cursor = await message_service.get_conversations(
+            db, current_user.id, limit, cursor
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response = model_response(List[Conversation], conversations)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
+
+@router.get("/export")
+async def export_messages(
+    format: ExportFormat = ExportFormat.NDJSON,
+    gzip: bool = False,
+    property_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    # Get all unique conversations for the current user
-    conversations = db.query(Message).filter(
-        (Message.sender_id == current_user.id) | 
-        (Message.receiver_id == current_user.id)
-    ).order_by(Message.created_at.desc()).all()
-    
-    # Process conversations to get the latest message for each user
-    conversation_map = {}
-    for msg in conversations:
-        other_user_id = msg.receiver_id if msg.sender_id == current_user.id else msg.sender_id
-        if other_user_id not in conversation_map:
-            other_user = db.query(User).filter(User.id == other_user_id).first()
-            conversation_map[other_user_id] = {
-                "user_id": other_user_id,
-                "user_name": other_user.full_name,
-                "last_message": msg.content,
-                "last_message_time": msg.created_at,
-                "unread_count": 0,
-                "property_id": msg.property_id,
-                "property_title": msg.property.title
-            }
-    
-    return list(conversation_map.values())
+    """
+    Stream all of the user's sent and received messages, in id order, as
+    NDJSON or CSV, optionally only those about one property and/or with
+    one other user. Messages are not marked as read.
+    """
+    query = message_service.export_query(current_user.id, property_id, user_id)
+    return export_response([query], MessageSchema, format, gzip, "messages")
 
 @router.get("/{property_id}/{user_id}", response_model=List[MessageSchema])
+@query_budget(3)
 async def get_messages(
     property_id: int,
     user_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    limit: int = Query(50, ge=1, le=200),
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    messages = db.query(Message).filter(
-        ((Message.sender_id == current_user.id) & (Message.receiver_id == user_id)) |
-        ((Message.sender_id == user_id) & (Message.receiver_id == current_user.id)),
-        Message.property_id == property_id
-    ).order_by(Message.created_at.asc()).all()
-    
-    # Mark messages as read
-    for msg in messages:
-        if msg.receiver_id == current_user.id and not msg.is_read:
-            msg.is_read = True
-    db.commit()
-    
-    return messages 
\ No newline at end of file
+    """
+    Get a page of a conversation, oldest first within the page.
+
+    By default this is the newest `limit` messages; pass the oldest id you
+    have as `before_id` to load older ones, or the newest id you have as
+    `after_id` to fetch only what arrived since.
+    """
+    messages = await message_service.get_thread(
+        db, current_user.id, user_id, property_id, limit, before_id, after_id
+    )
+    if not messages:
+        return model_response(List[MessageSchema], messages)
+
+    # Mark everything up to the newest message returned as read
+    last_id = messages[-1].id
+    marked = await message_service.mark_thread_read(
+        db, current_user.id, user_id, property_id, last_id
+    )
+    if marked:
+        await get_broker().publish(user_id, {
+            "type": "read",
+            "reader_id": current_user.id,
+            "property_id": property_id,
+            "last_read_id": last_id
+        })
+
+    return model_response(List[MessageSchema], messages, from_attributes=True)
+
+async def _send_events(websocket: WebSocket, subscription: Subscription):
+    while True:
+        await websocket.send_json(await subscription.get())
+
+async def _receive_events(websocket: WebSocket, broker: Broker, user_id: int):
+    # (receiver, property) pairs the user already has a thread with; typing
+    # events to anyone else are dropped
+    threads = set()
+    while True:
+        data = await websocket.receive_text()
+        try:
+            event = TypingEvent.model_validate_json(data)
+        except ValidationError:
+            continue
+        thread = (event.receiver_id, event.property_id)
+        if thread not in threads:
+            async with AsyncSessionLocal() as db:
+                if not await message_service.has_thread(db, user_id, *thread):
+                    continue
+            threads.add(thread)
+        await broker.publish(event.receiver_id, {
+            "type": "typing",
+            "sender_id": user_id,
+            "property_id": event.property_id
+        })
+
+@router.websocket("/ws")
+async def messages_websocket(websocket: WebSocket, token: str = Query(...)):
+    """
+    Push new messages, read receipts and typing events to the user.
+    Browsers can't set an Authorization header on WebSockets, so the access
+    token is passed as a query parameter.
+    """
+    user = await authenticate_token(token)
+    if user is None or not user.is_active:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    broker = get_broker()
+    subscription = broker.subscribe(user.id)
+    tasks = [
+        asyncio.create_task(_send_events(websocket, subscription)),
+        asyncio.create_task(_receive_events(websocket, broker, user.id)),
+        asyncio.create_task(subscription.overflowed.wait()),
+    ]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        if subscription.overflowed.is_set():
+            # Too slow to keep up; the client should reconnect and catch up over HTTP
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        else:
+            for task in done:
+                if not isinstance(task.exception(), WebSocketDisconnect):
+                    task.result()
+    finally:
+        broker.unsubscribe(subscription)
+        for task in tasks:
+            task.cancel()
@@ -1,34 +1,73 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from ...database import get_db
-from ..schemas.property import Property, PropertyCreate, PropertyUpdate, PropertySearchParams
-from ..models.user import User
+from typing import Any, List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import (
+    get_async_db,
+    get_async_read_db,
+    read_session_factory,
+    reads_replica,
+    recent_writers,
+)
+from ..schemas.property import (
+    Property,
+    PropertyClusters,
+    PropertyCreate,
+    PropertyFacets,
+    PropertyImportFormat,
+    PropertyImportSummary,
+    PropertyInDBBase,
+    PropertySearchParams,
+    PropertySort,
+    PropertyUpdate,
+    PropertyView,
+    projection_list,
+)
+from ..schemas.export import ExportFormat
+from ..schemas.user import CurrentUser
 from ..utils.auth import get_current_active_user
+from ..utils.pagination import InvalidCursor, NEXT_CURSOR_HEADER
+from ..utils.query_detector import query_budget
+from ..utils.responses import model_response
 from ..services import property as property_service
+from ..services import property_import
+from ..services.export import export_response
+from ..services.cache import PROPERTIES_TAG, USERS_TAG, QueryCache, get_query_cache
+from ..services.clusters import MAX_MAP_ZOOM
 
 router = APIRouter()
 
-@router.post("/", response_model=Property)
-def create_property(
-    property_in: PropertyCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
-):
+# Listings embed their owners, so cached pages depend on both tables
+LISTING_CACHE_TAGS = (PROPERTIES_TAG, USERS_TAG)
+
+property_list = TypeAdapter(List[Property])
+
+MAX_PAGE_SIZE = 100
+
+def _cacheable(cache: QueryCache, db: AsyncSession, tags: Tuple[str, ...]) -> bool:
     """
-    Create a new property listing.
+    Whether a result read with `db` may be cached: not when it was read
+    from the replica soon after a write it depends on, as the replica may
+    not have the write yet and every client would then get the stale result.
     """
-    if current_user.role != "property_owner":
-        raise HTTPException(
-            status_code=403,
-            detail="Only property owners can create listings"
-        )
-    return property_service.create_property(db, property_in, current_user.id)
+    return not (reads_replica(db) and cache.invalidated_within(tags, recent_writers.window))
 
-@router.get("/", response_model=List[Property])
-def get_properties(
-    skip: int = 0,
-    limit: int = 100,
+def _serialize(properties: List[Any], fields: Optional[Tuple[str, ...]]) -> bytes:
+    if fields is not None:
+        return projection_list(fields).dump_json(properties)
+    # Validate from the ORM objects first, as response_model does; dumping
+    # them directly would skip attributes that aren't columns, such as
+    # rating_histogram
+    return property_list.dump_json(property_list.validate_python(properties, from_attributes=True))
+
+def _fields(view: PropertyView, fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    try:
+        return property_service.projected_fields(view, fields)
+    except property_service.InvalidSearch as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def search_filters(
+    q: Optional[str] = Query(None, max_length=200),
     property_type: Optional[str] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
@@ -39,15 +78,16 @@ def get_properties(
     is_furnished: Optional[bool] = None,
     has_parking: Optional[bool] = None,
     has_security: Optional[bool] = None,
+    min_rating: Optional[float] = Query(None, ge=0, le=5),
     radius: Optional[float] = None,
     latitude: Optional[float] = None,
-    longitude: Optional[float] = None,
-    db: Session = Depends(get_db)
-):
+    longitude: Optional[float] = None
+) -> PropertySearchParams:
     """
-    Get all properties with optional filters.
+    Search filters shared by the listing, facet and cluster routes.
     """
-    search_params = PropertySearchParams(
+    return PropertySearchParams(
+        q=q,
         property_type=property_type,
         min_price=min_price,
         max_price=max_price,
@@ -58,67 +98,291 @@ def get_properties(
         is_furnished=is_furnished,
         has_parking=has_parking,
         has_security=has_security,
+        min_rating=min_rating,
         radius=radius,
         latitude=latitude,
         longitude=longitude
     )
-    return property_service.get_properties(db, skip, limit, search_params)
+
+@router.post("/", response_model=Property)
+async def create_property(
+    property_in: PropertyCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
+):
+    """
+    Create a new property listing.
+    """
+    if current_user.role != "property_owner":
+        raise HTTPException(
+            status_code=403,
+            detail="Only property owners can create listings"
+        )
+    return await property_service.create_property(db, property_in, current_user.id)
+
+# Content types accepted by the bulk import when no format is given
+IMPORT_CONTENT_TYPES = {
+    "text/csv": PropertyImportFormat.CSV,
+    "application/x-ndjson": PropertyImportFormat.NDJSON,
+    "application/ndjson": PropertyImportFormat.NDJSON,
+    "application/jsonl": PropertyImportFormat.NDJSON,
+}
+
+@router.post("/import", response_model=PropertyImportSummary)
+async def import_properties(
+    request: Request,
+    format: Optional[PropertyImportFormat] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
+):
+    """
+    Create listings in bulk from a CSV (with a header row) or NDJSON body,
+    streamed rather than read into memory.
+
+    The format is taken from `format`, or else the Content-Type. Invalid
+    rows are skipped and reported by line number in the summary; valid rows
+    are inserted and committed in batches.
+    """
+    if current_user.role != "property_owner":
+        raise HTTPException(
+            status_code=403,
+            detail="Only property owners can create listings"
+        )
+    if format is None:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+        format = IMPORT_CONTENT_TYPES.get(content_type)
+        if format is None:
+            raise HTTPException(
+                status_code=415,
+                detail="Send text/csv or application/x-ndjson, or pass format"
+            )
+    return await property_import.import_properties(db, request.stream(), format, current_user.id)
+
+@router.get("/", response_model=List[Property])
+@query_budget(3)
+async def get_properties(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: Optional[PropertySort] = None,
+    view: PropertyView = PropertyView.FULL,
+    fields: Optional[str] = None,
+    search_params: PropertySearchParams = Depends(search_filters),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Get all properties with optional filters.
+
+    Pass `cursor` (empty for the first page) to page by keyset instead of
+    `skip`; the cursor for the next page is returned in the X-Next-Cursor header.
+    Keyword searches (`q`) are ordered by relevance and radius searches
+    (latitude, longitude and radius in km) by distance unless another sort
+    is given. `min_rating` keeps properties whose average review rating is
+    at least that, and `sort=rating` puts the best rated first; both use
+    the rating summary stored on each property.
+
+    `view=compact` returns a few summary fields per property, and `fields`
+    a comma-separated list of fields (id is always included), selected
+    directly from the database without the owner.
+
+    Pages are cached (see app/services/cache.py) until a property, user or
+    review changes; the X-Cache header tells whether the cache was hit.
+    Pages read from the replica just after such a change aren't cached.
+    """
+    selected = _fields(view, fields)
+    if sort is None:
+        sort = property_service.default_sort(search_params)
+
+    cache = get_query_cache()
+    key = property_service.listing_cache_key(search_params, sort, limit, skip, cursor, selected)
+    cached = await cache.get(key)
+    cache_status = "HIT"
+    if cached is None:
+        cache_status = "MISS"
+        versions = await cache.versions(LISTING_CACHE_TAGS)
+        try:
+            if cursor is None:
+                properties = await property_service.get_properties(
+                    db, skip, limit, search_params, sort, selected
+                )
+                next_cursor = None
+            else:
+                properties, next_cursor = await property_service.get_properties_page(
+                    db, limit, search_params, sort, cursor, selected
+                )
+        except (InvalidCursor, property_service.InvalidSearch) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        # Cache the serialized page so hits skip serialization as well
+        cached = (_serialize(properties, selected), next_cursor)
+        if _cacheable(cache, db, LISTING_CACHE_TAGS):
+            await cache.set(key, cached, LISTING_CACHE_TAGS, versions)
+
+    body, next_cursor = cached
+    response = Response(content=body, media_type="application/json")
+    response.headers["X-Cache"] = cache_status
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
+
+@router.get("/export")
+async def export_properties(
+    request: Request,
+    format: ExportFormat = ExportFormat.NDJSON,
+    gzip: bool = False,
+    search_params: PropertySearchParams = Depends(search_filters),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Stream every property matching the filters, in id order, as NDJSON or
+    CSV (with a header row), gzip-encoded on the fly with `gzip=true`.
+    Owners are not embedded; each row carries owner_id.
+    """
+    queries = await property_service.export_queries(db, search_params)
+    return export_response(
+        queries, PropertyInDBBase, format, gzip, "properties", read_session_factory(request)
+    )
+
+@router.get("/facets", response_model=PropertyFacets)
+@query_budget(1)
+async def get_property_facets(
+    price_buckets: Optional[str] = None,
+    search_params: PropertySearchParams = Depends(search_filters),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Counts of the properties matching the filters by type, city, district,
+    bedrooms, price bucket and amenity, for building search facets.
+
+    `price_buckets` is an increasing comma-separated list of bucket
+    boundaries, e.g. `500000,1000000` for under 500k, 500k to 1M and 1M
+    and over. Results are cached like listing pages.
+    """
+    try:
+        buckets = property_service.parse_price_buckets(price_buckets)
+    except property_service.InvalidSearch as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    cache = get_query_cache()
+    key = property_service.facets_cache_key(search_params, buckets)
+    body = await cache.get(key)
+    cache_status = "HIT"
+    if body is None:
+        cache_status = "MISS"
+        versions = await cache.versions((PROPERTIES_TAG,))
+        facets = await property_service.get_property_facets(db, search_params, buckets)
+        body = PropertyFacets.model_validate(facets).model_dump_json().encode()
+        if _cacheable(cache, db, (PROPERTIES_TAG,)):
+            await cache.set(key, body, (PROPERTIES_TAG,), versions)
+
+    response = Response(content=body, media_type="application/json")
+    response.headers["X-Cache"] = cache_status
+    return response
+
+@router.get("/clusters", response_model=PropertyClusters)
+@query_budget(3)
+async def get_property_clusters(
+    bbox: str,
+    zoom: int = Query(..., ge=0, le=MAX_MAP_ZOOM),
+    search_params: PropertySearchParams = Depends(search_filters),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Properties matching the filters in a map view, grouped for drawing
+    markers. `bbox` is the view's `west,south,east,north` edges in degrees
+    (west above east when it crosses the antimeridian) and `zoom` the
+    map's zoom level.
+
+    Properties sharing a cell of the map (CLUSTER_CELL_PIXELS wide, 64 by
+    default) are returned as a cluster with their count, centroid and
+    price range; a property alone in its cell, and every property beyond
+    CLUSTER_MAX_ZOOM (16 by default), is returned as a point.
+    """
+    try:
+        view = property_service.parse_bbox(bbox)
+        clusters = await property_service.get_property_clusters(db, view, zoom, search_params)
+    except property_service.InvalidSearch as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return model_response(PropertyClusters, clusters)
 
 @router.get("/{property_id}", response_model=Property)
-def get_property(
+@query_budget(1)
+async def get_property(
     property_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     Get a specific property by ID.
     """
-    property = property_service.get_property(db, property_id)
+    property = await property_service.get_property(db, property_id)
     if not property:
         raise HTTPException(status_code=404, detail="Property not found")
     return property
 
 @router.put("/{property_id}", response_model=Property)
-def update_property(
+async def update_property(
     property_id: int,
     property_in: PropertyUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     """
     Update a property listing.
     """
-    property = property_service.update_property(db, property_id, property_in, current_user.id)
+    property = await property_service.update_property(db, property_id, property_in, current_user.id)
     if not property:
         raise HTTPException(status_code=404, detail="Property not found")
     return property
 
 @router.delete("/{property_id}")
-def delete_property(
+async def delete_property(
     property_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     """
     Delete a property listing.
     """
-    success = property_service.delete_property(db, property_id, current_user.id)
+    success = await property_service.delete_property(db, property_id, current_user.id)
     if not success:
         raise HTTPException(status_code=404, detail="Property not found")
     return {"message": "Property deleted successfully"}
 
 @router.get("/owner/me", response_model=List[Property])
-def get_my_properties(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+@query_budget(3)
+async def get_my_properties(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: PropertySort = PropertySort.NEWEST,
+    view: PropertyView = PropertyView.FULL,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     """
-    Get all properties owned by the current user.
+    Get all properties owned by the current user. Supports the same
+    paging and `view`/`fields` options as the property list.
     """
     if current_user.role != "property_owner":
         raise HTTPException(
             status_code=403,
             detail="Only property owners can view their listings"
         )
-    return property_service.get_owner_properties(db, current_user.id, skip, limit) 
\ No newline at end of file
+    selected = _fields(view, fields)
+    try:
+        if cursor is None:
+            properties = await property_service.get_owner_properties(
+                db, current_user.id, skip, limit, sort, selected
+            )
+            next_cursor = None
+        else:
+            properties, next_cursor = await property_service.get_owner_properties_page(
+                db, current_user.id, limit, sort, cursor, fields=selected
+            )
+    except (InvalidCursor, property_service.InvalidSearch) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response = Response(content=_serialize(properties, selected), media_type="application/json")
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
+ 
\ No newline at end of file
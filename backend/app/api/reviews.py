@@ -1,82 +1,127 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional
+from app.database import get_async_db, get_async_read_db
 from app.models.review import Review
-from app.schemas.review import ReviewCreate, Review as ReviewSchema, ReviewUpdate
-from app.api.auth import get_current_user
-from app.models.user import User
+from app.schemas.export import ExportFormat
+from app.schemas.review import ReviewCreate, Review as ReviewSchema, ReviewSort, ReviewUpdate
+from app.utils.auth import get_current_user
+from app.schemas.user import CurrentUser
+from app.services import review as review_service
+from app.services.export import export_response
+from app.utils.pagination import InvalidCursor, NEXT_CURSOR_HEADER
+from app.utils.query_detector import query_budget
+from app.utils.responses import model_response
 
 router = APIRouter()
 
+# Most properties one batch of latest reviews may ask for
+MAX_BATCH_PROPERTIES = 100
+
 @router.post("/", response_model=ReviewSchema)
 async def create_review(
     review: ReviewCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    # Check if user has already reviewed this property
-    existing_review = db.query(Review).filter(
-        Review.property_id == review.property_id,
-        Review.reviewer_id == current_user.id
-    ).first()
-    
-    if existing_review:
-        raise HTTPException(status_code=400, detail="You have already reviewed this property")
-    
-    db_review = Review(
-        property_id=review.property_id,
-        reviewer_id=current_user.id,
-        rating=review.rating,
-        comment=review.comment
-    )
-    db.add(db_review)
-    db.commit()
-    db.refresh(db_review)
+    try:
+        db_review = await review_service.create_review(db, review, current_user.id)
+    except review_service.DuplicateReview as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if db_review is None:
+        raise HTTPException(status_code=404, detail="Property not found")
     return db_review
 
 @router.get("/property/{property_id}", response_model=List[ReviewSchema])
+@query_budget(1)
 async def get_property_reviews(
     property_id: int,
-    db: Session = Depends(get_db)
+    limit: int = Query(20, ge=1, le=100),
+    sort: ReviewSort = ReviewSort.NEWEST,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    A page of a property's reviews, newest or highest/lowest rated first.
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    try:
+        reviews, next_cursor = await review_service.get_property_reviews(
+            db, property_id, limit, sort, cursor
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response = model_response(List[ReviewSchema], reviews)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
+
+@router.get("/latest", response_model=Dict[int, List[ReviewSchema]])
+@query_budget(1)
+async def get_latest_reviews(
+    property_ids: str,
+    limit: int = Query(3, ge=1, le=20),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    reviews = db.query(Review).filter(Review.property_id == property_id).all()
-    return reviews
+    """
+    The newest `limit` reviews of each property in `property_ids` (a
+    comma-separated list of up to MAX_BATCH_PROPERTIES ids), keyed by
+    property id, for listing cards.
+    """
+    try:
+        ids = list(dict.fromkeys(int(value) for value in property_ids.split(",") if value.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="property_ids must be a comma-separated list of ids")
+    if len(ids) > MAX_BATCH_PROPERTIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BATCH_PROPERTIES} property ids are allowed"
+        )
+    latest = await review_service.get_latest_reviews(db, ids, limit)
+    return model_response(Dict[int, List[ReviewSchema]], latest)
+
+@router.get("/export")
+async def export_reviews(
+    format: ExportFormat = ExportFormat.NDJSON,
+    gzip: bool = False,
+    property_id: Optional[int] = None,
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Stream the reviews of the user's properties, in id order, as NDJSON or
+    CSV, optionally only those of one property.
+    """
+    query = review_service.export_query(current_user.id, property_id)
+    return export_response([query], ReviewSchema, format, gzip, "reviews")
 
 @router.put("/{review_id}", response_model=ReviewSchema)
 async def update_review(
     review_id: int,
     review_update: ReviewUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    db_review = db.query(Review).filter(Review.id == review_id).first()
+    db_review = await db.get(Review, review_id, with_for_update=True)
     if not db_review:
         raise HTTPException(status_code=404, detail="Review not found")
     
     if db_review.reviewer_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to update this review")
     
-    for field, value in review_update.dict(exclude_unset=True).items():
-        setattr(db_review, field, value)
-    
-    db.commit()
-    db.refresh(db_review)
-    return db_review
+    return await review_service.update_review(db, db_review, review_update)
 
 @router.delete("/{review_id}")
 async def delete_review(
     review_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    db_review = db.query(Review).filter(Review.id == review_id).first()
+    db_review = await db.get(Review, review_id, with_for_update=True)
     if not db_review:
         raise HTTPException(status_code=404, detail="Review not found")
     
     if db_review.reviewer_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this review")
     
-    db.delete(db_review)
-    db.commit()
+    await review_service.delete_review(db, db_review)
     return {"message": "Review deleted successfully"} 
\ No newline at end of file
@@ -1,67 +1,98 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
-from typing import Optional
-from app.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db, get_async_read_db
 from app.models.user import User
-from app.schemas.user import UserProfile, UserUpdate
-from app.api.auth import get_current_user
-import shutil
-import os
-from pathlib import Path
+from app.schemas.user import CurrentUser, ProfilePictureUpload, UserProfile, UserUpdate
+from app.utils.auth import get_current_user, invalidate_user
+from app.utils.images import AVATAR_MAX_BYTES, ImageProcessingBusy, InvalidImage, get_image_processor
+from app.utils.query_detector import query_budget
+from app.utils.uploads import InvalidUpload, UploadTooLarge, read_upload
+from app.services.cache import USERS_TAG, get_query_cache
 
 router = APIRouter()
 
 @router.get("/me", response_model=UserProfile)
+@query_budget(1)
 async def get_current_user_profile(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     return current_user
 
 @router.put("/me", response_model=UserProfile)
 async def update_user_profile(
     user_update: UserUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
+    user = await db.get(User, current_user.id)
     for field, value in user_update.dict(exclude_unset=True).items():
-        setattr(current_user, field, value)
+        setattr(user, field, value)
     
-    db.commit()
-    db.refresh(current_user)
-    return current_user
+    await db.commit()
+    await invalidate_user(user.email)
+    await get_query_cache().invalidate(USERS_TAG)
+    await db.refresh(user)
+    return user
+
+PROFILE_PICTURE_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
 
-@router.post("/me/profile-picture")
+@router.post(
+    "/me/profile-picture",
+    response_model=ProfilePictureUpload,
+    openapi_extra=PROFILE_PICTURE_BODY
+)
 async def upload_profile_picture(
-    file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    # Create uploads directory if it doesn't exist
-    upload_dir = Path("uploads/profile_pictures")
-    upload_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Generate unique filename
-    file_extension = file.filename.split(".")[-1]
-    filename = f"{current_user.id}_{current_user.email}.{file_extension}"
-    file_path = upload_dir / filename
-    
-    # Save file
-    with file_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Update user profile picture path
-    current_user.profile_picture = str(file_path)
-    db.commit()
-    
-    return {"message": "Profile picture uploaded successfully", "file_path": str(file_path)}
+    try:
+        data = await read_upload(request, "file", AVATAR_MAX_BYTES)
+        variants = await get_image_processor().avatar(data)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except (InvalidUpload, InvalidImage) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except ImageProcessingBusy as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"},
+        )
+
+    file_path = variants[max(variants)]["webp"]
+    user = await db.get(User, current_user.id)
+    user.profile_picture = file_path
+    await db.commit()
+    await invalidate_user(user.email)
+    await get_query_cache().invalidate(USERS_TAG)
+
+    return {
+        "message": "Profile picture uploaded successfully",
+        "file_path": file_path,
+        "variants": variants,
+    }
 
 @router.get("/{user_id}", response_model=UserProfile)
+@query_budget(1)
 async def get_user_profile(
     user_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user 
\ No newline at end of file
@@ -1,15 +1,23 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Conversation inbox: a user's sent and received messages, and unread counts
+        Index("ix_messages_sender_id_created_at", "sender_id", "created_at"),
+        Index("ix_messages_receiver_id_created_at", "receiver_id", "created_at"),
+        Index("ix_messages_receiver_id_is_read", "receiver_id", "is_read"),
+        # Thread pages and bulk read-marking
+        Index("ix_messages_thread", "sender_id", "receiver_id", "property_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     sender_id = Column(Integer, ForeignKey("users.id"))
     receiver_id = Column(Integer, ForeignKey("users.id"))
-    property_id = Column(Integer, ForeignKey("properties.id"))
+    property_id = Column(Integer, ForeignKey("properties.id", ondelete="CASCADE"))
     content = Column(Text)
     is_read = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
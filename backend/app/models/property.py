@@ -1,8 +1,9 @@
-from sqlalchemy import Boolean, Column, Integer, String, Float, ForeignKey, Enum, Text
+from sqlalchemy import Boolean, Column, Integer, String, Float, ForeignKey, Enum, Text, Index
 from sqlalchemy.sql import func
 from sqlalchemy.sql.sqltypes import DateTime
 from sqlalchemy.orm import relationship
 import enum
+from typing import List
 from ..database import Base
 
 class PropertyType(str, enum.Enum):
@@ -20,6 +21,15 @@ class PropertyStatus(str, enum.Enum):
 
 class Property(Base):
     __tablename__ = "properties"
+    __table_args__ = (
+        # Keyset pagination sort keys
+        Index("ix_properties_created_at_id", "created_at", "id"),
+        Index("ix_properties_price_id", "price", "id"),
+        Index("ix_properties_owner_id_created_at_id", "owner_id", "created_at", "id"),
+        Index("ix_properties_rating_average_rating_count_id", "rating_average", "rating_count", "id"),
+        # Filtered map views (see app/services/clusters.py)
+        Index("ix_properties_latitude_longitude", "latitude", "longitude"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
@@ -48,10 +58,38 @@ class Property(Base):
     has_water = Column(Boolean, default=True)
     has_electricity = Column(Boolean, default=True)
     
+    # Rating summary, kept in step with the reviews table by
+    # app/services/review.py. rating_average is 0 until the first review,
+    # and rating_N_count is the number of reviews rounding to N stars.
+    rating_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_sum = Column(Float, nullable=False, default=0, server_default="0")
+    rating_average = Column(Float, nullable=False, default=0, server_default="0")
+    rating_1_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_2_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_3_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_4_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_5_count = Column(Integer, nullable=False, default=0, server_default="0")
+
     # Relationships
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     owner = relationship("User", back_populates="properties")
+    # Deleting a listing deletes its reviews and messages (see
+    # app/services/property.py), and the foreign keys cascade as well
+    reviews = relationship("Review", back_populates="property", cascade="all, delete-orphan", passive_deletes=True)
     
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now()) 
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    @property
+    def rating_histogram(self) -> List[int]:
+        """
+        Number of reviews rounding to 1 to 5 stars.
+        """
+        return [
+            self.rating_1_count,
+            self.rating_2_count,
+            self.rating_3_count,
+            self.rating_4_count,
+            self.rating_5_count,
+        ]
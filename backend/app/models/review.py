@@ -1,13 +1,19 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Float
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Float, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 class Review(Base):
     __tablename__ = "reviews"
+    __table_args__ = (
+        # Pages of a property's reviews in each sort order, and the latest
+        # reviews of many properties
+        Index("ix_reviews_property_id_created_at_id", "property_id", "created_at", "id"),
+        Index("ix_reviews_property_id_rating_id", "property_id", "rating", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    property_id = Column(Integer, ForeignKey("properties.id"))
+    property_id = Column(Integer, ForeignKey("properties.id", ondelete="CASCADE"))
     reviewer_id = Column(Integer, ForeignKey("users.id"))
     rating = Column(Float)  # 1-5 stars
     comment = Column(Text)
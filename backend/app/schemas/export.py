@@ -0,0 +1,5 @@
+import enum
+
+class ExportFormat(str, enum.Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Literal
 from datetime import datetime
 
 class MessageBase(BaseModel):
@@ -24,6 +24,13 @@ class Conversation(BaseModel):
     user_name: str
     last_message: str
     last_message_time: datetime
+    last_message_id: int
     unread_count: int
     property_id: int
-    property_title: str 
\ No newline at end of file
+    property_title: str 
+
+class TypingEvent(BaseModel):
+    # Sent by WebSocket clients while the user is composing a message
+    type: Literal["typing"]
+    receiver_id: int
+    property_id: int
@@ -1,6 +1,9 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from pydantic import BaseModel, Field, TypeAdapter
+from typing import Optional, List, Tuple, Union
+from typing_extensions import TypedDict
 from datetime import datetime
+from functools import lru_cache
+import enum
 from .user import User
 from ..models.property import PropertyType, PropertyStatus
 
@@ -52,6 +55,9 @@ class PropertyInDBBase(PropertyBase):
     id: int
     status: PropertyStatus
     owner_id: int
+    rating_count: int = 0
+    rating_sum: float = 0
+    rating_average: float = 0  # 0 until the first review
     created_at: datetime
     updated_at: Optional[datetime] = None
 
@@ -60,8 +66,45 @@ class PropertyInDBBase(PropertyBase):
 
 class Property(PropertyInDBBase):
     owner: User
+    rating_histogram: List[int] = [0, 0, 0, 0, 0]  # reviews rounding to 1-5 stars
+    distance_km: Optional[float] = None  # set on radius searches
+
+class PropertySort(str, enum.Enum):
+    NEWEST = "newest"
+    OLDEST = "oldest"
+    PRICE_ASC = "price_asc"
+    PRICE_DESC = "price_desc"
+    DISTANCE = "distance"
+    RELEVANCE = "relevance"
+    RATING = "rating"
+
+class PropertyView(str, enum.Enum):
+    COMPACT = "compact"
+    FULL = "full"
+
+# Fields of the compact view; like any projection it omits the owner
+COMPACT_FIELDS = (
+    "id", "title", "property_type", "status", "city", "district", "price",
+    "currency", "bedrooms", "bathrooms", "rating_average", "rating_count",
+    "created_at", "distance_km",
+)
+
+# Fields a projection may select
+PROJECTABLE_FIELDS = {
+    **{name: field.annotation for name, field in PropertyInDBBase.model_fields.items()},
+    "distance_km": Optional[float],
+}
+
+@lru_cache(maxsize=128)
+def projection_list(fields: Tuple[str, ...]) -> TypeAdapter:
+    """
+    Serializer for lists of projected rows (dicts) with the given fields.
+    """
+    row = TypedDict("PropertyFields", {name: PROJECTABLE_FIELDS[name] for name in fields})
+    return TypeAdapter(List[row])
 
 class PropertySearchParams(BaseModel):
+    q: Optional[str] = None
     property_type: Optional[PropertyType] = None
     min_price: Optional[float] = None
     max_price: Optional[float] = None
@@ -72,6 +115,64 @@ class PropertySearchParams(BaseModel):
     is_furnished: Optional[bool] = None
     has_parking: Optional[bool] = None
     has_security: Optional[bool] = None
+    min_rating: Optional[float] = None
     radius: Optional[float] = None  # in kilometers
     latitude: Optional[float] = None
-    longitude: Optional[float] = None 
\ No newline at end of file
+    longitude: Optional[float] = None
+
+class FacetCount(BaseModel):
+    value: Optional[Union[PropertyType, str, int]] = None
+    count: int
+
+class PriceBucket(BaseModel):
+    min: Optional[float] = None  # inclusive
+    max: Optional[float] = None  # exclusive
+    count: int
+
+class PropertyFacets(BaseModel):
+    total: int
+    property_type: List[FacetCount]
+    city: List[FacetCount]
+    district: List[FacetCount]
+    bedrooms: List[FacetCount]
+    price: List[PriceBucket]
+    # Number of matching properties with each amenity
+    is_furnished: int
+    has_parking: int
+    has_security: int
+
+class MapCluster(BaseModel):
+    count: int
+    # Centroid of the properties in the cluster
+    latitude: float
+    longitude: float
+    min_price: float
+    max_price: float
+
+class MapPoint(BaseModel):
+    id: int
+    latitude: float
+    longitude: float
+    price: float
+
+class PropertyClusters(BaseModel):
+    zoom: int
+    total: int  # properties in the clusters and points
+    clusters: List[MapCluster]
+    # Properties alone in their cell, or every property beyond CLUSTER_MAX_ZOOM
+    points: List[MapPoint]
+
+class PropertyImportFormat(str, enum.Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+class PropertyImportError(BaseModel):
+    line: int  # where the record starts; the CSV header is line 1
+    error: str
+
+class PropertyImportSummary(BaseModel):
+    rows: int
+    imported: int
+    failed: int
+    # The first IMPORT_MAX_ERRORS failures
+    errors: List[PropertyImportError]
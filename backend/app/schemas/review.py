@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime
+import enum
 
 class ReviewBase(BaseModel):
     rating: float = Field(..., ge=1, le=5)
@@ -22,4 +23,9 @@ class Review(ReviewBase):
     updated_at: Optional[datetime] = None
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+class ReviewSort(str, enum.Enum):
+    NEWEST = "newest"
+    HIGHEST = "highest"
+    LOWEST = "lowest"
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import AliasChoices, BaseModel, EmailStr, Field
+from typing import Dict, Optional
 from datetime import datetime
 from ..models.user import UserRole
 
@@ -7,7 +7,8 @@ class UserBase(BaseModel):
     email: EmailStr
     full_name: str
     phone_number: str
-    user_type: str
+    # Stored as User.role on the model
+    user_type: str = Field(validation_alias=AliasChoices("user_type", "role"))
 
 class UserCreate(UserBase):
     password: str
@@ -18,7 +19,13 @@ class UserUpdate(BaseModel):
     profile_picture: Optional[str] = None
     bio: Optional[str] = None
 
+# Emails are validated on the way in (UserCreate); validating the stored
+# ones again on every response, such as each listing's owner, dominated the
+# cost of serializing listings
+StoredEmail = Field(json_schema_extra={"format": "email"})
+
 class UserProfile(UserBase):
+    email: str = StoredEmail
     id: int
     profile_picture: Optional[str] = None
     bio: Optional[str] = None
@@ -30,6 +37,7 @@ class UserProfile(UserBase):
         from_attributes = True
 
 class UserInDBBase(UserBase):
+    email: str = StoredEmail
     id: int
     is_active: bool
     is_verified: bool
@@ -45,9 +53,41 @@ class User(UserInDBBase):
 class UserInDB(UserInDBBase):
     hashed_password: str
 
+class CurrentUser(BaseModel):
+    """
+    Snapshot of the authenticated user, cached between requests. Load the
+    User row to change it.
+    """
+    id: int
+    email: str
+    full_name: Optional[str] = None
+    phone_number: Optional[str] = None
+    profile_picture: Optional[str] = None
+    bio: Optional[str] = None
+    role: Optional[str] = None
+    is_active: bool
+    is_verified: bool
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+        frozen = True
+
 class Token(BaseModel):
     access_token: str
     token_type: str
 
 class TokenData(BaseModel):
-    email: Optional[str] = None 
\ No newline at end of file
+    email: Optional[str] = None 
+
+class ImageVariants(BaseModel):
+    webp: str
+    jpeg: str
+
+class ProfilePictureUpload(BaseModel):
+    message: str
+    # URL of the largest WebP variant, stored as the profile picture
+    file_path: str
+    # Variant URLs by size in pixels
+    variants: Dict[int, ImageVariants]
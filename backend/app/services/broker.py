@@ -0,0 +1,301 @@
+"""
+Pub/sub broker for pushing real-time events to users' WebSocket connections.
+
+LocalBroker fans events out to subscriptions in this process. RelayBroker
+publishes through a Relay so that every worker sharing the relay delivers
+the event to its own local subscribers; a Redis (or Postgres LISTEN/NOTIFY)
+relay only needs to implement Relay.send and Relay.listen. PostgresRelay
+relays through PostgreSQL LISTEN/NOTIFY on the application database.
+InMemoryRelay is a stand-in that lets several brokers in one process behave
+like workers.
+
+MESSAGE_BROKER selects the backend: "local" for a single worker, or
+"postgres" for several workers sharing MESSAGE_BROKER_URL (by default
+DATABASE_URL).
+"""
+import asyncio
+import itertools
+import json
+import os
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, List, Optional, Set
+from sqlalchemy.engine import make_url
+from ..database import SQLALCHEMY_DATABASE_URL
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+MESSAGE_BROKER = os.getenv("MESSAGE_BROKER", "local")
+MESSAGE_BROKER_URL = os.getenv("MESSAGE_BROKER_URL", SQLALCHEMY_DATABASE_URL)
+MESSAGE_BROKER_CHANNEL = os.getenv("MESSAGE_BROKER_CHANNEL", "tenantconnect_events")
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more; longer messages
+# are sent in parts of at most this size, headers included
+NOTIFY_MAX_BYTES = 7900
+# Messages whose parts are still arriving, per listener
+NOTIFY_PENDING_MESSAGES = 1000
+RELAY_RECONNECT_SECONDS = 1.0
+
+# Events that are only useful while fresh and may be dropped for slow consumers
+EPHEMERAL_EVENTS = {"typing"}
+
+SUBSCRIPTION_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "100"))
+
+class Subscription:
+    """
+    A bounded queue of events for one connection. When a slow consumer lets
+    the queue fill up, ephemeral events are dropped and any other event marks
+    the subscription as overflowed so the connection can be closed; the
+    client then reconnects and fetches what it missed over HTTP.
+    """
+
+    def __init__(self, user_id: int, maxsize: int = SUBSCRIPTION_QUEUE_SIZE):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = asyncio.Event()
+        self.dropped = 0
+
+    def offer(self, event: Dict[str, Any]) -> None:
+        if self.overflowed.is_set():
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if event.get("type") not in EPHEMERAL_EVENTS:
+                self.overflowed.set()
+
+    async def get(self) -> Dict[str, Any]:
+        return await self.queue.get()
+
+class Broker(ABC):
+    @abstractmethod
+    async def publish(self, user_id: int, event: Dict[str, Any]) -> None:
+        pass
+
+    @abstractmethod
+    def subscribe(self, user_id: int) -> Subscription:
+        pass
+
+    @abstractmethod
+    def unsubscribe(self, subscription: Subscription) -> None:
+        pass
+
+    async def publish_many(self, user_ids: List[int], event: Dict[str, Any]) -> None:
+        for user_id in set(user_ids):
+            await self.publish(user_id, event)
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+class LocalBroker(Broker):
+    """
+    In-process broker with per-user fan-out to every connection of that user.
+    """
+
+    def __init__(self):
+        self._subscriptions: Dict[int, Set[Subscription]] = defaultdict(set)
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(user_id)
+        self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscriptions[subscription.user_id]
+
+    def connection_count(self, user_id: Optional[int] = None) -> int:
+        if user_id is not None:
+            return len(self._subscriptions.get(user_id, ()))
+        return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def deliver(self, user_id: int, event: Dict[str, Any]) -> None:
+        for subscription in list(self._subscriptions.get(user_id, ())):
+            subscription.offer(event)
+
+    async def publish(self, user_id: int, event: Dict[str, Any]) -> None:
+        self.deliver(user_id, event)
+
+class Relay(ABC):
+    """
+    Transport shared by the brokers of all workers.
+    """
+
+    @abstractmethod
+    async def send(self, message: str) -> None:
+        pass
+
+    @abstractmethod
+    async def listen(self, deliver: Callable[[str], None]) -> None:
+        """
+        Call deliver for every message sent through the relay, until cancelled.
+        """
+
+    async def close(self) -> None:
+        pass
+
+class InMemoryRelay(Relay):
+    def __init__(self):
+        self._listeners: List[asyncio.Queue] = []
+
+    async def send(self, message: str) -> None:
+        for listener in self._listeners:
+            listener.put_nowait(message)
+
+    async def listen(self, deliver: Callable[[str], None]) -> None:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._listeners.append(queue)
+        try:
+            while True:
+                deliver(await queue.get())
+        finally:
+            self._listeners.remove(queue)
+
+def split_message(message: str, key: str, max_bytes: int = NOTIFY_MAX_BYTES) -> List[str]:
+    """
+    A message as NOTIFY payloads of at most max_bytes, each prefixed with
+    "key:index:count:". `key` must be unique per message and sender.
+    """
+    # Leave room for the header; non-ASCII characters take up to 4 bytes
+    size = max_bytes - len(key) - 24
+    if not message.isascii():
+        size //= 4
+    chunks = [message[start:start + size] for start in range(0, len(message), size)] or [""]
+    return [f"{key}:{index}:{len(chunks)}:{chunk}" for index, chunk in enumerate(chunks)]
+
+def join_message(pending: "OrderedDict[str, List[str]]", payload: str) -> Optional[str]:
+    """
+    Add a payload from split_message to the parts received so far, returning
+    the message once its last part is in. One sender's parts arrive in order.
+    """
+    origin, sequence, index, count, chunk = payload.split(":", 4)
+    key = f"{origin}:{sequence}"
+    if count == "1":
+        return chunk
+    parts = pending.setdefault(key, [])
+    if len(parts) != int(index):
+        # A part went missing (say, the listener reconnected); drop the message
+        del pending[key]
+        return None
+    parts.append(chunk)
+    if len(parts) < int(count):
+        while len(pending) > NOTIFY_PENDING_MESSAGES:
+            pending.popitem(last=False)
+        return None
+    del pending[key]
+    return "".join(parts)
+
+def _asyncpg_dsn(url: str) -> str:
+    return make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+class PostgresRelay(Relay):
+    """
+    Relay over PostgreSQL LISTEN/NOTIFY, for workers sharing a database.
+    Each worker sends on one connection, so its messages (and the parts of
+    a long one) arrive in order, and listens on another.
+    """
+
+    def __init__(self, url: str = MESSAGE_BROKER_URL, channel: str = MESSAGE_BROKER_CHANNEL):
+        if asyncpg is None:
+            raise RuntimeError("The postgres message broker requires asyncpg")
+        self.dsn = _asyncpg_dsn(url)
+        self.channel = channel
+        self._origin = uuid.uuid4().hex
+        self._sequence = itertools.count()
+        self._sender = None
+        self._lock = asyncio.Lock()
+
+    async def send(self, message: str) -> None:
+        payloads = split_message(message, f"{self._origin}:{next(self._sequence)}")
+        async with self._lock:
+            if self._sender is None or self._sender.is_closed():
+                self._sender = await asyncpg.connect(self.dsn)
+            for payload in payloads:
+                await self._sender.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+
+    async def listen(self, deliver: Callable[[str], None]) -> None:
+        pending: "OrderedDict[str, List[str]]" = OrderedDict()
+
+        def notified(connection, pid, channel, payload) -> None:
+            message = join_message(pending, payload)
+            if message is not None:
+                deliver(message)
+
+        while True:
+            connection = await asyncpg.connect(self.dsn)
+            lost = asyncio.get_running_loop().create_future()
+            connection.add_termination_listener(lambda connection: lost.done() or lost.set_result(None))
+            try:
+                await connection.add_listener(self.channel, notified)
+                # Notifications arrive through the callback until cancelled
+                # or the connection is lost
+                await lost
+            finally:
+                await connection.close()
+            # Reconnect; events sent in the meantime are missed
+            pending.clear()
+            await asyncio.sleep(RELAY_RECONNECT_SECONDS)
+
+    async def close(self) -> None:
+        async with self._lock:
+            if self._sender is not None:
+                await self._sender.close()
+                self._sender = None
+
+class RelayBroker(LocalBroker):
+    """
+    Broker for multiple workers: publishes go through the relay, and a
+    background task delivers relayed events to this worker's subscribers.
+    """
+
+    def __init__(self, relay: Relay):
+        super().__init__()
+        self.relay = relay
+        self._listener: Optional[asyncio.Task] = None
+
+    async def publish(self, user_id: int, event: Dict[str, Any]) -> None:
+        await self.relay.send(json.dumps({"user_id": user_id, "event": event}, default=str))
+
+    def _deliver_relayed(self, message: str) -> None:
+        payload = json.loads(message)
+        self.deliver(payload["user_id"], payload["event"])
+
+    async def start(self) -> None:
+        if self._listener is None:
+            self._listener = asyncio.create_task(self.relay.listen(self._deliver_relayed))
+            # Let the listener register with the relay before anything is published
+            await asyncio.sleep(0)
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        await self.relay.close()
+
+_broker: Optional[Broker] = None
+
+def get_broker() -> Broker:
+    global _broker
+    if _broker is None:
+        if MESSAGE_BROKER == "local":
+            _broker = LocalBroker()
+        elif MESSAGE_BROKER == "postgres":
+            _broker = RelayBroker(PostgresRelay())
+        else:
+            raise ValueError(f"Unknown MESSAGE_BROKER backend: {MESSAGE_BROKER}")
+    return _broker
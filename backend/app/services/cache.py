@@ -0,0 +1,203 @@
+"""
+Cache for the results of frequent read queries, such as anonymous property
+listings.
+
+Entries are invalidated through version tags. Each entry records the
+version of each of its tags, read before its value was computed, and
+invalidating a tag bumps that tag's version so every older entry misses.
+Writes therefore never have to know which cached queries they affect, and
+a write racing with a read can only make the new entry stale, never hide
+the write.
+
+The backend is pluggable: MemoryCacheBackend is a per-process LRU with a
+TTL, so with several workers each caches on its own and only sees its own
+invalidations (a write in one worker can be served stale by another for up
+to CACHE_TTL seconds). A shared store such as Redis only needs to implement
+CacheBackend.
+"""
+import hashlib
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_TTL = float(os.getenv("CACHE_TTL", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+
+# Tags bumped by writes to the tables cached results are built from
+PROPERTIES_TAG = "properties"
+USERS_TAG = "users"
+
+class CacheBackend(ABC):
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        pass
+
+    @abstractmethod
+    async def get_versions(self, tags: Sequence[str]) -> List[int]:
+        pass
+
+    @abstractmethod
+    async def bump_versions(self, tags: Sequence[str]) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    In-process LRU cache with per-entry expiry.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_versions(self, tags: Sequence[str]) -> List[int]:
+        return [self._versions.get(tag, 0) for tag in tags]
+
+    async def bump_versions(self, tags: Sequence[str]) -> None:
+        for tag in tags:
+            self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+class NullCacheBackend(CacheBackend):
+    """
+    Stores nothing, for turning caching off.
+    """
+
+    async def get(self, key: str) -> Optional[Any]:
+        return None
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        pass
+
+    async def get_versions(self, tags: Sequence[str]) -> List[int]:
+        return [0 for _ in tags]
+
+    async def bump_versions(self, tags: Sequence[str]) -> None:
+        pass
+
+class QueryCache:
+    """
+    Tag-versioned cache on top of a backend, with hit/miss statistics.
+
+    Read the tag versions before computing a value and store the value
+    with them:
+
+        value = await cache.get(key)
+        if value is None:
+            versions = await cache.versions(tags)
+            value = await compute()
+            await cache.set(key, value, tags, versions)
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float = CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.invalidations = 0
+        # When this process last invalidated each tag
+        self._invalidated_at: Dict[str, float] = {}
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = await self.backend.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, tags, versions = entry
+        if await self.backend.get_versions(tags) != versions:
+            self.misses += 1
+            self.stale += 1
+            return None
+        self.hits += 1
+        return value
+
+    async def versions(self, tags: Sequence[str]) -> List[int]:
+        return await self.backend.get_versions(tags)
+
+    async def set(self, key: str, value: Any, tags: Sequence[str], versions: List[int]) -> None:
+        await self.backend.set(key, (value, list(tags), versions), self.ttl)
+
+    async def invalidate(self, *tags: str) -> None:
+        self.invalidations += 1
+        now = time.monotonic()
+        for tag in tags:
+            self._invalidated_at[tag] = now
+        await self.backend.bump_versions(tags)
+
+    def invalidated_within(self, tags: Sequence[str], seconds: float) -> bool:
+        """
+        Whether this process invalidated any of the tags in the last
+        `seconds`, say while a replica may still lag behind the write.
+        """
+        since = time.monotonic() - seconds
+        return any(self._invalidated_at.get(tag, since) > since for tag in tags)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "ttl": self.ttl,
+            **self.backend.stats(),
+        }
+
+def make_key(namespace: str, parts: Dict[str, Any]) -> str:
+    encoded = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return f"{namespace}:{hashlib.sha256(encoded.encode()).hexdigest()}"
+
+_query_cache: Optional[QueryCache] = None
+
+def get_query_cache() -> QueryCache:
+    global _query_cache
+    if _query_cache is None:
+        if CACHE_BACKEND == "memory":
+            _query_cache = QueryCache(MemoryCacheBackend())
+        elif CACHE_BACKEND == "none":
+            _query_cache = QueryCache(NullCacheBackend())
+        else:
+            raise ValueError(f"Unknown CACHE_BACKEND: {CACHE_BACKEND}")
+    return _query_cache
@@ -0,0 +1,419 @@
+"""
+Map clusters of property locations, for GET /properties/clusters.
+
+ClusterIndex buckets property coordinates into square cells of the Web
+Mercator map at every zoom level from 0 to CLUSTER_MAX_ZOOM. A cell is
+CLUSTER_CELL_PIXELS wide on screen at its zoom level and splits into four
+cells at the next, so the levels form a quadtree. Each cell keeps the
+number of properties in it, the sums of their coordinates (for the
+centroid) and their price range, updated incrementally as properties are
+added, moved and removed, so a map view without filters is answered from
+the cells it overlaps without touching the database. Beyond
+CLUSTER_MAX_ZOOM, views show individual properties.
+
+Filtered views can't use the stored totals: the ids of the matching
+properties inside the view come from the database (and from the geo and
+text indexes, as for listings) and are grouped by the same cells.
+
+The index is used with every database. Like the geo grid index it is
+loaded on first use and kept in sync by the property service, so with
+several workers each one only sees its own writes; set
+CLUSTER_INDEX_MAX_AGE (in seconds) to reload it that often.
+"""
+import asyncio
+import math
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.property import Property
+
+# Beyond this zoom level views return individual properties
+CLUSTER_MAX_ZOOM = int(os.getenv("CLUSTER_MAX_ZOOM", "16"))
+# On-screen width of a cluster cell; a power of two up to the tile size
+CLUSTER_CELL_PIXELS = int(os.getenv("CLUSTER_CELL_PIXELS", "64"))
+# 0 to never reload the index
+CLUSTER_INDEX_MAX_AGE = float(os.getenv("CLUSTER_INDEX_MAX_AGE", "0"))
+# Most cells a view may span at its zoom level; a 4K screen spans about
+# 2000 cells of 64 pixels
+MAX_CLUSTER_CELLS = int(os.getenv("MAX_CLUSTER_CELLS", "4096"))
+
+MAX_MAP_ZOOM = 22
+TILE_PIXELS = 256
+# Cells per tile side, as a power of two
+CELL_BITS = (TILE_PIXELS // CLUSTER_CELL_PIXELS).bit_length() - 1
+# The Web Mercator projection stops here
+MAX_LATITUDE = 85.05112878
+
+# West, south, east and north edges in degrees; west > east when the view
+# crosses the antimeridian
+BoundingBox = Tuple[float, float, float, float]
+CellKey = Tuple[int, int]
+T = TypeVar("T")
+
+def mercator(latitude: float, longitude: float) -> Tuple[float, float]:
+    """
+    A location's position on the Web Mercator map, from (0, 0) at the
+    north-west corner to (1, 1) at the south-east.
+    """
+    latitude = max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude))
+    sin = math.sin(math.radians(latitude))
+    return (longitude + 180.0) / 360.0, 0.5 - math.log((1 + sin) / (1 - sin)) / (4 * math.pi)
+
+def _latitude(y: float) -> float:
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+
+def _scale(value: float, bits: int) -> int:
+    size = 1 << bits
+    return min(size - 1, max(0, int(value * size)))
+
+def _inside(bbox: BoundingBox, latitude: float, longitude: float) -> bool:
+    west, south, east, north = bbox
+    if not south <= latitude <= north:
+        return False
+    if west <= east:
+        return west <= longitude <= east
+    return longitude >= west or longitude <= east
+
+class Cell:
+    # Many thousands of these are kept, one per occupied cell and zoom level
+    __slots__ = ("count", "latitude_sum", "longitude_sum", "min_price", "max_price")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.latitude_sum = 0.0
+        self.longitude_sum = 0.0
+        self.min_price = math.inf
+        self.max_price = -math.inf
+
+    def add(self, latitude: float, longitude: float, price: float) -> None:
+        self.count += 1
+        self.latitude_sum += latitude
+        self.longitude_sum += longitude
+        if price < self.min_price:
+            self.min_price = price
+        if price > self.max_price:
+            self.max_price = price
+
+    def merge(self, other: "Cell") -> None:
+        self.count += other.count
+        self.latitude_sum += other.latitude_sum
+        self.longitude_sum += other.longitude_sum
+        if other.min_price < self.min_price:
+            self.min_price = other.min_price
+        if other.max_price > self.max_price:
+            self.max_price = other.max_price
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "latitude": self.latitude_sum / self.count,
+            "longitude": self.longitude_sum / self.count,
+            "min_price": self.min_price,
+            "max_price": self.max_price,
+        }
+
+class ClusterIndex:
+    """
+    Per-zoom-level cell totals of property locations and prices.
+    """
+
+    def __init__(self, max_zoom: int = CLUSTER_MAX_ZOOM, cell_bits: int = CELL_BITS):
+        self.max_zoom = max_zoom
+        self.cell_bits = cell_bits
+        self.loaded = False
+        self.loaded_at = 0.0
+        # Cells by (column, row), one dict per zoom level
+        self._levels: List[Dict[CellKey, Cell]] = [{} for _ in range(max_zoom + 1)]
+        # The ids in each cell of the deepest level
+        self._ids: Dict[CellKey, Set[int]] = {}
+        # id: (column, row) at the deepest level, latitude, longitude, price
+        self._points: Dict[int, Tuple[int, int, float, float, float]] = {}
+        self._touched: Optional[Set[int]] = None
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def upsert(
+        self,
+        point_id: int,
+        latitude: Optional[float],
+        longitude: Optional[float],
+        price: float
+    ) -> None:
+        if latitude is None or longitude is None:
+            self.remove(point_id)
+            return
+        x, y = mercator(latitude, longitude)
+        bits = self.max_zoom + self.cell_bits
+        point = (_scale(x, bits), _scale(y, bits), latitude, longitude, price)
+        if self._points.get(point_id) == point:
+            # Reloads see every property again, mostly unchanged
+            if self._touched is not None:
+                self._touched.add(point_id)
+            return
+        self.remove(point_id)
+        column, row = point[:2]
+        self._points[point_id] = point
+        self._ids.setdefault((column, row), set()).add(point_id)
+        for zoom, cells in enumerate(self._levels):
+            shift = self.max_zoom - zoom
+            key = (column >> shift, row >> shift)
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = Cell()
+            cell.add(latitude, longitude, price)
+
+    def remove(self, point_id: int) -> None:
+        if self._touched is not None:
+            self._touched.add(point_id)
+        point = self._points.pop(point_id, None)
+        if point is None:
+            return
+        column, row, latitude, longitude, price = point
+        ids = self._ids[(column, row)]
+        ids.discard(point_id)
+        if not ids:
+            del self._ids[(column, row)]
+        # Deepest level first, so that a price range can be recomputed from
+        # the (already updated) ranges of the cell's children
+        for zoom in range(self.max_zoom, -1, -1):
+            shift = self.max_zoom - zoom
+            key = (column >> shift, row >> shift)
+            cells = self._levels[zoom]
+            cell = cells[key]
+            cell.count -= 1
+            if not cell.count:
+                del cells[key]
+                continue
+            cell.latitude_sum -= latitude
+            cell.longitude_sum -= longitude
+            if price <= cell.min_price or price >= cell.max_price:
+                ranges = list(self._price_ranges(zoom, key))
+                cell.min_price = min(low for low, _ in ranges)
+                cell.max_price = max(high for _, high in ranges)
+
+    def _price_ranges(self, zoom: int, key: CellKey) -> Iterator[Tuple[float, float]]:
+        if zoom == self.max_zoom:
+            for point_id in self._ids[key]:
+                price = self._points[point_id][4]
+                yield price, price
+            return
+        column, row = key
+        children = self._levels[zoom + 1]
+        for child_key in self._children(column, row):
+            child = children.get(child_key)
+            if child is not None:
+                yield child.min_price, child.max_price
+
+    @staticmethod
+    def _children(column: int, row: int) -> Tuple[CellKey, ...]:
+        return tuple(
+            (2 * column + dx, 2 * row + dy) for dy in (0, 1) for dx in (0, 1)
+        )
+
+    def begin_load(self) -> None:
+        # Changes made while the snapshot is read take precedence over it
+        self._touched = set()
+
+    def finish_load(self, rows: Iterable[Tuple[int, float, float, float]]) -> None:
+        touched = self._touched or set()
+        self._touched = None
+        rows = [row for row in rows if row[0] not in touched]
+        if not self._points:
+            self._build(rows)
+        else:
+            seen = set()
+            for point_id, latitude, longitude, price in rows:
+                seen.add(point_id)
+                self.upsert(point_id, latitude, longitude, price)
+            # On a reload, drop what other processes deleted
+            for point_id in [p for p in self._points if p not in seen and p not in touched]:
+                self.remove(point_id)
+        self.loaded = True
+        self.loaded_at = time.monotonic()
+
+    def _build(self, rows: Iterable[Tuple[int, float, float, float]]) -> None:
+        # Fill the deepest level, then each level from the one below, rather
+        # than adding every point to every level
+        bits = self.max_zoom + self.cell_bits
+        deepest = self._levels[self.max_zoom]
+        for point_id, latitude, longitude, price in rows:
+            if latitude is None or longitude is None:
+                continue
+            x, y = mercator(latitude, longitude)
+            key = (_scale(x, bits), _scale(y, bits))
+            self._points[point_id] = (*key, latitude, longitude, price)
+            self._ids.setdefault(key, set()).add(point_id)
+            cell = deepest.get(key)
+            if cell is None:
+                cell = deepest[key] = Cell()
+            cell.add(latitude, longitude, price)
+        for zoom in range(self.max_zoom - 1, -1, -1):
+            cells = self._levels[zoom]
+            for (column, row), child in self._levels[zoom + 1].items():
+                key = (column >> 1, row >> 1)
+                cell = cells.get(key)
+                if cell is None:
+                    cell = cells[key] = Cell()
+                cell.merge(child)
+
+    def _cell_ranges(self, bbox: BoundingBox, zoom: int) -> Tuple[List[Tuple[int, int]], int, int]:
+        """
+        The column ranges and first and last rows of the cells at a zoom
+        level that overlap a view.
+        """
+        west, south, east, north = bbox
+        bits = zoom + self.cell_bits
+        west_x, north_y = mercator(north, west)
+        east_x, south_y = mercator(south, east)
+        first, last = _scale(west_x, bits), _scale(east_x, bits)
+        if west <= east:
+            columns = [(first, last)]
+        else:
+            columns = [(first, (1 << bits) - 1), (0, last)]
+        return columns, _scale(north_y, bits), _scale(south_y, bits)
+
+    def cells_in_view(self, bbox: BoundingBox, zoom: int) -> int:
+        columns, top, bottom = self._cell_ranges(bbox, zoom)
+        return sum(last - first + 1 for first, last in columns) * (bottom - top + 1)
+
+    def view_bounds(self, bbox: BoundingBox, zoom: int) -> BoundingBox:
+        """
+        The area whose properties make up a view's clusters: the view
+        widened to the edges of the cells it overlaps, which are shown
+        whole. Beyond max_zoom, the view itself.
+        """
+        if zoom > self.max_zoom:
+            return bbox
+        columns, top, bottom = self._cell_ranges(bbox, zoom)
+        size = 1 << (zoom + self.cell_bits)
+        west = columns[0][0] / size * 360.0 - 180.0
+        east = (columns[-1][1] + 1) / size * 360.0 - 180.0
+        north = 90.0 if top == 0 else _latitude(top / size)
+        south = -90.0 if bottom == size - 1 else _latitude((bottom + 1) / size)
+        return west, south, east, north
+
+    def _overlapping(
+        self,
+        cells: Dict[CellKey, T],
+        bbox: BoundingBox,
+        zoom: int
+    ) -> Iterator[Tuple[CellKey, T]]:
+        columns, top, bottom = self._cell_ranges(bbox, zoom)
+        span = sum(last - first + 1 for first, last in columns) * (bottom - top + 1)
+        if span > len(cells):
+            # Scanning the occupied cells is cheaper
+            for key, cell in cells.items():
+                if top <= key[1] <= bottom and any(first <= key[0] <= last for first, last in columns):
+                    yield key, cell
+            return
+        for first, last in columns:
+            for column in range(first, last + 1):
+                for row in range(top, bottom + 1):
+                    cell = cells.get((column, row))
+                    if cell is not None:
+                        yield (column, row), cell
+
+    def _only_id(self, zoom: int, key: CellKey) -> int:
+        # Follow the single occupied child down to the deepest level
+        column, row = key
+        for level in self._levels[zoom + 1:]:
+            column, row = next(child for child in self._children(column, row) if child in level)
+        return next(iter(self._ids[(column, row)]))
+
+    def _point(self, point_id: int) -> Dict[str, Any]:
+        _, _, latitude, longitude, price = self._points[point_id]
+        return {"id": point_id, "latitude": latitude, "longitude": longitude, "price": price}
+
+    def view(self, bbox: BoundingBox, zoom: int, ids: Optional[Iterable[int]] = None) -> Dict[str, Any]:
+        """
+        The clusters and single properties of a map view at a zoom level,
+        from the stored cell totals, or of just the given ids (which should
+        lie within view_bounds) grouped by the same cells.
+        """
+        if zoom > self.max_zoom:
+            if ids is None:
+                ids = [
+                    point_id
+                    for _, cell_ids in self._overlapping(self._ids, bbox, self.max_zoom)
+                    for point_id in cell_ids
+                    if _inside(bbox, *self._points[point_id][2:4])
+                ]
+            points = sorted(point_id for point_id in ids if point_id in self._points)
+            return {
+                "zoom": zoom,
+                "total": len(points),
+                "clusters": [],
+                "points": [self._point(point_id) for point_id in points],
+            }
+
+        if ids is None:
+            cells = list(self._overlapping(self._levels[zoom], bbox, zoom))
+            members = None
+        else:
+            shift = self.max_zoom - zoom
+            grouped: Dict[CellKey, Cell] = {}
+            members = {}
+            for point_id in ids:
+                point = self._points.get(point_id)
+                if point is None:
+                    continue
+                key = (point[0] >> shift, point[1] >> shift)
+                cell = grouped.get(key)
+                if cell is None:
+                    cell = grouped[key] = Cell()
+                cell.add(*point[2:])
+                members[key] = point_id
+            cells = list(grouped.items())
+
+        clusters, points = [], []
+        # North to south, then west to east
+        for key, cell in sorted(cells, key=lambda item: (item[0][1], item[0][0])):
+            if cell.count > 1:
+                clusters.append(cell.summary())
+            else:
+                point_id = members[key] if members is not None else self._only_id(zoom, key)
+                points.append(self._point(point_id))
+        return {
+            "zoom": zoom,
+            "total": sum(cell.count for _, cell in cells),
+            "clusters": clusters,
+            "points": points,
+        }
+
+cluster_index = ClusterIndex()
+
+# As for the radius search grid: one load at a time
+_cluster_index_load_lock = asyncio.Lock()
+
+def _needs_load() -> bool:
+    stale = CLUSTER_INDEX_MAX_AGE and time.monotonic() - cluster_index.loaded_at > CLUSTER_INDEX_MAX_AGE
+    return not cluster_index.loaded or bool(stale)
+
+async def ensure_cluster_index_loaded(db: AsyncSession) -> ClusterIndex:
+    if not _needs_load():
+        return cluster_index
+    if cluster_index.loaded and _cluster_index_load_lock.locked():
+        # Serve the stale index while another request reloads it
+        return cluster_index
+    async with _cluster_index_load_lock:
+        if _needs_load():
+            cluster_index.begin_load()
+            result = await db.execute(
+                select(Property.id, Property.latitude, Property.longitude, Property.price).where(
+                    Property.latitude.is_not(None),
+                    Property.longitude.is_not(None)
+                )
+            )
+            cluster_index.finish_load(result.all())
+    return cluster_index
+
+def index_property(db_property: Property) -> None:
+    cluster_index.upsert(
+        db_property.id, db_property.latitude, db_property.longitude, db_property.price
+    )
+
+def unindex_property(property_id: int) -> None:
+    cluster_index.remove(property_id)
@@ -0,0 +1,123 @@
+"""
+Streaming exports of query results as NDJSON or CSV.
+
+Rows are fetched through a server-side cursor (`AsyncSession.stream` with
+`yield_per`) EXPORT_BATCH_SIZE at a time and encoded batch by batch into a
+StreamingResponse, so memory use stays flat however many rows are exported.
+Each export opens its own session, on the primary unless a session factory
+for the replica is passed, which lives exactly as long as the response body
+is being sent.
+"""
+import csv
+import io
+import os
+import zlib
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Sequence, Tuple, Type
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import Row, Select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from typing_extensions import TypedDict
+from ..database import AsyncSessionLocal
+from ..schemas.export import ExportFormat
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv; charset=utf-8",
+}
+
+def export_fields(model: Type[BaseModel]) -> Tuple[str, ...]:
+    return tuple(model.model_fields)
+
+@lru_cache(maxsize=32)
+def row_adapter(model: Type[BaseModel], fields: Tuple[str, ...]) -> TypeAdapter:
+    """
+    Serializer for rows (as dicts) with the given fields of a schema. Rows
+    are serialized as they are, without building a model for each one.
+    """
+    row = TypedDict(f"{model.__name__}Row", {
+        name: model.model_fields[name].annotation for name in fields
+    })
+    return TypeAdapter(row)
+
+async def _partitions(
+    queries: Sequence[Select],
+    session_factory: async_sessionmaker
+) -> AsyncIterator[Sequence[Row]]:
+    async with session_factory() as db:
+        for query in queries:
+            result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+            async for partition in result.partitions():
+                yield partition
+
+async def _ndjson(
+    partitions: AsyncIterator[Sequence[Row]],
+    adapter: TypeAdapter
+) -> AsyncIterator[bytes]:
+    async for partition in partitions:
+        yield b"".join(adapter.dump_json(row._asdict()) + b"\n" for row in partition)
+
+def _csv_value(value: Any) -> Any:
+    # Booleans as true/false, which the bulk import reads back
+    return str(value).lower() if isinstance(value, bool) else value
+
+async def _csv(
+    partitions: AsyncIterator[Sequence[Row]],
+    adapter: TypeAdapter,
+    fields: Tuple[str, ...]
+) -> AsyncIterator[bytes]:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(fields)
+    async for partition in partitions:
+        for row in partition:
+            values = adapter.dump_python(row._asdict(), mode="json")
+            writer.writerow([_csv_value(values[name]) for name in fields])
+        yield out.getvalue().encode()
+        out.seek(0)
+        out.truncate()
+    if out.tell():
+        yield out.getvalue().encode()
+
+async def _gzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, wbits=31)  # gzip container
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def export_response(
+    queries: Sequence[Select],
+    model: Type[BaseModel],
+    export_format: ExportFormat,
+    gzip: bool,
+    filename: str,
+    session_factory: async_sessionmaker = AsyncSessionLocal
+) -> StreamingResponse:
+    """
+    Stream the rows of `queries`, one after another, as an NDJSON or CSV
+    attachment with the fields of `model`, optionally gzip-encoded. The
+    queries must select columns named after those fields, and run in a
+    session from `session_factory`.
+    """
+    fields = export_fields(model)
+    adapter = row_adapter(model, fields)
+    partitions = _partitions(queries, session_factory)
+    if export_format == ExportFormat.CSV:
+        body = _csv(partitions, adapter, fields)
+    else:
+        body = _ndjson(partitions, adapter)
+
+    headers: Dict[str, str] = {
+        "Content-Disposition": f'attachment; filename="{filename}.{export_format.value}"'
+    }
+    if gzip:
+        body = _gzip(body)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return StreamingResponse(body, media_type=MEDIA_TYPES[export_format], headers=headers)
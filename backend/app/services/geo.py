@@ -0,0 +1,166 @@
+"""
+Radius search over property locations.
+
+On PostgreSQL, searches use the PostGIS `geom` geography column added by
+migration 0002 and its GiST index. Other databases (SQLite in development
+and tests) use GridIndex, an in-memory grid of property coordinates that
+is loaded on first use and kept in sync by the property service on create,
+update and delete. The grid lives in one process, so it is only accurate
+for single-worker deployments.
+"""
+import asyncio
+import math
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import func, literal_column, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.property import Property
+from ..schemas.property import PropertySearchParams
+
+EARTH_RADIUS_KM = 6371.0088
+
+# "postgis" or "memory"; by default PostGIS is used on PostgreSQL
+GEO_BACKEND = os.getenv("GEO_BACKEND")
+
+def use_postgis(db: AsyncSession) -> bool:
+    if GEO_BACKEND:
+        return GEO_BACKEND == "postgis"
+    return db.get_bind().dialect.name == "postgresql"
+
+def is_geo_search(search_params: Optional[PropertySearchParams]) -> bool:
+    return search_params is not None and None not in (
+        search_params.latitude, search_params.longitude, search_params.radius
+    )
+
+# PostGIS expressions. The geom column is maintained by the database and is
+# not mapped on the Property model.
+geom = literal_column("properties.geom")
+
+def postgis_point(latitude: float, longitude: float):
+    return func.geography(func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326))
+
+def postgis_within(latitude: float, longitude: float, radius_km: float):
+    return func.ST_DWithin(geom, postgis_point(latitude, longitude), radius_km * 1000)
+
+def postgis_distance_km(latitude: float, longitude: float):
+    return func.ST_Distance(geom, postgis_point(latitude, longitude)) / 1000
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+class GridIndex:
+    """
+    Points bucketed into fixed-size latitude/longitude cells. A radius query
+    only visits the cells overlapping the circle's bounding box.
+    """
+
+    def __init__(self, cell_degrees: float = 0.05):
+        self.cell_degrees = cell_degrees
+        self.loaded = False
+        self._cells: Dict[Tuple[int, int], Set[int]] = defaultdict(set)
+        self._points: Dict[int, Tuple[float, float]] = {}
+        self._touched: Optional[Set[int]] = None
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return (
+            math.floor(latitude / self.cell_degrees),
+            math.floor(longitude / self.cell_degrees),
+        )
+
+    def upsert(self, point_id: int, latitude: Optional[float], longitude: Optional[float]) -> None:
+        self.remove(point_id)
+        if latitude is None or longitude is None:
+            return
+        self._points[point_id] = (latitude, longitude)
+        self._cells[self._cell(latitude, longitude)].add(point_id)
+
+    def remove(self, point_id: int) -> None:
+        if self._touched is not None:
+            self._touched.add(point_id)
+        point = self._points.pop(point_id, None)
+        if point is None:
+            return
+        cell = self._cell(*point)
+        self._cells[cell].discard(point_id)
+        if not self._cells[cell]:
+            del self._cells[cell]
+
+    def begin_load(self) -> None:
+        # Changes made while the snapshot is read take precedence over it
+        self._touched = set()
+
+    def finish_load(self, rows: Iterable[Tuple[int, float, float]]) -> None:
+        touched = self._touched or set()
+        self._touched = None
+        for point_id, latitude, longitude in rows:
+            if point_id not in touched:
+                self.upsert(point_id, latitude, longitude)
+        self.loaded = True
+
+    def within(self, latitude: float, longitude: float, radius_km: float) -> List[Tuple[int, float]]:
+        """
+        (id, distance in km) of every point within radius_km, nearest first.
+        """
+        lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+        widest = math.cos(math.radians(min(90.0, abs(latitude) + lat_delta)))
+        lon_delta = 360.0 if widest < 1e-9 else lat_delta / widest
+
+        min_cell = self._cell(latitude - lat_delta, longitude - lon_delta)
+        max_cell = self._cell(latitude + lat_delta, longitude + lon_delta)
+        box_cells = (max_cell[0] - min_cell[0] + 1) * (max_cell[1] - min_cell[1] + 1)
+        if lon_delta >= 180.0 or box_cells > len(self._cells):
+            # Scanning the occupied cells is cheaper (and handles the antimeridian)
+            cells = list(self._cells.values())
+        else:
+            cells = [
+                self._cells[(row, col)]
+                for row in range(min_cell[0], max_cell[0] + 1)
+                for col in range(min_cell[1], max_cell[1] + 1)
+                if (row, col) in self._cells
+            ]
+
+        matches = []
+        for cell in cells:
+            for point_id in cell:
+                point_lat, point_lon = self._points[point_id]
+                distance = haversine_km(latitude, longitude, point_lat, point_lon)
+                if distance <= radius_km:
+                    matches.append((point_id, distance))
+        matches.sort(key=lambda match: (match[1], match[0]))
+        return matches
+
+grid_index = GridIndex()
+
+# One cold load at a time: another begin_load() would forget the changes
+# recorded so far, and the snapshot is only worth reading once
+_grid_load_lock = asyncio.Lock()
+
+async def ensure_grid_loaded(db: AsyncSession) -> GridIndex:
+    if not grid_index.loaded:
+        async with _grid_load_lock:
+            if not grid_index.loaded:
+                grid_index.begin_load()
+                result = await db.execute(
+                    select(Property.id, Property.latitude, Property.longitude).where(
+                        Property.latitude.is_not(None),
+                        Property.longitude.is_not(None)
+                    )
+                )
+                grid_index.finish_load(result.all())
+    return grid_index
+
+def index_property(db: AsyncSession, db_property: Property) -> None:
+    if not use_postgis(db):
+        grid_index.upsert(db_property.id, db_property.latitude, db_property.longitude)
+
+def unindex_property(db: AsyncSession, property_id: int) -> None:
+    if not use_postgis(db):
+        grid_index.remove(property_id)
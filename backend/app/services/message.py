@@ -0,0 +1,176 @@
+from typing import List, Optional, Tuple
+from sqlalchemy import Select, and_, case, func, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.message import Message
+from ..models.property import Property
+from ..models.user import User
+from ..schemas.message import Conversation, Message as MessageSchema
+from ..utils.pagination import encode_cursor, decode_cursor
+from .export import export_fields
+
+CONVERSATION_SORT = "latest"
+
+async def get_conversations(
+    db: AsyncSession,
+    user_id: int,
+    limit: int = 50,
+    cursor: Optional[str] = None
+) -> Tuple[List[Conversation], Optional[str]]:
+    """
+    Build the inbox in one query: rank each conversation's messages with a
+    window function, keep the latest one, and count unread messages over
+    the same partition. A conversation is a (counterpart, property) pair.
+    """
+    if limit < 1:
+        return [], cursor or None
+
+    other_user_id = case(
+        (Message.sender_id == user_id, Message.receiver_id),
+        else_=Message.sender_id
+    )
+    unread = case(
+        (and_(Message.receiver_id == user_id, Message.is_read.is_(False)), 1),
+        else_=0
+    )
+    partition = [other_user_id, Message.property_id]
+    ranked = select(
+        Message.id,
+        Message.property_id,
+        Message.content,
+        Message.created_at,
+        other_user_id.label("other_user_id"),
+        func.row_number().over(
+            partition_by=partition,
+            order_by=[Message.created_at.desc(), Message.id.desc()]
+        ).label("position"),
+        func.sum(unread).over(partition_by=partition).label("unread_count"),
+    ).where(
+        or_(Message.sender_id == user_id, Message.receiver_id == user_id)
+    ).subquery()
+
+    query = select(
+        ranked.c.other_user_id.label("user_id"),
+        User.full_name.label("user_name"),
+        ranked.c.content.label("last_message"),
+        ranked.c.created_at.label("last_message_time"),
+        ranked.c.id.label("last_message_id"),
+        ranked.c.unread_count,
+        ranked.c.property_id,
+        Property.title.label("property_title"),
+    ).join(
+        User, User.id == ranked.c.other_user_id
+    ).join(
+        Property, Property.id == ranked.c.property_id
+    ).where(ranked.c.position == 1)
+
+    if cursor:
+        key = decode_cursor(cursor, CONVERSATION_SORT, 2)
+        query = query.where(tuple_(ranked.c.created_at, ranked.c.id) < tuple_(*key))
+
+    result = await db.execute(
+        query.order_by(ranked.c.created_at.desc(), ranked.c.id.desc()).limit(limit + 1)
+    )
+    conversations = [Conversation.model_validate(row._mapping) for row in result]
+    if len(conversations) <= limit:
+        return conversations, None
+
+    conversations = conversations[:limit]
+    last = conversations[-1]
+    next_cursor = encode_cursor(CONVERSATION_SORT, [last.last_message_time, last.last_message_id])
+    return conversations, next_cursor
+
+async def get_thread(
+    db: AsyncSession,
+    user_id: int,
+    other_user_id: int,
+    property_id: int,
+    limit: int = 50,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None
+) -> List[Message]:
+    """
+    One page of the messages between two users about a property, in
+    chronological order. Without after_id, pages walk back from the newest
+    message (pass the oldest id seen as before_id to load older ones); with
+    after_id, only messages newer than it are returned, for polling clients.
+    """
+    query = select(Message).where(
+        or_(
+            and_(Message.sender_id == user_id, Message.receiver_id == other_user_id),
+            and_(Message.sender_id == other_user_id, Message.receiver_id == user_id)
+        ),
+        Message.property_id == property_id
+    )
+    if before_id is not None:
+        query = query.where(Message.id < before_id)
+
+    if after_id is not None:
+        query = query.where(Message.id > after_id).order_by(Message.id.asc())
+        result = await db.execute(query.limit(limit))
+        return list(result.scalars().all())
+
+    result = await db.execute(query.order_by(Message.id.desc()).limit(limit))
+    return list(reversed(result.scalars().all()))
+
+async def has_thread(db: AsyncSession, user_id: int, other_user_id: int, property_id: int) -> bool:
+    """
+    Whether two users have exchanged any message about a property.
+    """
+    query = select(Message.id).where(
+        or_(
+            and_(Message.sender_id == user_id, Message.receiver_id == other_user_id),
+            and_(Message.sender_id == other_user_id, Message.receiver_id == user_id)
+        ),
+        Message.property_id == property_id
+    )
+    result = await db.execute(query.limit(1))
+    return result.first() is not None
+
+async def mark_thread_read(
+    db: AsyncSession,
+    reader_id: int,
+    sender_id: int,
+    property_id: int,
+    up_to_id: int
+) -> int:
+    """
+    Mark every unread message from sender_id to reader_id about the property,
+    up to and including up_to_id, as read in a single UPDATE.
+    """
+    result = await db.execute(
+        update(Message)
+        .where(
+            Message.receiver_id == reader_id,
+            Message.sender_id == sender_id,
+            Message.property_id == property_id,
+            Message.is_read.is_(False),
+            Message.id <= up_to_id
+        )
+        .values(is_read=True)
+        .execution_options(synchronize_session="evaluate")
+    )
+    await db.commit()
+    return result.rowcount
+
+def export_query(
+    user_id: int,
+    property_id: Optional[int] = None,
+    other_user_id: Optional[int] = None
+) -> Select:
+    """
+    A user's sent and received messages in id order, optionally limited
+    to one property and/or one counterpart.
+    """
+    query = select(
+        *(getattr(Message, name) for name in export_fields(MessageSchema))
+    ).where(
+        or_(Message.sender_id == user_id, Message.receiver_id == user_id)
+    ).order_by(Message.id)
+    if property_id is not None:
+        query = query.where(Message.property_id == property_id)
+    if other_user_id is not None:
+        query = query.where(or_(
+            and_(Message.sender_id == user_id, Message.receiver_id == other_user_id),
+            and_(Message.sender_id == other_user_id, Message.receiver_id == user_id)
+        ))
+    return query
@@ -1,125 +1,747 @@
-from typing import List, Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
-from geoalchemy2.shape import from_shape
-from shapely.geometry import Point
-from ..models.property import Property, PropertyType, PropertyStatus
-from ..schemas.property import PropertyCreate, PropertyUpdate, PropertySearchParams
-
-def create_property(db: Session, property_in: PropertyCreate, owner_id: int) -> Property:
+import math
+import os
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy import (
+    ColumnElement,
+    Integer,
+    Select,
+    String,
+    and_,
+    case,
+    cast,
+    delete,
+    func,
+    literal,
+    null,
+    or_,
+    select,
+    tuple_,
+    union_all,
+)
+from ..models.message import Message
+from ..models.property import Property, PropertyStatus
+from ..models.review import Review
+from ..schemas.property import (
+    COMPACT_FIELDS,
+    PROJECTABLE_FIELDS,
+    PropertyClusters,
+    PropertyCreate,
+    PropertyInDBBase,
+    PropertySearchParams,
+    PropertySort,
+    PropertyUpdate,
+    PropertyView,
+)
+from ..utils.pagination import InvalidCursor, encode_cursor, decode_cursor
+from . import clusters, geo, search
+from .cache import PROPERTIES_TAG, get_query_cache, make_key
+from .export import export_fields
+
+# Largest id list sent in one IN (...) by searches using the in-memory indexes
+GRID_ID_CHUNK = 5000
+
+# Default upper bounds (UGX) of the price buckets counted by facet searches
+FACET_PRICE_BUCKETS = tuple(
+    float(bound)
+    for bound in os.getenv("FACET_PRICE_BUCKETS", "250000,500000,1000000,2000000,5000000").split(",")
+)
+MAX_PRICE_BUCKETS = 20
+
+AMENITIES = ("is_furnished", "has_parking", "has_security")
+
+class InvalidSearch(ValueError):
+    pass
+
+# Sort key columns and direction (True = descending) for each sort order.
+# Every key ends with Property.id so the order is total and cursors are stable.
+SORT_KEYS = {
+    PropertySort.NEWEST: ((Property.created_at, Property.id), True),
+    PropertySort.OLDEST: ((Property.created_at, Property.id), False),
+    PropertySort.PRICE_ASC: ((Property.price, Property.id), False),
+    PropertySort.PRICE_DESC: ((Property.price, Property.id), True),
+    # Best rated first, ties broken by the number of reviews
+    PropertySort.RATING: ((Property.rating_average, Property.rating_count, Property.id), True),
+}
+
+def property_query() -> Select:
+    # Owners are embedded in every Property response; load them in bulk
+    # (one extra query per page) since lazy loading is not available on an
+    # AsyncSession.
+    return select(Property).options(selectinload(Property.owner))
+
+def projected_fields(
+    view: PropertyView = PropertyView.FULL,
+    fields: Optional[str] = None
+) -> Optional[Tuple[str, ...]]:
+    """
+    Fields to select for a view or a comma-separated field list, or None
+    for full Property objects with their owners. Fields override the view.
+    """
+    if fields:
+        requested = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in requested if name not in PROJECTABLE_FIELDS]
+        if unknown:
+            raise InvalidSearch(
+                f"Unknown fields: {', '.join(unknown)}; "
+                f"choose from {', '.join(sorted(PROJECTABLE_FIELDS))}"
+            )
+        return tuple(dict.fromkeys(["id", *requested]))
+    if view == PropertyView.COMPACT:
+        return COMPACT_FIELDS
+    return None
+
+def _select(fields: Optional[Sequence[str]]) -> Select:
+    """
+    Select full Property objects, or only the given fields' columns.
+    """
+    if fields is None:
+        return property_query()
+    return select(*[Property.__table__.c[name] for name in fields if name != "distance_km"])
+
+def _item(row: Sequence[Any], fields: Optional[Sequence[str]], distance: Optional[float] = None) -> Any:
+    """
+    A result row as a Property, or as a dict of the selected fields.
+    """
+    if fields is None:
+        item = row[0]
+        if distance is not None:
+            item.distance_km = distance
+        return item
+    item = dict(zip([name for name in fields if name != "distance_km"], row))
+    item["distance_km"] = distance
+    return item
+
+async def _reload(db: AsyncSession, property_id: int) -> Property:
+    result = await db.execute(
+        property_query()
+        .where(Property.id == property_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalar_one()
+
+async def create_property(db: AsyncSession, property_in: PropertyCreate, owner_id: int) -> Property:
     db_property = Property(
         **property_in.model_dump(),
         owner_id=owner_id,
         status=PropertyStatus.AVAILABLE
     )
     db.add(db_property)
-    db.commit()
-    db.refresh(db_property)
-    return db_property
+    await db.commit()
+    geo.index_property(db, db_property)
+    search.index_property(db, db_property)
+    clusters.index_property(db_property)
+    await get_query_cache().invalidate(PROPERTIES_TAG)
+    return await _reload(db, db_property.id)
+
+async def get_property(db: AsyncSession, property_id: int) -> Optional[Property]:
+    # A single row, so join the owner in rather than loading it separately
+    result = await db.execute(
+        select(Property).options(joinedload(Property.owner)).where(Property.id == property_id)
+    )
+    return result.scalar_one_or_none()
+
+def apply_search_filters(
+    query: Select,
+    search_params: Optional[PropertySearchParams],
+    postgis: bool = False,
+    fulltext: bool = False
+) -> Select:
+    if not search_params:
+        return query
+
+    filters = []
+
+    if search_params.property_type:
+        filters.append(Property.property_type == search_params.property_type)
+
+    if search_params.min_price is not None:
+        filters.append(Property.price >= search_params.min_price)
+
+    if search_params.max_price is not None:
+        filters.append(Property.price <= search_params.max_price)
+
+    # Substring matches; on PostgreSQL the trigram indexes from migration
+    # 0003 (gin_trgm_ops on city and district) serve these ILIKE '%...%'
+    # predicates, for patterns of three or more characters
+    if search_params.city:
+        filters.append(Property.city.ilike(f"%{search_params.city}%"))
+
+    if search_params.district:
+        filters.append(Property.district.ilike(f"%{search_params.district}%"))
+
+    if search_params.bedrooms is not None:
+        filters.append(Property.bedrooms == search_params.bedrooms)
+
+    if search_params.bathrooms is not None:
+        filters.append(Property.bathrooms == search_params.bathrooms)
+
+    if search_params.is_furnished is not None:
+        filters.append(Property.is_furnished == search_params.is_furnished)
+
+    if search_params.has_parking is not None:
+        filters.append(Property.has_parking == search_params.has_parking)
+
+    if search_params.has_security is not None:
+        filters.append(Property.has_security == search_params.has_security)
+
+    if search_params.min_rating is not None:
+        filters.append(Property.rating_average >= search_params.min_rating)
+
+    # Geospatial search. Without PostGIS the radius is resolved through the
+    # in-memory grid index by search_properties instead.
+    if postgis and geo.is_geo_search(search_params):
+        filters.append(
+            geo.postgis_within(
+                search_params.latitude,
+                search_params.longitude,
+                search_params.radius
+            )
+        )
+
+    # Keyword search, likewise resolved through the in-memory text index
+    # without PostgreSQL full-text search
+    if fulltext and search.is_text_search(search_params):
+        filters.append(search.postgres_match(search_params.q))
+
+    if filters:
+        query = query.where(and_(*filters))
+    return query
+
+def sort_key(
+    sort: PropertySort,
+    search_params: Optional[PropertySearchParams] = None
+) -> Tuple[Tuple[ColumnElement, ...], bool]:
+    """
+    Sort key columns and direction (True = descending) for a sort order.
+    """
+    if sort == PropertySort.RELEVANCE:
+        if not search.is_text_search(search_params):
+            raise InvalidSearch("Sorting by relevance requires a search query")
+        return (search.postgres_rank(search_params.q), Property.id), True
+    if sort != PropertySort.DISTANCE:
+        return SORT_KEYS[sort]
+    if not geo.is_geo_search(search_params):
+        raise InvalidSearch("Sorting by distance requires latitude, longitude and radius")
+    distance = geo.postgis_distance_km(search_params.latitude, search_params.longitude)
+    return (distance, Property.id), False
+
+def default_sort(search_params: Optional[PropertySearchParams]) -> PropertySort:
+    if search.is_text_search(search_params):
+        return PropertySort.RELEVANCE
+    if geo.is_geo_search(search_params):
+        return PropertySort.DISTANCE
+    return PropertySort.NEWEST
+
+def _cache_params(search_params: Optional[PropertySearchParams]) -> Dict[str, Any]:
+    params = search_params.model_dump(mode="json", exclude_none=True) if search_params else {}
+    for field in ("city", "district"):
+        # Matched case-insensitively, and ignored when empty
+        if params.get(field):
+            params[field] = params[field].lower()
+        else:
+            params.pop(field, None)
+    if "q" in params:
+        terms = search.search_terms(params.pop("q"))
+        if terms:
+            params["q"] = " ".join(terms)
+    return params
+
+def listing_cache_key(
+    search_params: Optional[PropertySearchParams],
+    sort: PropertySort,
+    limit: int,
+    skip: int,
+    cursor: Optional[str],
+    fields: Optional[Sequence[str]] = None
+) -> str:
+    """
+    Cache key for a page of search results. Parameters are normalized so
+    that equivalent searches share an entry.
+    """
+    params = _cache_params(search_params)
+    page = {"limit": limit, "cursor": cursor} if cursor is not None else {"limit": limit, "skip": skip}
+    return make_key(
+        "properties",
+        {"params": params, "sort": sort.value, "fields": fields and list(fields), **page}
+    )
+
+def _seek(key: Sequence[Any], cursor_key: Sequence[Any], descending: bool) -> bool:
+    return tuple(key) < tuple(cursor_key) if descending else tuple(key) > tuple(cursor_key)
+
+async def _search_sql(
+    db: AsyncSession,
+    query: Select,
+    columns: Sequence[ColumnElement],
+    descending: bool,
+    sort: PropertySort,
+    limit: int,
+    skip: int,
+    cursor: Optional[str],
+    distance: Optional[ColumnElement] = None,
+    fields: Optional[Sequence[str]] = None
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Page through query ordered by columns, by OFFSET or by keyset. Keyset
+    pagination seeks past the cursor's sort key instead of using OFFSET, so
+    the cost of a page does not grow with its depth.
+    """
+    width = len(query.column_descriptions)
+    if cursor:
+        key = decode_cursor(cursor, sort.value, len(columns))
+        if descending:
+            query = query.where(tuple_(*columns) < tuple_(*key))
+        else:
+            query = query.where(tuple_(*columns) > tuple_(*key))
+    elif skip:
+        query = query.offset(skip)
+
+    query = query.add_columns(*columns)
+    if distance is not None:
+        query = query.add_columns(distance)
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+
+    # Fetch one extra row to find out whether there is a next page
+    result = await db.execute(query.limit(limit + 1))
+    rows = result.all()
+    properties = [
+        _item(row, fields, row[-1] if distance is not None else None)
+        for row in rows[:limit]
+    ]
+
+    if len(rows) <= limit:
+        return properties, None
+    last_key = rows[limit - 1][width:width + len(columns)]
+    return properties, encode_cursor(sort.value, list(last_key))
+
+def _uses_memory(
+    search_params: Optional[PropertySearchParams],
+    postgis: bool,
+    fulltext: bool
+) -> bool:
+    return (geo.is_geo_search(search_params) and not postgis) or (
+        search.is_text_search(search_params) and not fulltext
+    )
+
+async def _memory_keys(
+    db: AsyncSession,
+    search_params: PropertySearchParams,
+    postgis: bool,
+    fulltext: bool
+) -> Dict[PropertySort, Dict[int, float]]:
+    """
+    Candidates from the in-memory indexes for the parts of the search they
+    resolve: distances by id for radius searches and relevance scores by
+    id for keyword searches.
+    """
+    memory_keys: Dict[PropertySort, Dict[int, float]] = {}
+    if geo.is_geo_search(search_params) and not postgis:
+        grid = await geo.ensure_grid_loaded(db)
+        memory_keys[PropertySort.DISTANCE] = dict(grid.within(
+            search_params.latitude, search_params.longitude, search_params.radius
+        ))
+    if search.is_text_search(search_params) and not fulltext:
+        text_index = await search.ensure_text_index_loaded(db)
+        memory_keys[PropertySort.RELEVANCE] = text_index.search(search_params.q)
+    return memory_keys
+
+async def _search_memory(
+    db: AsyncSession,
+    search_params: PropertySearchParams,
+    sort: PropertySort,
+    limit: int,
+    skip: int,
+    cursor: Optional[str],
+    postgis: bool,
+    fulltext: bool,
+    fields: Optional[Sequence[str]] = None
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Search with the in-memory indexes used without PostGIS or PostgreSQL
+    full-text search: candidates come from the grid and/or text index along
+    with their distances or relevance scores, remaining filters and sort
+    keys from the database.
+    """
+    memory_keys = await _memory_keys(db, search_params, postgis, fulltext)
+    distances = memory_keys.get(PropertySort.DISTANCE, {})
+    candidates = set.intersection(*(set(values) for values in memory_keys.values()))
 
-def get_property(db: Session, property_id: int) -> Optional[Property]:
-    return db.query(Property).filter(Property.id == property_id).first()
+    if sort in memory_keys:
+        sort_values = memory_keys[sort]
+        columns, descending = (), sort == PropertySort.RELEVANCE
+    else:
+        columns, descending = sort_key(sort, search_params)
 
-def get_properties(
-    db: Session,
+    query = apply_search_filters(select(Property.id, *columns), search_params, postgis, fulltext)
+    if query.whereclause is None and not columns:
+        keyed = [((sort_values[property_id], property_id), property_id) for property_id in candidates]
+    else:
+        keyed = []
+        ids = list(candidates)
+        for start in range(0, len(ids), GRID_ID_CHUNK):
+            result = await db.execute(query.where(Property.id.in_(ids[start:start + GRID_ID_CHUNK])))
+            for row in result:
+                key = tuple(row[1:]) if columns else (sort_values[row[0]], row[0])
+                keyed.append((key, row[0]))
+    keyed.sort(key=lambda item: item[0], reverse=descending)
+
+    if cursor:
+        cursor_key = decode_cursor(cursor, sort.value, len(columns) or 2)
+        try:
+            keyed = [item for item in keyed if _seek(item[0], cursor_key, descending)]
+        except TypeError as exc:
+            # Say, a number where the key has a datetime
+            raise InvalidCursor("Malformed cursor") from exc
+    else:
+        keyed = keyed[skip:]
+
+    page = keyed[:limit]
+    page_ids = [property_id for _, property_id in page]
+    result = await db.execute(
+        _select(fields).add_columns(Property.id).where(Property.id.in_(page_ids))
+    )
+    by_id = {row[-1]: row for row in result}
+    properties = [
+        _item(by_id[property_id], fields, distances.get(property_id))
+        for property_id in page_ids
+    ]
+
+    if len(keyed) <= limit:
+        return properties, None
+    return properties, encode_cursor(sort.value, list(page[-1][0]))
+
+async def search_properties(
+    db: AsyncSession,
+    search_params: Optional[PropertySearchParams] = None,
+    sort: PropertySort = PropertySort.NEWEST,
+    limit: int = 100,
+    skip: int = 0,
+    cursor: Optional[str] = None,
+    fields: Optional[Sequence[str]] = None
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    One page of properties matching search_params and the next page's cursor.
+    Radius searches carry each property's distance_km. With fields, items
+    are dicts of just those fields (see projected_fields).
+    """
+    if limit < 1:
+        return [], cursor or None
+    columns, descending = sort_key(sort, search_params)
+    postgis = geo.use_postgis(db)
+    fulltext = search.use_postgres(db)
+    if _uses_memory(search_params, postgis, fulltext):
+        return await _search_memory(
+            db, search_params, sort, limit, skip, cursor, postgis, fulltext, fields
+        )
+
+    distance = None
+    if geo.is_geo_search(search_params):
+        distance = geo.postgis_distance_km(
+            search_params.latitude, search_params.longitude
+        ).label("distance_km")
+    query = apply_search_filters(_select(fields), search_params, postgis, fulltext)
+    return await _search_sql(
+        db, query, columns, descending, sort, limit, skip, cursor, distance, fields
+    )
+
+async def get_properties(
+    db: AsyncSession,
     skip: int = 0,
     limit: int = 100,
-    search_params: Optional[PropertySearchParams] = None
-) -> List[Property]:
-    query = db.query(Property)
-    
-    if search_params:
-        filters = []
-        
-        if search_params.property_type:
-            filters.append(Property.property_type == search_params.property_type)
-        
-        if search_params.min_price is not None:
-            filters.append(Property.price >= search_params.min_price)
-        
-        if search_params.max_price is not None:
-            filters.append(Property.price <= search_params.max_price)
-        
-        if search_params.city:
-            filters.append(Property.city.ilike(f"%{search_params.city}%"))
-        
-        if search_params.district:
-            filters.append(Property.district.ilike(f"%{search_params.district}%"))
-        
-        if search_params.bedrooms is not None:
-            filters.append(Property.bedrooms == search_params.bedrooms)
-        
-        if search_params.bathrooms is not None:
-            filters.append(Property.bathrooms == search_params.bathrooms)
-        
-        if search_params.is_furnished is not None:
-            filters.append(Property.is_furnished == search_params.is_furnished)
-        
-        if search_params.has_parking is not None:
-            filters.append(Property.has_parking == search_params.has_parking)
-        
-        if search_params.has_security is not None:
-            filters.append(Property.has_security == search_params.has_security)
-        
-        # Geospatial search
-        if all([search_params.latitude, search_params.longitude, search_params.radius]):
-            point = Point(search_params.longitude, search_params.latitude)
-            filters.append(
-                Property.geom.ST_DWithin(
-                    from_shape(point, srid=4326),
-                    search_params.radius * 1000  # Convert km to meters
-                )
-            )
-        
-        if filters:
-            query = query.filter(and_(*filters))
-    
-    return query.offset(skip).limit(limit).all()
-
-def update_property(
-    db: Session,
+    search_params: Optional[PropertySearchParams] = None,
+    sort: PropertySort = PropertySort.NEWEST,
+    fields: Optional[Sequence[str]] = None
+) -> List[Any]:
+    properties, _ = await search_properties(db, search_params, sort, limit, skip=skip, fields=fields)
+    return properties
+
+async def get_properties_page(
+    db: AsyncSession,
+    limit: int = 100,
+    search_params: Optional[PropertySearchParams] = None,
+    sort: PropertySort = PropertySort.NEWEST,
+    cursor: Optional[str] = None,
+    fields: Optional[Sequence[str]] = None
+) -> Tuple[List[Any], Optional[str]]:
+    return await search_properties(db, search_params, sort, limit, cursor=cursor, fields=fields)
+
+async def update_property(
+    db: AsyncSession,
     property_id: int,
     property_in: PropertyUpdate,
     owner_id: int
 ) -> Optional[Property]:
-    db_property = db.query(Property).filter(
-        Property.id == property_id,
-        Property.owner_id == owner_id
-    ).first()
-    
+    result = await db.execute(
+        select(Property).where(
+            Property.id == property_id,
+            Property.owner_id == owner_id
+        )
+    )
+    db_property = result.scalar_one_or_none()
+
     if not db_property:
         return None
-    
+
     update_data = property_in.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(db_property, field, value)
-    
+
     db.add(db_property)
-    db.commit()
-    db.refresh(db_property)
-    return db_property
-
-def delete_property(db: Session, property_id: int, owner_id: int) -> bool:
-    db_property = db.query(Property).filter(
-        Property.id == property_id,
-        Property.owner_id == owner_id
-    ).first()
-    
+    await db.commit()
+    geo.index_property(db, db_property)
+    search.index_property(db, db_property)
+    clusters.index_property(db_property)
+    await get_query_cache().invalidate(PROPERTIES_TAG)
+    return await _reload(db, db_property.id)
+
+async def delete_property(db: AsyncSession, property_id: int, owner_id: int) -> bool:
+    result = await db.execute(
+        select(Property).where(
+            Property.id == property_id,
+            Property.owner_id == owner_id
+        )
+    )
+    db_property = result.scalar_one_or_none()
+
     if not db_property:
         return False
-    
-    db.delete(db_property)
-    db.commit()
+
+    # The foreign keys cascade, but SQLite only enforces them when asked to
+    await db.execute(delete(Review).where(Review.property_id == property_id))
+    await db.execute(delete(Message).where(Message.property_id == property_id))
+    await db.delete(db_property)
+    await db.commit()
+    geo.unindex_property(db, property_id)
+    search.unindex_property(db, property_id)
+    clusters.unindex_property(property_id)
+    await get_query_cache().invalidate(PROPERTIES_TAG)
     return True
 
-def get_owner_properties(
-    db: Session,
+async def get_owner_properties(
+    db: AsyncSession,
     owner_id: int,
     skip: int = 0,
-    limit: int = 100
-) -> List[Property]:
-    return db.query(Property)\
-        .filter(Property.owner_id == owner_id)\
-        .offset(skip)\
-        .limit(limit)\
-        .all() 
\ No newline at end of file
+    limit: int = 100,
+    sort: PropertySort = PropertySort.NEWEST,
+    fields: Optional[Sequence[str]] = None
+) -> List[Any]:
+    properties, _ = await get_owner_properties_page(db, owner_id, limit, sort, skip=skip, fields=fields)
+    return properties
+
+async def get_owner_properties_page(
+    db: AsyncSession,
+    owner_id: int,
+    limit: int = 100,
+    sort: PropertySort = PropertySort.NEWEST,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    fields: Optional[Sequence[str]] = None
+) -> Tuple[List[Any], Optional[str]]:
+    if limit < 1:
+        return [], cursor or None
+    columns, descending = sort_key(sort)
+    query = _select(fields).where(Property.owner_id == owner_id)
+    return await _search_sql(db, query, columns, descending, sort, limit, skip, cursor, fields=fields)
+
+def parse_price_buckets(value: Optional[str]) -> Tuple[float, ...]:
+    """
+    Price bucket boundaries from a comma-separated list, or the defaults.
+    """
+    if not value:
+        return FACET_PRICE_BUCKETS
+    try:
+        bounds = tuple(float(bound) for bound in value.split(","))
+    except ValueError:
+        raise InvalidSearch("price_buckets must be a comma-separated list of numbers")
+    if not all(math.isfinite(bound) for bound in bounds):
+        raise InvalidSearch("price_buckets must be finite numbers")
+    if len(bounds) > MAX_PRICE_BUCKETS:
+        raise InvalidSearch(f"At most {MAX_PRICE_BUCKETS} price bucket boundaries are allowed")
+    if any(low >= high for low, high in zip(bounds, bounds[1:])):
+        raise InvalidSearch("price_buckets must be in increasing order")
+    return bounds
+
+def parse_bbox(value: str) -> clusters.BoundingBox:
+    """
+    A map view's edges from "west,south,east,north" in degrees.
+    """
+    try:
+        bbox = tuple(float(edge) for edge in value.split(","))
+    except ValueError:
+        bbox = ()
+    if len(bbox) != 4 or not all(math.isfinite(edge) for edge in bbox):
+        raise InvalidSearch("bbox must be four comma-separated numbers: west,south,east,north")
+    west, south, east, north = bbox
+    if not (-180 <= west <= 180 and -180 <= east <= 180):
+        raise InvalidSearch("bbox longitudes must be between -180 and 180")
+    if not -90 <= south <= north <= 90:
+        raise InvalidSearch("bbox latitudes must be between -90 and 90, south first")
+    return bbox
+
+def facets_cache_key(
+    search_params: Optional[PropertySearchParams],
+    price_buckets: Sequence[float]
+) -> str:
+    return make_key(
+        "facets", {"params": _cache_params(search_params), "price_buckets": list(price_buckets)}
+    )
+
+def _facet_query(filtered: Select) -> Select:
+    # One UNION ALL of small GROUP BYs over the filtered rows, rather than
+    # GROUPING SETS, which SQLite lacks. Each row is (facet, enum value,
+    # text value, integer value, count); the first branch fixes the types.
+    rows = filtered.cte("facet_rows")
+    no_type = cast(null(), Property.property_type.type)
+    no_text = cast(null(), String)
+    no_int = cast(null(), Integer)
+    count = func.count().label("count")
+    branches = [
+        select(literal("total"), no_type, no_text, no_int, count),
+        select(literal("property_type"), rows.c.property_type, no_text, no_int, count)
+        .group_by(rows.c.property_type),
+        select(literal("city"), no_type, rows.c.city, no_int, count).group_by(rows.c.city),
+        select(literal("district"), no_type, rows.c.district, no_int, count)
+        .group_by(rows.c.district),
+        select(literal("bedrooms"), no_type, no_text, rows.c.bedrooms, count)
+        .group_by(rows.c.bedrooms),
+        select(literal("price"), no_type, no_text, rows.c.price_bucket, count)
+        .group_by(rows.c.price_bucket),
+    ]
+    branches += [
+        select(literal(amenity), no_type, no_text, no_int, count)
+        .where(rows.c[amenity].is_(True))
+        for amenity in AMENITIES
+    ]
+    return union_all(*(branch.select_from(rows) for branch in branches))
+
+async def get_property_facets(
+    db: AsyncSession,
+    search_params: Optional[PropertySearchParams] = None,
+    price_buckets: Sequence[float] = FACET_PRICE_BUCKETS
+) -> Dict[str, Any]:
+    """
+    Counts of the properties matching a search by type, city, district,
+    bedrooms, price bucket and amenity, from one aggregate query (one per
+    GRID_ID_CHUNK candidates when the in-memory indexes resolve part of
+    the search). Price bucket i holds prices from bound i-1 (inclusive) to
+    bound i (exclusive), with open-ended first and last buckets.
+    """
+    postgis = geo.use_postgis(db)
+    fulltext = search.use_postgres(db)
+    bucket = case(
+        *((Property.price < bound, index) for index, bound in enumerate(price_buckets)),
+        else_=len(price_buckets)
+    )
+    filtered = apply_search_filters(
+        select(
+            Property.property_type,
+            Property.city,
+            Property.district,
+            Property.bedrooms,
+            bucket.label("price_bucket"),
+            *(getattr(Property, amenity) for amenity in AMENITIES)
+        ),
+        search_params,
+        postgis,
+        fulltext
+    )
+
+    if _uses_memory(search_params, postgis, fulltext):
+        memory_keys = await _memory_keys(db, search_params, postgis, fulltext)
+        candidates = sorted(set.intersection(*(set(values) for values in memory_keys.values())))
+        queries = [
+            _facet_query(filtered.where(Property.id.in_(candidates[i:i + GRID_ID_CHUNK])))
+            for i in range(0, len(candidates), GRID_ID_CHUNK)
+        ]
+    else:
+        queries = [_facet_query(filtered)]
+
+    counts: Dict[str, Dict[Any, int]] = defaultdict(lambda: defaultdict(int))
+    for query in queries:
+        for facet, type_value, text_value, int_value, count in await db.execute(query):
+            value = next((v for v in (type_value, text_value, int_value) if v is not None), None)
+            counts[facet][value] += count
+
+    def ranked(facet: str) -> List[Dict[str, Any]]:
+        values = [{"value": value, "count": count} for value, count in counts[facet].items()]
+        return sorted(values, key=lambda v: (-v["count"], str(v["value"])))
+
+    bounds = [None, *price_buckets, None]
+    return {
+        "total": counts["total"][None],
+        "property_type": ranked("property_type"),
+        "city": ranked("city"),
+        "district": ranked("district"),
+        "bedrooms": ranked("bedrooms"),
+        "price": [
+            {"min": bounds[index], "max": bounds[index + 1], "count": counts["price"][index]}
+            for index in range(len(price_buckets) + 1)
+        ],
+        **{amenity: counts[amenity][None] for amenity in AMENITIES},
+    }
+
+async def export_queries(
+    db: AsyncSession,
+    search_params: Optional[PropertySearchParams] = None
+) -> List[Select]:
+    """
+    Queries selecting the exported columns of every property matching a
+    search, in id order. Searches partly resolved by the in-memory indexes
+    get one query per GRID_ID_CHUNK candidates.
+    """
+    postgis = geo.use_postgis(db)
+    fulltext = search.use_postgres(db)
+    query = apply_search_filters(
+        select(*(getattr(Property, name) for name in export_fields(PropertyInDBBase))),
+        search_params,
+        postgis,
+        fulltext
+    ).order_by(Property.id)
+
+    if not _uses_memory(search_params, postgis, fulltext):
+        return [query]
+    memory_keys = await _memory_keys(db, search_params, postgis, fulltext)
+    candidates = sorted(set.intersection(*(set(values) for values in memory_keys.values())))
+    return [
+        query.where(Property.id.in_(candidates[i:i + GRID_ID_CHUNK]))
+        for i in range(0, len(candidates), GRID_ID_CHUNK)
+    ]
+
+async def get_property_clusters(
+    db: AsyncSession,
+    bbox: clusters.BoundingBox,
+    zoom: int,
+    search_params: Optional[PropertySearchParams] = None
+) -> PropertyClusters:
+    """
+    Clusters and single properties of a map view (see
+    app/services/clusters.py). Without filters they come straight from the
+    cluster index; with filters, from one query for the ids of the matching
+    properties in the view, narrowed by the in-memory indexes where they
+    resolve part of the search.
+    """
+    index = await clusters.ensure_cluster_index_loaded(db)
+    if index.cells_in_view(bbox, zoom) > clusters.MAX_CLUSTER_CELLS:
+        raise InvalidSearch("bbox is too large for the zoom level")
+    # Normalized like cache keys, these are the filters that narrow the search
+    if not _cache_params(search_params):
+        return PropertyClusters.model_validate(index.view(bbox, zoom))
+
+    postgis = geo.use_postgis(db)
+    fulltext = search.use_postgres(db)
+    west, south, east, north = index.view_bounds(bbox, zoom)
+    if west <= east:
+        longitude = Property.longitude.between(west, east)
+    else:
+        longitude = or_(Property.longitude >= west, Property.longitude <= east)
+    query = apply_search_filters(select(Property.id), search_params, postgis, fulltext).where(
+        Property.latitude.between(south, north), longitude
+    )
+    ids = (await db.execute(query)).scalars().all()
+    if _uses_memory(search_params, postgis, fulltext):
+        memory_keys = await _memory_keys(db, search_params, postgis, fulltext)
+        candidates = set.intersection(*(set(values) for values in memory_keys.values()))
+        ids = [property_id for property_id in ids if property_id in candidates]
+    return PropertyClusters.model_validate(index.view(bbox, zoom, ids))
@@ -0,0 +1,186 @@
+"""
+Bulk import of property listings from a streamed CSV or NDJSON body.
+
+The body is read chunk by chunk and parsed a record at a time, so memory use
+is bounded by IMPORT_BATCH_SIZE rows rather than by the size of the file.
+Each record is validated against PropertyCreate. Invalid records are skipped
+and reported by line number; valid ones are inserted IMPORT_BATCH_SIZE at a
+time with one executemany INSERT (sent as multi-row VALUES statements) and
+committed per batch, so an import interrupted part way keeps the batches
+before the interruption.
+
+CSV files need a header row naming PropertyCreate fields; empty values take
+the field's default.
+"""
+import csv
+import json
+import os
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Optional, Tuple
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.property import Property, PropertyStatus
+from ..schemas.property import PropertyCreate, PropertyImportFormat
+from . import clusters, geo, search
+from .cache import PROPERTIES_TAG, get_query_cache
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "100"))
+IMPORT_MAX_RECORD_BYTES = int(os.getenv("IMPORT_MAX_RECORD_BYTES", "65536"))
+
+# (line number, data, error) for each record in the body
+Record = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+TOO_LONG = f"Record is longer than {IMPORT_MAX_RECORD_BYTES} bytes"
+
+async def _lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[Tuple[int, Optional[str]]]:
+    """
+    Numbered lines of the body, without line endings. Lines longer than
+    IMPORT_MAX_RECORD_BYTES (as sent, in UTF-8) are discarded as they arrive
+    and come out as None.
+    """
+    pending = b""
+    number = 0
+    overflow = False
+
+    def decode(line: bytes) -> str:
+        # A newline byte never occurs inside a multi-byte UTF-8 sequence, so
+        # lines are split before decoding; only the first can start with a BOM
+        return line.decode("utf-8-sig" if number == 1 else "utf-8", errors="replace").rstrip("\r")
+
+    async for chunk in chunks:
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            number += 1
+            yield number, None if overflow else decode(line)
+            overflow = False
+        if len(pending) > IMPORT_MAX_RECORD_BYTES:
+            pending = b""
+            overflow = True
+
+    if pending or overflow:
+        number += 1
+        yield number, None if overflow else decode(pending)
+
+async def _csv_records(chunks: AsyncIterable[bytes]) -> AsyncIterator[Record]:
+    header: Optional[List[str]] = None
+    record: List[str] = []
+    start = size = quotes = 0
+
+    async for number, line in _lines(chunks):
+        if line is None:
+            yield (start if record else number), None, TOO_LONG
+            record = []
+            continue
+        if not record:
+            if not line.strip():
+                continue
+            start, size, quotes = number, 0, 0
+        record.append(line)
+        size += len(line.encode()) + 1
+        quotes += line.count('"')
+        if quotes % 2:
+            # Inside a quoted field that continues on the next line
+            if size > IMPORT_MAX_RECORD_BYTES:
+                yield start, None, TOO_LONG
+                record = []
+            continue
+
+        values = next(csv.reader(["\n".join(record)]))
+        record = []
+        if header is None:
+            header = [name.strip() for name in values]
+        elif len(values) != len(header):
+            yield start, None, f"Expected {len(header)} fields, got {len(values)}"
+        else:
+            yield start, {name: value for name, value in zip(header, values) if value != ""}, None
+
+    if record:
+        yield start, None, "Unterminated quoted field"
+
+async def _ndjson_records(chunks: AsyncIterable[bytes]) -> AsyncIterator[Record]:
+    async for number, line in _lines(chunks):
+        if line is None:
+            yield number, None, TOO_LONG
+            continue
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            yield number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(data, dict):
+            yield number, None, "Expected a JSON object"
+            continue
+        yield number, data, None
+
+def _validation_error(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+    )
+
+async def _insert_batch(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    # The in-memory indexes need the new ids
+    result = await db.execute(
+        insert(Property).returning(
+            Property.id,
+            Property.title,
+            Property.description,
+            Property.city,
+            Property.district,
+            Property.latitude,
+            Property.longitude,
+            Property.price
+        ),
+        rows
+    )
+    inserted = result.all()
+    await db.commit()
+    for row in inserted:
+        geo.index_property(db, row)
+        search.index_property(db, row)
+        clusters.index_property(row)
+    await get_query_cache().invalidate(PROPERTIES_TAG)
+
+async def import_properties(
+    db: AsyncSession,
+    chunks: AsyncIterable[bytes],
+    import_format: PropertyImportFormat,
+    owner_id: int
+) -> Dict[str, Any]:
+    """
+    Import the listings in a CSV or NDJSON body for an owner, returning a
+    summary with the first IMPORT_MAX_ERRORS invalid records.
+    """
+    records = _csv_records(chunks) if import_format == PropertyImportFormat.CSV else _ndjson_records(chunks)
+    summary: Dict[str, Any] = {"rows": 0, "imported": 0, "failed": 0, "errors": []}
+    batch: List[Dict[str, Any]] = []
+
+    async for line, data, error in records:
+        summary["rows"] += 1
+        if error is None:
+            try:
+                property_in = PropertyCreate.model_validate(data)
+            except ValidationError as e:
+                error = _validation_error(e)
+        if error is not None:
+            summary["failed"] += 1
+            if len(summary["errors"]) < IMPORT_MAX_ERRORS:
+                summary["errors"].append({"line": line, "error": error})
+            continue
+
+        batch.append({
+            **property_in.model_dump(),
+            "owner_id": owner_id,
+            "status": PropertyStatus.AVAILABLE,
+        })
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await _insert_batch(db, batch)
+            summary["imported"] += len(batch)
+            batch = []
+
+    if batch:
+        await _insert_batch(db, batch)
+        summary["imported"] += len(batch)
+    return summary
@@ -0,0 +1,244 @@
+"""
+Reviews, and the rating summary kept on each property.
+
+Every review write updates the property's rating_count, rating_sum,
+rating_average and star histogram in the same transaction, with relative
+UPDATEs (rating_count = rating_count + 1, ...) so concurrent reviews of a
+property don't lose each other's changes. Listings can then filter and sort
+by rating without aggregating the reviews table.
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import Select, Update, case, func, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.property import Property
+from ..models.review import Review
+from ..models.user import User
+from ..schemas.review import Review as ReviewSchema, ReviewCreate, ReviewSort, ReviewUpdate
+from ..utils.pagination import decode_cursor, encode_cursor
+from .cache import PROPERTIES_TAG, get_query_cache
+
+# Sort key columns and direction (True = descending) for each sort order,
+# ending with Review.id so cursors are stable
+REVIEW_SORT_KEYS = {
+    ReviewSort.NEWEST: ((Review.created_at, Review.id), True),
+    ReviewSort.HIGHEST: ((Review.rating, Review.id), True),
+    ReviewSort.LOWEST: ((Review.rating, Review.id), False),
+}
+
+class DuplicateReview(ValueError):
+    pass
+
+def star(rating: float) -> int:
+    """
+    The histogram bucket of a rating: the nearest whole star, halves up.
+    """
+    return min(5, max(1, int(rating + 0.5)))
+
+def _summary_update(
+    property_id: int,
+    added: Optional[float] = None,
+    removed: Optional[float] = None
+) -> Update:
+    """
+    Add and/or remove one rating from a property's summary.
+    """
+    count_delta = (added is not None) - (removed is not None)
+    sum_delta = (added or 0) - (removed or 0)
+    count = Property.rating_count + count_delta
+    rating_sum = Property.rating_sum + sum_delta
+
+    stars: Dict[int, int] = defaultdict(int)
+    if added is not None:
+        stars[star(added)] += 1
+    if removed is not None:
+        stars[star(removed)] -= 1
+    histogram = {
+        f"rating_{bucket}_count": getattr(Property, f"rating_{bucket}_count") + delta
+        for bucket, delta in stars.items()
+        if delta
+    }
+
+    return update(Property).where(Property.id == property_id).values(
+        rating_count=count,
+        # Reset exactly when the last review goes, rather than keep float residue
+        rating_sum=case((count > 0, rating_sum), else_=0),
+        rating_average=case((count > 0, rating_sum / count), else_=0),
+        # A new rating is not an edit of the listing
+        updated_at=Property.updated_at,
+        **histogram
+    ).execution_options(synchronize_session=False)
+
+async def _invalidate() -> None:
+    # Ratings are part of every listing
+    await get_query_cache().invalidate(PROPERTIES_TAG)
+
+async def create_review(
+    db: AsyncSession,
+    review_in: ReviewCreate,
+    reviewer_id: int
+) -> Optional[ReviewSchema]:
+    """
+    Add a review and count it in the property's summary. Returns None if
+    the property doesn't exist and raises DuplicateReview if the user has
+    already reviewed it.
+    """
+    # Updating the summary first locks the property's row (on databases
+    # with row locks), so a user's concurrent reviews of one property are
+    # checked for duplicates one at a time.
+    result = await db.execute(_summary_update(review_in.property_id, added=review_in.rating))
+    if result.rowcount == 0:
+        await db.rollback()
+        return None
+    existing = await db.scalar(
+        select(Review.id).where(
+            Review.property_id == review_in.property_id,
+            Review.reviewer_id == reviewer_id
+        )
+    )
+    if existing is not None:
+        await db.rollback()
+        raise DuplicateReview("You have already reviewed this property")
+
+    db_review = Review(
+        property_id=review_in.property_id,
+        reviewer_id=reviewer_id,
+        rating=review_in.rating,
+        comment=review_in.comment
+    )
+    db.add(db_review)
+    await db.commit()
+    await _invalidate()
+    return await get_review(db, db_review.id)
+
+async def update_review(
+    db: AsyncSession,
+    db_review: Review,
+    review_update: ReviewUpdate
+) -> ReviewSchema:
+    """
+    Update a review, moving its rating in the property's summary if it
+    changed. Load the review with `with_for_update=True` so the old rating
+    can't change underneath.
+    """
+    # Every review keeps a rating and a comment, so null leaves them as they are
+    changes = {
+        field: value for field, value in review_update.model_dump(exclude_unset=True).items()
+        if value is not None
+    }
+    rating = changes.get("rating")
+    if rating is not None and rating != db_review.rating:
+        await db.execute(_summary_update(db_review.property_id, added=rating, removed=db_review.rating))
+    for field, value in changes.items():
+        setattr(db_review, field, value)
+    await db.commit()
+    await _invalidate()
+    return await get_review(db, db_review.id)
+
+async def delete_review(db: AsyncSession, db_review: Review) -> None:
+    """
+    Delete a review and remove it from the property's summary.
+    """
+    await db.execute(_summary_update(db_review.property_id, removed=db_review.rating))
+    await db.delete(db_review)
+    await db.commit()
+    await _invalidate()
+
+def _columns() -> Tuple:
+    return (
+        Review.id,
+        Review.property_id,
+        Review.reviewer_id,
+        User.full_name.label("reviewer_name"),
+        Review.rating,
+        Review.comment,
+        Review.created_at,
+        Review.updated_at,
+    )
+
+def review_query() -> Select:
+    """
+    Select the fields of the Review schema, with the reviewer's name
+    joined in rather than loaded per review.
+    """
+    return select(*_columns()).join(User, User.id == Review.reviewer_id)
+
+async def get_review(db: AsyncSession, review_id: int) -> Optional[ReviewSchema]:
+    result = await db.execute(review_query().where(Review.id == review_id))
+    row = result.first()
+    return ReviewSchema.model_validate(row._mapping) if row else None
+
+async def get_property_reviews(
+    db: AsyncSession,
+    property_id: int,
+    limit: int = 20,
+    sort: ReviewSort = ReviewSort.NEWEST,
+    cursor: Optional[str] = None
+) -> Tuple[List[ReviewSchema], Optional[str]]:
+    """
+    One page of a property's reviews, and the cursor for the next page.
+    Raises InvalidCursor for a malformed cursor or one from another sort order.
+    """
+    if limit < 1:
+        return [], cursor or None
+    columns, descending = REVIEW_SORT_KEYS[sort]
+    query = review_query().where(Review.property_id == property_id)
+    if cursor:
+        key = tuple_(*columns)
+        cursor_key = tuple_(*decode_cursor(cursor, sort.value, len(columns)))
+        query = query.where(key < cursor_key if descending else key > cursor_key)
+    order = [column.desc() if descending else column.asc() for column in columns]
+    result = await db.execute(query.order_by(*order).limit(limit + 1))
+    reviews = [ReviewSchema.model_validate(row._mapping) for row in result]
+    if len(reviews) <= limit:
+        return reviews, None
+
+    reviews = reviews[:limit]
+    last = reviews[-1]
+    last_key = [last.created_at if sort == ReviewSort.NEWEST else last.rating, last.id]
+    return reviews, encode_cursor(sort.value, last_key)
+
+async def get_latest_reviews(
+    db: AsyncSession,
+    property_ids: Sequence[int],
+    limit: int = 3
+) -> Dict[int, List[ReviewSchema]]:
+    """
+    The newest `limit` reviews of each of several properties, in one query
+    ranking each property's reviews with a window function.
+    """
+    latest: Dict[int, List[ReviewSchema]] = {property_id: [] for property_id in property_ids}
+    if not latest or limit < 1:
+        return latest
+    ranked = select(
+        *_columns(),
+        func.row_number().over(
+            partition_by=Review.property_id,
+            order_by=[Review.created_at.desc(), Review.id.desc()]
+        ).label("position")
+    ).join(
+        User, User.id == Review.reviewer_id
+    ).where(Review.property_id.in_(list(latest))).subquery()
+
+    result = await db.execute(
+        select(ranked)
+        .where(ranked.c.position <= limit)
+        .order_by(ranked.c.property_id, ranked.c.position)
+    )
+    for row in result:
+        latest[row.property_id].append(ReviewSchema.model_validate(row._mapping))
+    return latest
+
+def export_query(owner_id: int, property_id: Optional[int] = None) -> Select:
+    """
+    Reviews of an owner's properties in id order, with reviewer names,
+    optionally limited to one property.
+    """
+    query = review_query().join(
+        Property, Property.id == Review.property_id
+    ).where(
+        Property.owner_id == owner_id
+    ).order_by(Review.id)
+    if property_id is not None:
+        query = query.where(Review.property_id == property_id)
+    return query
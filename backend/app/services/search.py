@@ -0,0 +1,255 @@
+"""
+Keyword search (`q`) over property titles, descriptions and locations.
+
+A property matches when every search term either occurs in its search
+document (title, city and district, description) or closely resembles its
+city or district, so misspelt place names still find listings. Results are
+ranked by how well they match.
+
+On PostgreSQL the search document is the `search_vector` tsvector column
+added by migration 0003, with a GIN index, and place names are matched by
+pg_trgm similarity against trigram indexes on city and district. Other
+databases (SQLite in development and tests) use TextIndex, an in-memory
+inverted index that approximates the same matching and ranking. Like the
+geo grid index it is loaded on first use, kept in sync by the property
+service and only accurate for single-worker deployments.
+"""
+import asyncio
+import os
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import and_, func, literal_column, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.property import Property
+from ..schemas.property import PropertySearchParams
+
+# "postgres" or "memory"; by default PostgreSQL full-text search is used on PostgreSQL
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND")
+
+# Terms beyond this are ignored
+MAX_TERMS = 8
+
+# pg_trgm's default similarity threshold for the % operator
+TRIGRAM_THRESHOLD = 0.3
+
+# Weights of the title (A), location (B) and description (C) in ts_rank
+FIELD_WEIGHTS = {"title": 1.0, "location": 0.4, "description": 0.2}
+
+# Words the PostgreSQL english configuration drops from queries
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it its of on or "
+    "that the this to was with".split()
+)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def use_postgres(db: AsyncSession) -> bool:
+    if SEARCH_BACKEND:
+        return SEARCH_BACKEND == "postgres"
+    return db.get_bind().dialect.name == "postgresql"
+
+def is_text_search(search_params: Optional[PropertySearchParams]) -> bool:
+    return search_params is not None and bool(search_terms(search_params.q))
+
+def search_terms(q: Optional[str]) -> List[str]:
+    if not q:
+        return []
+    terms = []
+    for token in TOKEN_PATTERN.findall(q.lower()):
+        if token not in STOPWORDS and token not in terms:
+            terms.append(token)
+    return terms[:MAX_TERMS]
+
+def _fuzzy_terms(terms: List[str]) -> List[str]:
+    # Trigram similarity is meaningless for very short words
+    return [term for term in terms if len(term) >= 3]
+
+# PostgreSQL expressions. The search_vector column is maintained by the
+# database and is not mapped on the Property model.
+search_vector = literal_column("properties.search_vector")
+
+def postgres_match(q: str):
+    conditions = []
+    for term in search_terms(q):
+        query = func.plainto_tsquery("english", term)
+        # A term that is a stopword to PostgreSQL yields an empty query; ignore it
+        options = [func.numnode(query) == 0, search_vector.op("@@")(query)]
+        if len(term) >= 3:
+            options.append(Property.city.op("%")(term))
+            options.append(Property.district.op("%")(term))
+        conditions.append(or_(*options))
+    return and_(*conditions)
+
+def postgres_rank(q: str):
+    terms = search_terms(q)
+    query = func.plainto_tsquery("english", terms[0])
+    for term in terms[1:]:
+        query = query.op("||")(func.plainto_tsquery("english", term))
+    rank = func.ts_rank(search_vector, query)
+    similarities = []
+    for term in _fuzzy_terms(terms):
+        similarities.append(func.similarity(Property.city, term))
+        similarities.append(func.similarity(Property.district, term))
+    if similarities:
+        rank = rank + func.greatest(*similarities)
+    return rank
+
+def stem(token: str) -> str:
+    # Just enough stemming for plurals to match their singular
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return [stem(token) for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+def trigrams(text: str) -> Set[str]:
+    # Same trigrams as pg_trgm: each word padded with two spaces before and one after
+    grams = set()
+    for word in TOKEN_PATTERN.findall(text.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def similarity(a: str, b: str) -> float:
+    grams_a, grams_b = trigrams(a), trigrams(b)
+    if not grams_a or not grams_b:
+        return 0.0
+    return len(grams_a & grams_b) / len(grams_a | grams_b)
+
+class TextIndex:
+    """
+    Inverted index from stemmed terms to weighted term frequencies, plus
+    the distinct city and district values for fuzzy place name matching.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self._documents: Dict[int, Tuple[Set[str], Tuple[str, ...]]] = {}
+        self._places: Dict[str, Set[int]] = defaultdict(set)
+        self._touched: Optional[Set[int]] = None
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def upsert(
+        self,
+        doc_id: int,
+        title: Optional[str],
+        description: Optional[str],
+        city: Optional[str],
+        district: Optional[str]
+    ) -> None:
+        self.remove(doc_id)
+        weights: Dict[str, float] = defaultdict(float)
+        fields = (
+            (title, FIELD_WEIGHTS["title"]),
+            (f"{city or ''} {district or ''}", FIELD_WEIGHTS["location"]),
+            (description, FIELD_WEIGHTS["description"]),
+        )
+        for text, weight in fields:
+            for token in tokenize(text):
+                weights[token] += weight
+        for token, weight in weights.items():
+            self._postings[token][doc_id] = weight
+        places = tuple(place for place in (city, district) if place)
+        for place in places:
+            self._places[place].add(doc_id)
+        self._documents[doc_id] = (set(weights), places)
+
+    def remove(self, doc_id: int) -> None:
+        if self._touched is not None:
+            self._touched.add(doc_id)
+        document = self._documents.pop(doc_id, None)
+        if document is None:
+            return
+        tokens, places = document
+        for token in tokens:
+            postings = self._postings[token]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[token]
+        for place in places:
+            self._places[place].discard(doc_id)
+            if not self._places[place]:
+                del self._places[place]
+
+    def begin_load(self) -> None:
+        # Changes made while the snapshot is read take precedence over it
+        self._touched = set()
+
+    def finish_load(self, rows) -> None:
+        touched = self._touched or set()
+        self._touched = None
+        for doc_id, title, description, city, district in rows:
+            if doc_id not in touched:
+                self.upsert(doc_id, title, description, city, district)
+        self.loaded = True
+
+    def search(self, q: str) -> Dict[int, float]:
+        """
+        Relevance score of every document matching all terms of q.
+        """
+        scores: Optional[Dict[int, float]] = None
+        place_scores: Dict[int, float] = defaultdict(float)
+        for term in search_terms(q):
+            term_scores = dict(self._postings.get(stem(term), {}))
+            if len(term) >= 3:
+                for place, doc_ids in self._places.items():
+                    score = similarity(place, term)
+                    if score < TRIGRAM_THRESHOLD:
+                        continue
+                    for doc_id in doc_ids:
+                        term_scores.setdefault(doc_id, 0.0)
+                        place_scores[doc_id] = max(place_scores[doc_id], score)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    doc_id: score + term_scores[doc_id]
+                    for doc_id, score in scores.items()
+                    if doc_id in term_scores
+                }
+            if not scores:
+                return {}
+        return {doc_id: score + place_scores[doc_id] for doc_id, score in (scores or {}).items()}
+
+text_index = TextIndex()
+
+# As for the radius search grid: one cold load at a time
+_text_index_load_lock = asyncio.Lock()
+
+async def ensure_text_index_loaded(db: AsyncSession) -> TextIndex:
+    if not text_index.loaded:
+        async with _text_index_load_lock:
+            if not text_index.loaded:
+                text_index.begin_load()
+                result = await db.execute(
+                    select(
+                        Property.id,
+                        Property.title,
+                        Property.description,
+                        Property.city,
+                        Property.district
+                    )
+                )
+                text_index.finish_load(result.all())
+    return text_index
+
+def index_property(db: AsyncSession, db_property: Property) -> None:
+    if not use_postgres(db):
+        text_index.upsert(
+            db_property.id,
+            db_property.title,
+            db_property.description,
+            db_property.city,
+            db_property.district
+        )
+
+def unindex_property(db: AsyncSession, property_id: int) -> None:
+    if not use_postgres(db):
+        text_index.remove(property_id)
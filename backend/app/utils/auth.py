@@ -1,26 +1,39 @@
+import hmac
+import os
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from ..database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import AsyncSessionLocal
 from ..models.user import User
+from ..schemas.user import CurrentUser
+from ..services.cache import MemoryCacheBackend, QueryCache
 
 # Security configuration
 SECRET_KEY = "your-secret-key-here"  # Change this in production
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# Authenticated users are cached for AUTH_CACHE_TTL seconds. Changes made in
+# this process through invalidate_user apply at once; anything else (another
+# worker, a direct database update) can take up to the TTL to be seen.
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+# Verified token -> subject, so repeat requests skip the signature check
+token_cache = MemoryCacheBackend(AUTH_CACHE_MAX_ENTRIES)
+# Subject -> CurrentUser, tagged per user for invalidation
+user_cache = QueryCache(MemoryCacheBackend(AUTH_CACHE_MAX_ENTRIES), ttl=AUTH_CACHE_TTL)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+# Bearer token for the operational endpoints (/metrics, /cache/stats), such
+# as a Prometheus scraper's; they are disabled while it isn't set
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
@@ -32,31 +45,86 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+def _user_tag(email: str) -> str:
+    return f"user:{email}"
+
+async def _token_subject(token: str) -> Optional[str]:
+    email = await token_cache.get(token)
+    if email is not None:
+        return email
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
-            raise credentials_exception
+            return None
     except JWTError:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.email == email).first()
+        return None
+    # Never keep a token past its expiry
+    ttl = min(AUTH_CACHE_TTL, payload.get("exp", 0) - time.time())
+    if ttl > 0:
+        await token_cache.set(token, email, ttl)
+    return email
+
+async def _load_user(email: str, db: AsyncSession) -> Optional[CurrentUser]:
+    result = await db.execute(select(User).where(User.email == email))
+    user = result.scalar_one_or_none()
+    return CurrentUser.model_validate(user) if user else None
+
+async def authenticate_token(token: str, db: Optional[AsyncSession] = None) -> Optional[CurrentUser]:
+    """
+    Resolve an access token to its user, or None if the token is invalid.
+    The database is only queried when the user is not cached; without db a
+    session is opened for it.
+    """
+    email = await _token_subject(token)
+    if email is None:
+        return None
+
+    user = await user_cache.get(email)
+    if user is not None:
+        return user
+    tags = [_user_tag(email)]
+    versions = await user_cache.versions(tags)
+    if db is None:
+        async with AsyncSessionLocal() as db:
+            user = await _load_user(email, db)
+    else:
+        user = await _load_user(email, db)
+    if user is not None:
+        await user_cache.set(email, user, tags, versions)
+    return user
+
+async def invalidate_user(email: str) -> None:
+    """
+    Drop the cached snapshot of a user. Call after changing a user's row,
+    for example the profile or is_active.
+    """
+    await user_cache.invalidate(_user_tag(email))
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> CurrentUser:
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    user = await authenticate_token(token)
     if user is None:
         raise credentials_exception
     return user
 
 async def get_current_active_user(
-    current_user: User = Depends(get_current_user)
-) -> User:
+    current_user: CurrentUser = Depends(get_current_user)
+) -> CurrentUser:
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    return current_user 
\ No newline at end of file
+    return current_user 
+
+async def require_metrics_token(token: str = Depends(oauth2_scheme)) -> None:
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
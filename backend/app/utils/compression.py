@@ -0,0 +1,167 @@
+"""
+Negotiated gzip/brotli compression of responses.
+
+CompressionMiddleware compresses responses of textual media types (JSON,
+NDJSON, CSV, ...) with brotli when the client accepts it and the brotli
+package is installed, or gzip otherwise. Small responses, under
+COMPRESSION_MIN_SIZE bytes, are sent as they are: compressing them costs
+more CPU than the bytes it saves. Streamed responses are compressed as they
+stream. Responses that already have a Content-Encoding, such as gzipped
+exports and precompressed uploads, and partial (206) responses are passed
+through untouched.
+"""
+import os
+import zlib
+from typing import Callable, Dict, Optional, Tuple
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+}
+
+# compress(chunk), finish()
+Compressor = Tuple[Callable[[bytes], bytes], Callable[[], bytes]]
+
+def encoding_qualities(header: str) -> Dict[str, float]:
+    """
+    The q-value of each coding named in an Accept-Encoding header.
+    """
+    qualities = {}
+    for item in header.split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name] = quality
+    return qualities
+
+def negotiate_encoding(header: str) -> Optional[str]:
+    qualities = encoding_qualities(header)
+    available = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best = None
+    for encoding in available:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (encoding, quality)
+    return best[0] if best else None
+
+def compressible(media_type: str) -> bool:
+    media_type = media_type.split(";")[0].strip().lower()
+    return (
+        media_type.startswith("text/")
+        or media_type in COMPRESSIBLE_TYPES
+        or media_type.endswith(("+json", "+xml"))
+    )
+
+def compressor(encoding: str) -> Compressor:
+    if encoding == "br":
+        brotli_compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        return brotli_compressor.process, brotli_compressor.finish
+    gzip_compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, wbits=31)  # gzip container
+    return gzip_compressor.compress, gzip_compressor.flush
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_SIZE) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        await self.app(scope, receive, _CompressingSend(send, encoding, self.minimum_size))
+
+class _CompressingSend:
+    """
+    Wraps `send` for one response, deciding on its first body message
+    whether to compress it.
+    """
+
+    def __init__(self, send: Send, encoding: Optional[str], minimum_size: int) -> None:
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start: Optional[Message] = None
+        self.compressor: Optional[Compressor] = None
+        self.passthrough = False
+
+    async def __call__(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        if self.start is not None:
+            await self._begin(message)
+            return
+        if self.passthrough:
+            await self.send(message)
+            return
+
+        compress, finish = self.compressor
+        body = compress(message.get("body", b""))
+        more_body = message.get("more_body", False)
+        if not more_body:
+            body += finish()
+        if body or not more_body:
+            await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+    async def _begin(self, message: Message) -> None:
+        start, self.start = self.start, None
+        headers = MutableHeaders(scope=start)
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        eligible = (
+            start["status"] not in (204, 206, 304)
+            and "content-encoding" not in headers
+            and compressible(headers.get("content-type", ""))
+        )
+        if eligible:
+            headers.add_vary_header("Accept-Encoding")
+        if not eligible or self.encoding is None or (not more_body and len(body) < self.minimum_size):
+            self.passthrough = True
+            await self.send(start)
+            await self.send(message)
+            return
+
+        self.compressor = compressor(self.encoding)
+        compress, finish = self.compressor
+        body = compress(body)
+        if not more_body:
+            body += finish()
+        headers["Content-Encoding"] = self.encoding
+        if more_body:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(len(body))
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            # The compressed bytes aren't the ones the strong ETag names
+            headers["ETag"] = "W/" + etag
+        await self.send(start)
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
@@ -0,0 +1,156 @@
+"""
+Validation and resizing of uploaded profile pictures in a process pool.
+
+Decoding and resizing an image is CPU work that would stall the event loop,
+so ImageProcessor runs it in a WorkerPool (app/utils/workers.py). Pictures
+are checked with Pillow (format, pixel count, a full decode) and saved as
+square WebP and JPEG variants at each of AVATAR_SIZES.
+
+Variants are stored content-addressed, named after the SHA-256 of the
+uploaded bytes, so uploading the same picture again reuses the files already
+there without decoding it. The original upload isn't kept: the variants are
+re-encoded without its metadata (such as EXIF locations), which would
+otherwise be served publicly.
+
+This module is imported by the pool's processes, so it must stay free of
+application imports. Pillow is only imported where images are decoded, so
+the API process, which just hands uploads to the pool, never loads it; the
+pool's processes load it as they start.
+"""
+import hashlib
+import io
+import os
+import warnings
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+from .workers import PoolBusy, WorkerPool
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_URL = os.getenv("UPLOAD_URL", "/uploads")
+AVATAR_MAX_BYTES = int(os.getenv("AVATAR_MAX_BYTES", str(5 * 1024 * 1024)))
+AVATAR_MAX_PIXELS = int(os.getenv("AVATAR_MAX_PIXELS", str(40_000_000)))
+AVATAR_SIZES = tuple(int(size) for size in os.getenv("AVATAR_SIZES", "64,256").split(","))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(min(2, os.cpu_count() or 1))))
+IMAGE_CONCURRENCY = int(os.getenv("IMAGE_CONCURRENCY", str(IMAGE_WORKERS * 2)))
+IMAGE_QUEUE_TIMEOUT = float(os.getenv("IMAGE_QUEUE_TIMEOUT", "10"))
+
+ALLOWED_FORMATS = {"JPEG", "PNG", "WEBP", "GIF"}
+
+# Variant name: (file extension, Pillow format, save options)
+VARIANT_FORMATS = {
+    "webp": ("webp", "WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("jpg", "JPEG", {"quality": 85, "optimize": True, "progressive": True}),
+}
+
+# size: {variant name: path or URL}
+Variants = Dict[int, Dict[str, str]]
+
+class InvalidImage(ValueError):
+    pass
+
+class ImageProcessingBusy(PoolBusy):
+    pass
+
+def avatar_paths(digest: str, sizes: Tuple[int, ...] = AVATAR_SIZES) -> Variants:
+    """
+    Paths of the variants of a picture, relative to UPLOAD_DIR.
+    """
+    return {
+        size: {
+            name: f"avatars/{digest[:2]}/{digest}_{size}.{extension}"
+            for name, (extension, _, _) in VARIANT_FORMATS.items()
+        }
+        for size in sizes
+    }
+
+def _load_pillow() -> None:
+    from PIL import Image, ImageOps  # noqa: F401
+
+def _open(data: bytes) -> "Image.Image":
+    from PIL import Image
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", Image.DecompressionBombWarning)
+            with Image.open(io.BytesIO(data)) as probe:
+                if probe.format not in ALLOWED_FORMATS:
+                    raise InvalidImage(f"Unsupported image format {probe.format}")
+                width, height = probe.size
+                if width * height > AVATAR_MAX_PIXELS:
+                    raise InvalidImage(f"Image is larger than {AVATAR_MAX_PIXELS} pixels")
+                probe.verify()
+            image = Image.open(io.BytesIO(data))
+            image.load()
+    except InvalidImage:
+        raise
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError, Image.DecompressionBombWarning):
+        raise InvalidImage("Not a valid image")
+    return image
+
+def _save(image: "Image.Image", path: str, image_format: str, options: Dict) -> None:
+    # Written under a temporary name and renamed, so a variant is never
+    # served half written
+    temporary = f"{path}.{os.getpid()}.tmp"
+    image.save(temporary, image_format, **options)
+    os.replace(temporary, path)
+
+def process_avatar(data: bytes, root: str, sizes: Tuple[int, ...] = AVATAR_SIZES) -> Variants:
+    """
+    Validate a picture and save its variants under `root`, returning their
+    paths relative to `root`. Runs in the pool's processes.
+    """
+    from PIL import Image, ImageOps
+
+    paths = avatar_paths(hashlib.sha256(data).hexdigest(), sizes)
+    if all(os.path.exists(os.path.join(root, path)) for variants in paths.values() for path in variants.values()):
+        return paths
+
+    image = ImageOps.exif_transpose(_open(data))
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    for size, variants in paths.items():
+        resized = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        for name, path in variants.items():
+            _, image_format, options = VARIANT_FORMATS[name]
+            variant = resized
+            if image_format == "JPEG" and has_alpha:
+                variant = Image.new("RGB", resized.size, "white")
+                variant.paste(resized, mask=resized.getchannel("A"))
+            full_path = os.path.join(root, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            _save(variant, full_path, image_format, options)
+    return paths
+
+class ImageProcessor(WorkerPool):
+    busy_error = ImageProcessingBusy
+    busy_message = "Too many image uploads in progress, try again shortly"
+    warm_up = staticmethod(_load_pillow)
+
+    def __init__(
+        self,
+        workers: int = IMAGE_WORKERS,
+        concurrency: int = IMAGE_CONCURRENCY,
+        queue_timeout: float = IMAGE_QUEUE_TIMEOUT
+    ):
+        super().__init__(workers, concurrency, queue_timeout)
+
+    async def avatar(self, data: bytes) -> Variants:
+        """
+        URLs of the variants of a profile picture, generating any that
+        don't exist yet.
+        """
+        paths = await self.run(process_avatar, data, UPLOAD_DIR, AVATAR_SIZES)
+        return {
+            size: {name: f"{UPLOAD_URL}/{path}" for name, path in variants.items()}
+            for size, variants in paths.items()
+        }
+
+_image_processor: Optional[ImageProcessor] = None
+
+def get_image_processor() -> ImageProcessor:
+    global _image_processor
+    if _image_processor is None:
+        _image_processor = ImageProcessor()
+    return _image_processor
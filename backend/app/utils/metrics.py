@@ -0,0 +1,248 @@
+"""
+Per-request performance metrics in the Prometheus text format.
+
+MetricsMiddleware records, for each route template (such as
+/properties/{property_id}), request counts by status, a latency histogram,
+the SQL statements issued and time spent in the database per request, and
+response sizes, plus the number of requests in flight. Statements are
+counted by SQLAlchemy cursor events on the engines passed to
+instrument_engine, and attributed to the request through a context
+variable, so concurrent requests don't mix.
+
+Everything is kept in this process's memory and rendered by render() for
+GET /metrics, which takes METRICS_TOKEN as a bearer token (see
+app/utils/auth.py); each worker process reports its own numbers. Recording a
+request costs a few dictionary updates, so it can stay on in production.
+
+With SERVER_TIMING enabled, responses also carry a Server-Timing header
+with the database time and statement count, the total time, and any
+segments added with add_timing() or server_timing() while handling the
+request.
+"""
+import bisect
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+Labels = Tuple[str, ...]
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterator[Tuple[str, Labels, Sequence[str], float]]:
+        for labels, value in sorted(self._values.items()):
+            yield self.name, labels, self.labels, value
+
+class Gauge(Counter):
+    def dec(self, labels: Labels = (), amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels: [count per bucket..., count above the last bucket], sum
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Labels, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def samples(self) -> Iterator[Tuple[str, Labels, Sequence[str], float]]:
+        for labels, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + (_number(bound),), self.labels + ("le",), cumulative
+            yield f"{self.name}_sum", labels, self.labels, total[0]
+            yield f"{self.name}_count", labels, self.labels, cumulative
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+REQUESTS = Counter("http_requests_total", "Requests by route template and status", ("method", "route", "status"))
+LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency", ("method", "route"), LATENCY_BUCKETS
+)
+IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being handled")
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "Response body size", ("method", "route"), SIZE_BUCKETS
+)
+REQUEST_QUERIES = Histogram(
+    "db_queries_per_request", "SQL statements issued per request", ("method", "route"), QUERY_COUNT_BUCKETS
+)
+REQUEST_DB_TIME = Histogram(
+    "db_time_per_request_seconds", "Time spent in SQL statements per request", ("method", "route"), LATENCY_BUCKETS
+)
+QUERIES = Counter("db_queries_total", "SQL statements issued, in and outside requests")
+
+METRICS = (REQUESTS, LATENCY, IN_FLIGHT, RESPONSE_SIZE, REQUEST_QUERIES, REQUEST_DB_TIME, QUERIES)
+
+def render() -> str:
+    lines = []
+    for metric in METRICS:
+        kind = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}[type(metric)]
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {kind}")
+        for name, values, names, value in metric.samples():
+            labels = ",".join(f'{label}="{_escape(value)}"' for label, value in zip(names, values))
+            lines.append(f"{name}{{{labels}}} {_number(value)}" if labels else f"{name} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+class RequestStats:
+    def __init__(self) -> None:
+        self.queries = 0
+        self.db_time = 0.0
+        # (name, milliseconds, description)
+        self.timings: List[Tuple[str, float, Optional[str]]] = []
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+def add_timing(name: str, milliseconds: float, description: Optional[str] = None) -> None:
+    """
+    Add a segment to the current request's Server-Timing header.
+    """
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.timings.append((name, milliseconds, description))
+
+@contextmanager
+def server_timing(name: str, description: Optional[str] = None) -> Iterator[None]:
+    """
+    Time a block as a Server-Timing segment of the current request.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(name, (time.perf_counter() - start) * 1000, description)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    QUERIES.inc()
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+
+def _handle_error(context) -> None:
+    # The statement failed, so after_cursor_execute won't pop its start time
+    starts = context.connection.info.get("query_start_time") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Count and time the statements run on a sync Engine (for an AsyncEngine,
+    pass its sync_engine).
+    """
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+
+def route_template(scope: Scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    endpoint = scope.get("endpoint")
+    if endpoint is not None and scope.get("root_path", "") != scope.get("app_root_path", ""):
+        # A mounted app, such as /uploads; label by mount point
+        return scope["root_path"][len(scope.get("app_root_path", "")):] or "/"
+    # Unmatched paths share one label so scanners can't grow the metrics
+    return "unmatched"
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp, server_timing: bool = SERVER_TIMING) -> None:
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", self._server_timing(stats, start))
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            IN_FLIGHT.dec()
+            _request_stats.reset(token)
+            labels = (scope["method"], route_template(scope))
+            REQUESTS.inc(labels + (str(status),))
+            LATENCY.observe(labels, time.perf_counter() - start)
+            RESPONSE_SIZE.observe(labels, size)
+            REQUEST_QUERIES.observe(labels, stats.queries)
+            REQUEST_DB_TIME.observe(labels, stats.db_time)
+
+    @staticmethod
+    def _server_timing(stats: RequestStats, start: float) -> str:
+        # Streamed bodies are still being produced, so this covers the
+        # work done before the response started
+        segments = [f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"']
+        for name, milliseconds, description in stats.timings:
+            segment = f"{name};dur={milliseconds:.1f}"
+            if description:
+                segment += f';desc="{_escape(description)}"'
+            segments.append(segment)
+        segments.append(f"app;dur={(time.perf_counter() - start) * 1000:.1f}")
+        return ", ".join(segments)
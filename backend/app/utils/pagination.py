@@ -0,0 +1,52 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Sequence, Tuple
+
+# Response header carrying the cursor for the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+class InvalidCursor(ValueError):
+    pass
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and set(value) == {"dt"}:
+        return datetime.fromisoformat(value["dt"])
+    # Sort keys are numbers and datetimes; anything else didn't come from
+    # encode_cursor and can't be compared with the key columns
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise InvalidCursor("Malformed cursor")
+    return value
+
+def encode_cursor(sort: str, key: Sequence[Any]) -> str:
+    """
+    Encode the sort key of the last row of a page into an opaque cursor.
+    """
+    payload = json.dumps(
+        {"s": sort, "k": [_encode_value(value) for value in key]},
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort: str, length: int) -> Tuple[Any, ...]:
+    """
+    Decode a cursor produced by encode_cursor for the given sort order,
+    whose key has `length` values.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload["s"] != sort:
+            raise InvalidCursor("Cursor does not match the requested sort order")
+        if not isinstance(payload["k"], list) or len(payload["k"]) != length:
+            raise InvalidCursor("Malformed cursor")
+        return tuple(_decode_value(value) for value in payload["k"])
+    except InvalidCursor:
+        raise
+    except (ValueError, KeyError, TypeError) as exc:
+        raise InvalidCursor("Malformed cursor") from exc
@@ -0,0 +1,69 @@
+"""
+Password hashing and verification in a process pool.
+
+bcrypt is deliberately slow CPU work (around 300 ms per call at cost 12).
+Run inline it stalls the event loop, and in threads it still competes with
+request handling for the worker's CPU time. PasswordHasher runs it in a
+WorkerPool (app/utils/workers.py) of separate processes instead; a request
+that can't get a slot within PASSWORD_HASH_QUEUE_TIMEOUT seconds fails with
+HashingBusy rather than piling up behind a login storm.
+
+This module is imported by the pool's processes, so it must stay free of
+application imports.
+"""
+import os
+from typing import Optional, Tuple
+from passlib.context import CryptContext
+from .workers import PoolBusy, WorkerPool
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_CONCURRENCY = int(
+    os.getenv("PASSWORD_HASH_CONCURRENCY", str(PASSWORD_HASH_WORKERS * 2))
+)
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "10"))
+
+# Hashes made with a cost other than BCRYPT_ROUNDS report that they need an
+# update, and are rehashed on the user's next login.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+def get_password_hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Whether the password matches, and a new hash if the stored one is outdated.
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+class HashingBusy(PoolBusy):
+    pass
+
+class PasswordHasher(WorkerPool):
+    busy_error = HashingBusy
+    busy_message = "Too many password operations in progress, try again shortly"
+
+    def __init__(
+        self,
+        workers: int = PASSWORD_HASH_WORKERS,
+        concurrency: int = PASSWORD_HASH_CONCURRENCY,
+        queue_timeout: float = PASSWORD_HASH_QUEUE_TIMEOUT
+    ):
+        super().__init__(workers, concurrency, queue_timeout)
+
+    async def hash(self, password: str) -> str:
+        return await self.run(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await self.run(verify_and_update_password, plain_password, hashed_password)
+
+_password_hasher: Optional[PasswordHasher] = None
+
+def get_password_hasher() -> PasswordHasher:
+    global _password_hasher
+    if _password_hasher is None:
+        _password_hasher = PasswordHasher()
+    return _password_hasher
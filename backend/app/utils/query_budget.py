@@ -0,0 +1,55 @@
+"""
+pytest plugin that fails tests whose requests run too many SQL statements.
+
+Load it with `pytest -p app.utils.query_budget` (or list it in a conftest's
+pytest_plugins). It turns on the query detector before the app is imported,
+then checks every request a test makes against its budget: the route's
+@query_budget(n), or the test's own `@pytest.mark.query_budget(n)`, which
+applies to each of its requests and takes precedence. With
+--query-budget-strict, repeated statement shapes (N+1 patterns) and slow
+statements fail the test as well.
+"""
+import os
+
+# Before the app imports the detector's settings
+os.environ.setdefault("QUERY_DETECTOR", "true")
+
+import pytest
+from .query_detector import add_listener, remove_listener
+
+def pytest_addoption(parser) -> None:
+    group = parser.getgroup("query budget")
+    group.addoption(
+        "--query-budget-strict",
+        action="store_true",
+        help="also fail tests on N+1 patterns and slow statements",
+    )
+
+def pytest_configure(config) -> None:
+    config.addinivalue_line(
+        "markers", "query_budget(limit): most SQL statements each request in the test may run"
+    )
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item):
+    logs = []
+    listener = logs.append
+    add_listener(listener)
+    try:
+        result = yield
+    finally:
+        remove_listener(listener)
+
+    marker = item.get_closest_marker("query_budget")
+    strict = item.config.getoption("query_budget_strict")
+    problems = []
+    for log in logs:
+        if marker is not None:
+            log.budget = marker.args[0]
+        problems += [
+            str(finding) for finding in log.findings()
+            if finding.kind == "budget" or strict
+        ]
+    if problems:
+        pytest.fail("query budget exceeded:\n" + "\n".join(problems), pytrace=False)
+    return result
@@ -0,0 +1,221 @@
+"""
+Opt-in detection of N+1 query patterns and slow statements.
+
+With QUERY_DETECTOR enabled, every SQL statement a request runs is recorded
+by its shape: the statement text with whitespace collapsed and expanded IN
+lists folded, so the same query for different rows counts as one shape.
+When the request ends, it is reported (as a logged warning and to any
+listeners) if a shape ran QUERY_REPEAT_THRESHOLD or more times, which is
+what loading a relationship or a lookup per row looks like; if a statement
+took SLOW_QUERY_MS or longer; or if the request ran more statements than
+its route's budget, declared with @query_budget(n). Each finding names the
+route template and the application frames that issued the statement.
+
+Recording captures a stack for the first statement of each shape, so it is
+meant for development and CI rather than production. The pytest plugin in
+app.utils.query_budget fails tests whose requests go over budget.
+"""
+import logging
+import os
+import re
+import time
+import traceback
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Receive, Scope, Send
+from .metrics import route_template
+
+try:
+    import greenlet
+except ImportError:
+    greenlet = None
+
+QUERY_DETECTOR = os.getenv("QUERY_DETECTOR", "false").lower() in ("1", "true", "yes")
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "5"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+logger = logging.getLogger(__name__)
+
+# Frames from these files are the application's; everything else is
+# library code between it and the database
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER = r"(?:\?|%s|%\(\w+\)s|:\w+|\$\d+)"
+_PLACEHOLDER_LIST = re.compile(rf"\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})+\s*\)")
+
+def statement_shape(statement: str) -> str:
+    """
+    A statement with whitespace collapsed and lists of placeholders, as
+    rendered for IN with a varying number of values, folded to (...).
+    """
+    return _PLACEHOLDER_LIST.sub("(...)", _WHITESPACE.sub(" ", statement).strip())
+
+def _stack() -> List[str]:
+    frames = traceback.extract_stack()
+    if greenlet is not None:
+        # The async engine runs statements in a greenlet whose stack ends
+        # at SQLAlchemy; the awaiting coroutines are in its parents
+        parent = greenlet.getcurrent().parent
+        while parent is not None:
+            if parent.gr_frame is not None:
+                frames = traceback.extract_stack(parent.gr_frame) + frames
+            parent = parent.parent
+    return [
+        f"{os.path.relpath(frame.filename, APP_ROOT)}:{frame.lineno} in {frame.name}"
+        for frame in frames
+        if frame.filename.startswith(APP_ROOT)
+        and "site-packages" not in frame.filename
+        and frame.filename != __file__
+        # ASGI middleware layers
+        and frame.name != "__call__"
+    ]
+
+class StatementShape:
+    def __init__(self, shape: str, stack: List[str]) -> None:
+        self.shape = shape
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = 0.0
+        # Where it first ran, and where it ran slowest once over the threshold
+        self.stack = stack
+        self.slow_stack: Optional[List[str]] = None
+
+class QueryFinding:
+    def __init__(self, kind: str, route: Optional[str], message: str, stack: List[str]) -> None:
+        self.kind = kind
+        self.route = route
+        self.message = message
+        self.stack = stack
+
+    def __str__(self) -> str:
+        lines = [f"{self.kind} in {self.route or 'no request'}: {self.message}"]
+        lines += [f"    {frame}" for frame in self.stack]
+        return "\n".join(lines)
+
+class QueryLog:
+    """
+    The statements run in one request (or track_queries block).
+    """
+
+    def __init__(self, slow_ms: float = SLOW_QUERY_MS) -> None:
+        self.slow_ms = slow_ms
+        self.shapes: Dict[str, StatementShape] = {}
+        self.count = 0
+        self.route: Optional[str] = None
+        self.budget: Optional[int] = None
+
+    def record(self, statement: str, duration: float) -> None:
+        shape = statement_shape(statement)
+        entry = self.shapes.get(shape)
+        if entry is None:
+            entry = self.shapes[shape] = StatementShape(shape, _stack())
+        entry.count += 1
+        entry.duration += duration
+        if duration > entry.slowest:
+            entry.slowest = duration
+            if duration * 1000 >= self.slow_ms:
+                entry.slow_stack = _stack()
+        self.count += 1
+
+    def findings(self, repeat_threshold: int = QUERY_REPEAT_THRESHOLD) -> List[QueryFinding]:
+        findings = []
+        if self.budget is not None and self.count > self.budget:
+            findings.append(QueryFinding(
+                "budget", self.route, f"{self.count} statements, budget {self.budget}", []
+            ))
+        for entry in self.shapes.values():
+            if entry.count >= repeat_threshold:
+                findings.append(QueryFinding(
+                    "n+1", self.route, f"{entry.count} times, {entry.duration * 1000:.1f} ms: {entry.shape}",
+                    entry.stack
+                ))
+            if entry.slow_stack is not None:
+                findings.append(QueryFinding(
+                    "slow", self.route, f"{entry.slowest * 1000:.1f} ms: {entry.shape}", entry.slow_stack
+                ))
+        return findings
+
+_query_log: ContextVar[Optional[QueryLog]] = ContextVar("query_log", default=None)
+_listeners: List[Callable[[QueryLog], None]] = []
+
+@contextmanager
+def track_queries(slow_ms: float = SLOW_QUERY_MS) -> Iterator[QueryLog]:
+    """
+    Record the statements run inside the block on watched engines.
+    """
+    log = QueryLog(slow_ms)
+    token = _query_log.set(log)
+    try:
+        yield log
+    finally:
+        _query_log.reset(token)
+
+def add_listener(listener: Callable[[QueryLog], None]) -> None:
+    """
+    Call `listener` with each request's QueryLog when the request ends.
+    """
+    _listeners.append(listener)
+
+def remove_listener(listener: Callable[[QueryLog], None]) -> None:
+    _listeners.remove(listener)
+
+def report(log: QueryLog) -> None:
+    for finding in log.findings():
+        logger.warning("%s", finding)
+    for listener in list(_listeners):
+        listener(log)
+
+def query_budget(limit: int) -> Callable:
+    """
+    Declare the most statements a route's requests should run. Apply it
+    under the route decorator.
+    """
+    def decorate(endpoint: Callable) -> Callable:
+        endpoint.query_budget = limit
+        return endpoint
+    return decorate
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if _query_log.get() is not None:
+        conn.info.setdefault("query_detector_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    log = _query_log.get()
+    if log is not None:
+        log.record(statement, time.perf_counter() - conn.info["query_detector_start"].pop())
+
+def _handle_error(context) -> None:
+    starts = context.connection.info.get("query_detector_start") if context.connection is not None else None
+    if starts and _query_log.get() is not None:
+        starts.pop()
+
+def watch_engine(engine: Engine) -> None:
+    """
+    Record statements run on a sync Engine (for an AsyncEngine, pass its
+    sync_engine) in the current QueryLog.
+    """
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+
+class QueryDetectorMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with track_queries() as log:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                log.route = f"{scope['method']} {route_template(scope)}"
+                endpoint = getattr(scope.get("route"), "endpoint", None)
+                log.budget = getattr(endpoint, "query_budget", None)
+                report(log)
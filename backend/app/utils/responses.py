@@ -0,0 +1,50 @@
+"""
+JSON response serialization.
+
+The API's default response class is FastAPI's JSONResponse, as before;
+set JSON_BACKEND to "orjson" to use ORJSONResponse instead, which needs the
+orjson package.
+
+Hot list endpoints go further with model_response, which serializes their
+schemas straight to JSON bytes with pydantic-core, skipping both
+response_model's second validation pass and jsonable_encoder. Those routes
+keep their response_model for the OpenAPI schema; FastAPI doesn't apply it
+to a Response returned directly.
+"""
+import os
+from functools import lru_cache
+from typing import Any, Type
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+from pydantic import TypeAdapter
+from .metrics import server_timing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKEND = os.getenv("JSON_BACKEND", "standard")
+
+def default_response_class() -> Type[JSONResponse]:
+    if JSON_BACKEND == "orjson":
+        if orjson is None:
+            raise RuntimeError("JSON_BACKEND=orjson needs the orjson package")
+        return ORJSONResponse
+    return JSONResponse
+
+@lru_cache(maxsize=64)
+def type_adapter(schema: Any) -> TypeAdapter:
+    return TypeAdapter(schema)
+
+def model_response(schema: Any, value: Any, from_attributes: bool = False, **kwargs: Any) -> Response:
+    """
+    A JSON response with `value` serialized as `schema`, such as
+    List[Review]. Pass from_attributes for ORM objects, which are validated
+    from their attributes first as response_model would.
+    """
+    adapter = type_adapter(schema)
+    with server_timing("serialize"):
+        if from_attributes:
+            value = adapter.validate_python(value, from_attributes=True)
+        content = adapter.dump_json(value)
+    return Response(content=content, media_type="application/json", **kwargs)
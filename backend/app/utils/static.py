@@ -0,0 +1,183 @@
+"""
+Cache-friendly serving of uploaded files.
+
+UploadFiles is StaticFiles with:
+
+- strong ETags from a SHA-256 of each file's contents (computed once per
+  file version, off the event loop), honoured by If-None-Match with a 304
+- `Cache-Control: immutable` for content-addressed paths, whose contents
+  never change under the same name, and revalidation for everything else
+- single byte ranges (206, 416), with If-Range
+- precompressed `.br` / `.gz` siblings of a file, served with
+  Content-Encoding to clients that accept them
+"""
+import hashlib
+import os
+import re
+import stat
+from functools import lru_cache
+from mimetypes import guess_type
+from typing import Dict, Optional, Tuple
+import anyio
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+from .compression import encoding_qualities
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Paths named after a SHA-256 digest, like avatars/07/<digest>_256.webp
+CONTENT_ADDRESSED = re.compile(r"(^|/)[0-9a-f]{64}(_[^/]*)?\.[^/.]+$")
+
+# Content-Encoding: file suffix, in order of preference
+PRECOMPRESSED = {"br": ".br", "gzip": ".gz"}
+
+RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+@lru_cache(maxsize=4096)
+def _digest(path: str, inode: int, mtime_ns: int, size: int) -> str:
+    # Keyed on the file's identity too, so a replaced file is hashed again
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(FileResponse.chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+async def file_etag(path: str, stat_result: os.stat_result) -> str:
+    digest = await anyio.to_thread.run_sync(
+        _digest, path, stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size
+    )
+    return f'"{digest[:32]}"'
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # Weak comparison, as If-None-Match requires
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    The first and last byte of a single `bytes=` range, or None if the
+    header isn't one. Raises ValueError if the range can't be satisfied.
+    """
+    match = RANGE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    elif last:
+        start, end = max(size - int(last), 0), size - 1
+        if int(last) == 0:
+            raise ValueError(header)
+    else:
+        return None
+    if start >= size:
+        raise ValueError(header)
+    return start, end
+
+class FileRangeResponse(FileResponse):
+    """
+    206 response with bytes `start` to `end` (inclusive) of a file.
+    """
+
+    def __init__(self, path: str, start: int, end: int, stat_result: os.stat_result, **kwargs) -> None:
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers["Content-Length"] = str(end - start + 1)
+        headers["Content-Range"] = f"bytes {start}-{end}/{stat_result.st_size}"
+        super().__init__(path, status_code=206, headers=headers, stat_result=stat_result, **kwargs)
+        self.start = start
+        self.end = end
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        remaining = self.end - self.start + 1
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            while remaining:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining:
+            # The file shrank under us; end the body
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+class UploadFiles(StaticFiles):
+    async def _lookup_file(self, path: str) -> Tuple[str, Optional[os.stat_result]]:
+        try:
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path)
+        except PermissionError:
+            raise HTTPException(status_code=401)
+        if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+            return full_path, None
+        return full_path, stat_result
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+        full_path, stat_result = await self._lookup_file(path)
+        if stat_result is None:
+            raise HTTPException(status_code=404)
+
+        request_headers = Headers(scope=scope)
+        method = scope["method"]
+        headers: Dict[str, str] = {
+            "Cache-Control": (
+                IMMUTABLE_CACHE_CONTROL if CONTENT_ADDRESSED.search(path) else REVALIDATE_CACHE_CONTROL
+            ),
+            "Accept-Ranges": "bytes",
+            "Vary": "Accept-Encoding",
+        }
+
+        # Ranges are served from the file as stored, so precompressed
+        # variants are only picked for whole-file requests
+        if "range" not in request_headers:
+            qualities = encoding_qualities(request_headers.get("accept-encoding", ""))
+            for encoding, suffix in PRECOMPRESSED.items():
+                if qualities.get(encoding, 0) > 0:
+                    encoded_path, encoded_stat = await self._lookup_file(path + suffix)
+                    if encoded_stat is not None:
+                        full_path, stat_result = encoded_path, encoded_stat
+                        headers["Content-Encoding"] = encoding
+                        break
+
+        etag = await file_etag(full_path, stat_result)
+        headers["ETag"] = etag
+        media_type = guess_type(path)[0] or "application/octet-stream"
+        response = FileResponse(
+            full_path, headers=headers, media_type=media_type, stat_result=stat_result, method=method
+        )
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            if _etag_matches(if_none_match, etag):
+                return NotModifiedResponse(response.headers)
+        elif self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if (
+            method == "GET"
+            and range_header is not None
+            and (if_range is None or if_range in (etag, response.headers["last-modified"]))
+        ):
+            try:
+                byte_range = parse_range(range_header, stat_result.st_size)
+            except ValueError:
+                return Response(
+                    status_code=416,
+                    headers={**headers, "Content-Range": f"bytes */{stat_result.st_size}"},
+                )
+            if byte_range is not None:
+                return FileRangeResponse(
+                    full_path, *byte_range, stat_result=stat_result, headers=headers, media_type=media_type
+                )
+        return response
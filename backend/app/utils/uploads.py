@@ -0,0 +1,73 @@
+"""
+Size-capped reading of multipart file uploads.
+
+The request body is parsed as it streams in and counted against a hard
+byte cap, so an oversized upload is rejected as soon as it passes the cap
+(or up front, from Content-Length) instead of after it has been written to
+disk. File data is spooled by Starlette's parser with async writes, off the
+event loop.
+"""
+from typing import AsyncIterator
+from fastapi import Request
+from multipart.exceptions import MultipartParseError
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Allowance for the multipart boundaries, part headers and form fields
+MULTIPART_OVERHEAD = 16 * 1024
+
+class UploadTooLarge(ValueError):
+    pass
+
+class InvalidUpload(ValueError):
+    pass
+
+def _too_large(max_bytes: int) -> UploadTooLarge:
+    return UploadTooLarge(f"Upload is larger than {max_bytes} bytes")
+
+async def _capped(chunks: AsyncIterator[bytes], limit: int, max_bytes: int) -> AsyncIterator[bytes]:
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if received > limit:
+            raise _too_large(max_bytes)
+        yield chunk
+
+async def read_upload(request: Request, field: str, max_bytes: int) -> bytes:
+    """
+    The contents of the file sent as `field` in a multipart/form-data body,
+    raising UploadTooLarge once the file exceeds `max_bytes`.
+    """
+    limit = max_bytes + MULTIPART_OVERHEAD
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > limit:
+        raise _too_large(max_bytes)
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise InvalidUpload("Expected a multipart/form-data body")
+
+    parser = MultiPartParser(
+        request.headers,
+        _capped(request.stream(), limit, max_bytes),
+        max_files=1,
+        max_fields=10
+    )
+    try:
+        form = await parser.parse()
+    except MultiPartException as e:
+        raise InvalidUpload(e.message)
+    except MultipartParseError:
+        raise InvalidUpload("Malformed multipart body")
+
+    upload = form.get(field)
+    try:
+        if not isinstance(upload, UploadFile):
+            raise InvalidUpload(f"Expected a file in the '{field}' field")
+        data = bytearray()
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            data += chunk
+            if len(data) > max_bytes:
+                raise _too_large(max_bytes)
+        return bytes(data)
+    finally:
+        await form.close()
@@ -0,0 +1,70 @@
+"""
+Process pools for CPU-bound work, such as password hashing and image
+processing, that would otherwise stall the event loop.
+
+A WorkerPool runs functions in a small pool of spawned processes and caps
+how many calls may be running or queued at once; a call that can't get a
+slot within queue_timeout seconds fails with the pool's busy error instead
+of piling up behind a burst of requests.
+
+Modules whose functions run in a pool are imported by the worker
+processes, so they must stay free of application imports (database,
+settings and so on). The processes are spawned, so scripts that use the
+app need the usual `if __name__ == "__main__":` guard.
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional, Type
+
+class PoolBusy(Exception):
+    pass
+
+def _warm_up() -> None:
+    pass
+
+class WorkerPool:
+    # Raised when no slot frees up within queue_timeout
+    busy_error: Type[PoolBusy] = PoolBusy
+    busy_message = "Too many operations in progress, try again shortly"
+    # Run once in each process as the pool starts, to load what calls need
+    warm_up: Callable[[], None] = staticmethod(_warm_up)
+
+    def __init__(self, workers: int, concurrency: int, queue_timeout: float):
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(concurrency)
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self) -> None:
+        """
+        Start the worker processes ahead of the first call.
+        """
+        if self._executor is None:
+            # spawn, since forking a process with running threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            for _ in range(self.workers):
+                self._executor.submit(self.warm_up)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self.busy_error(self.busy_message)
+        try:
+            self.start()
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool for the next call
+            self.shutdown()
+            raise
+        finally:
+            self._slots.release()
@@ -0,0 +1,97 @@
+"""
+Per-request latency of authenticated routes with and without the
+authenticated-user cache, and how many database connections each request
+checks out.
+
+    python -m benchmarks.auth --requests 2000
+"""
+import argparse
+import asyncio
+from datetime import timedelta
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import event, insert
+
+from app.api import auth as auth_api
+from app.api import users as users_api
+from app.models.user import User
+from app.services.cache import MemoryCacheBackend, NullCacheBackend, QueryCache
+from app.utils import auth
+from benchmarks.common import (
+    database_url,
+    make_async_session_factory,
+    make_session_factory,
+    measure_async,
+)
+
+ROUTES = ["/auth/me", "/users/me"]
+
+
+def set_cache(enabled: bool) -> None:
+    if enabled:
+        auth.token_cache = MemoryCacheBackend()
+        auth.user_cache = QueryCache(MemoryCacheBackend(), ttl=auth.AUTH_CACHE_TTL)
+    else:
+        auth.token_cache = NullCacheBackend()
+        auth.user_cache = QueryCache(NullCacheBackend())
+
+
+async def run(args: argparse.Namespace) -> None:
+    url = database_url("auth")
+    with make_session_factory(url)() as db:
+        db.execute(insert(User), [{
+            "email": "bench@example.com",
+            "hashed_password": "x",
+            "full_name": "Bench User",
+            "phone_number": "+256700000000",
+            "role": "tenant",
+        }])
+        db.commit()
+
+    AsyncSessionLocal = make_async_session_factory(url)
+    engine = AsyncSessionLocal.kw["bind"]
+    checkouts = [0]
+
+    @event.listens_for(engine.sync_engine, "checkout")
+    def count_checkout(*_):
+        checkouts[0] += 1
+
+    # Cache misses open their own session through this factory
+    auth.AsyncSessionLocal = AsyncSessionLocal
+    app = FastAPI()
+    app.include_router(auth_api.router, prefix="/auth")
+    app.include_router(users_api.router, prefix="/users")
+
+    token = auth.create_access_token({"sub": "bench@example.com"}, timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+
+    print(f"{'route':>10} {'cache':>6} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8} {'conn/req':>9}")
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        for route in ROUTES:
+            for enabled in (False, True):
+                set_cache(enabled)
+
+                async def request():
+                    response = await client.get(route, headers=headers)
+                    response.raise_for_status()
+
+                await request()  # warm up (and fill the cache)
+                checkouts[0] = 0
+                stats = await measure_async(request, args.requests)
+                print(
+                    f"{route:>10} {'on' if enabled else 'off':>6} {stats['mean']:>8.3f} "
+                    f"{stats['p50']:>8.3f} {stats['p99']:>8.3f} {checkouts[0] / args.requests:>9.2f}"
+                )
+
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Latency of an unrelated endpoint while profile pictures are uploaded, with
+the pictures decoded and resized inline on the event loop and in the
+ImageProcessor process pool.
+
+Each variant is served by uvicorn in a background thread. N clients upload
+distinct photo-sized JPEGs (so none are deduplicated) while a probe
+requests a trivial /ping route.
+
+    python -m benchmarks.avatar_upload --clients 8 --uploads 4
+"""
+import argparse
+import asyncio
+import io
+import random
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+from fastapi import FastAPI, Request
+from PIL import Image
+
+from app.utils.images import AVATAR_MAX_BYTES, ImageProcessor, process_avatar
+from app.utils.uploads import read_upload
+from benchmarks.common import summarize, timer
+from benchmarks.concurrency import ServerThread
+
+
+def make_photos(count: int, width: int, height: int, seed: int = 5) -> List[bytes]:
+    rng = random.Random(seed)
+    photos = []
+    for _ in range(count):
+        image = Image.new("RGB", (width // 8, height // 8), tuple(rng.randrange(256) for _ in range(3)))
+        image.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(image.width * image.height)])
+        out = io.BytesIO()
+        image.resize((width, height)).save(out, "JPEG", quality=90)
+        photos.append(out.getvalue())
+    return photos
+
+
+def build_app(mode: str, root: str, processor: ImageProcessor) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        data = await read_upload(request, "file", AVATAR_MAX_BYTES)
+        if mode == "inline":
+            paths = process_avatar(data, root)
+        else:
+            paths = await processor.run(process_avatar, data, root)
+        return {"variants": paths}
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+async def storm(base_url: str, photos: List[bytes], clients: int) -> Dict[str, Dict[str, float]]:
+    upload: List[float] = []
+    ping: List[float] = []
+    pending = list(photos)
+    limits = httpx.Limits(max_connections=clients + 1)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        done = asyncio.Event()
+
+        async def worker() -> None:
+            while pending:
+                photo = pending.pop()
+                with timer(upload):
+                    response = await client.post("/upload", files={"file": ("photo.jpg", photo, "image/jpeg")})
+                response.raise_for_status()
+
+        async def probe() -> None:
+            while not done.is_set():
+                with timer(ping):
+                    await client.get("/ping")
+                await asyncio.sleep(0.01)
+
+        probe_task = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe_task
+
+    stats = {"upload": summarize(upload), "ping": summarize(ping)}
+    stats["upload"]["rps"] = len(upload) / elapsed
+    return stats
+
+
+async def run(args: argparse.Namespace) -> None:
+    width, height = (int(side) for side in args.photo_size.split("x"))
+    print(f"{'variant':<13} {'uploads/s':>10} {'upload p99 ms':>14} {'ping p50 ms':>12} {'ping p99 ms':>12}")
+    for mode in ("inline", "process pool"):
+        photos = make_photos(args.clients * args.uploads, width, height, seed=len(mode))
+        processor = ImageProcessor(queue_timeout=120)
+        with tempfile.TemporaryDirectory() as root:
+            if mode == "process pool":
+                processor.start()
+                await processor.run(process_avatar, make_photos(1, 64, 64)[0], root)  # wait for the workers
+            with ServerThread(build_app(mode, root, processor)) as base_url:
+                stats = await storm(base_url, photos, args.clients)
+        processor.shutdown()
+        upload, ping = stats["upload"], stats["ping"]
+        print(
+            f"{mode:<13} {upload['rps']:>10.1f} {upload['p99']:>14.1f} "
+            f"{ping['p50']:>12.1f} {ping['p99']:>12.1f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--uploads", type=int, default=4)
+    parser.add_argument("--photo-size", default="2400x1600")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Rows per second importing listings one at a time through
+create_property (what N calls to POST /properties/ do, minus HTTP) against
+the streaming bulk import with CSV and NDJSON bodies. A separate traced
+run reports the bulk import's transient Python memory (the peak less what
+is still allocated afterwards, which is mostly the new rows in the
+in-memory search indexes) next to the size of the body.
+
+    python -m benchmarks.bulk_import --rows 5000 --single-rows 500
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import random
+import time
+import tracemalloc
+from typing import AsyncIterator, Dict, List
+
+from sqlalchemy import func, insert, select
+
+from app.models.property import Property, PropertyType
+from app.models.user import User
+from app.schemas.property import PropertyCreate, PropertyImportFormat
+from app.services import property as property_service
+from app.services import property_import
+from benchmarks.common import CITIES, database_url, make_async_session_factory, make_session_factory
+
+CHUNK_SIZE = 64 * 1024
+
+
+def make_rows(count: int, seed: int = 11) -> List[Dict[str, object]]:
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        city = rng.choice(list(CITIES))
+        rows.append({
+            "title": f"Imported listing {i}",
+            "description": "Listing from an agency feed",
+            "property_type": rng.choice(list(PropertyType)).value,
+            "address": f"Plot {i}",
+            "city": city,
+            "district": rng.choice(CITIES[city]),
+            "latitude": round(0.3476 + rng.uniform(-0.5, 0.5), 6),
+            "longitude": round(32.5825 + rng.uniform(-0.5, 0.5), 6),
+            "bedrooms": rng.randint(1, 6),
+            "price": float(rng.randrange(200_000, 10_000_000, 50_000)),
+            "has_parking": rng.random() < 0.5,
+        })
+    return rows
+
+
+def to_csv(rows: List[Dict[str, object]]) -> bytes:
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue().encode()
+
+
+def to_ndjson(rows: List[Dict[str, object]]) -> bytes:
+    return "".join(json.dumps(row) + "\n" for row in rows).encode()
+
+
+async def chunked(body: bytes) -> AsyncIterator[bytes]:
+    for start in range(0, len(body), CHUNK_SIZE):
+        yield body[start:start + CHUNK_SIZE]
+
+
+async def run(args: argparse.Namespace) -> None:
+    url = database_url("bulk_import")
+    with make_session_factory(url)() as db:
+        db.execute(insert(User), [{"email": "agency@example.com", "full_name": "Agency", "role": "property_owner"}])
+        db.commit()
+
+    AsyncSessionLocal = make_async_session_factory(url)
+    engine = AsyncSessionLocal.kw["bind"]
+    rows = make_rows(args.rows)
+    bodies = {PropertyImportFormat.CSV: to_csv(rows), PropertyImportFormat.NDJSON: to_ndjson(rows)}
+
+    print(f"{'path':<14} {'rows':>7} {'seconds':>8} {'rows/s':>9}")
+    async with AsyncSessionLocal() as db:
+        single = rows[:args.single_rows]
+        start = time.perf_counter()
+        for row in single:
+            await property_service.create_property(db, PropertyCreate(**row), 1)
+        elapsed = time.perf_counter() - start
+        print(f"{'one at a time':<14} {len(single):>7} {elapsed:>8.2f} {len(single) / elapsed:>9.0f}")
+
+        for import_format, body in bodies.items():
+            start = time.perf_counter()
+            summary = await property_import.import_properties(db, chunked(body), import_format, 1)
+            elapsed = time.perf_counter() - start
+            assert summary["imported"] == len(rows), summary
+            print(f"{'bulk ' + import_format.value:<14} {len(rows):>7} {elapsed:>8.2f} {len(rows) / elapsed:>9.0f}")
+
+        body = bodies[PropertyImportFormat.CSV]
+        tracemalloc.start()
+        await property_import.import_properties(db, chunked(body), PropertyImportFormat.CSV, 1)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"csv body {len(body) / 2**20:.2f} MB, transient import memory {(peak - retained) / 2**20:.2f} MB")
+
+        total = await db.scalar(select(func.count()).select_from(Property))
+        assert total == len(single) + len(rows) * (len(bodies) + 1), total
+
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--single-rows", type=int, default=500)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
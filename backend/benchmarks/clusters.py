@@ -0,0 +1,211 @@
+"""
+Map clustering: checks the cluster index against clustering every listing
+from scratch, at random views and zoom levels, both as loaded and after
+random moves, price changes and deletions applied incrementally. Then
+times the views served from the index, with and without filters, against
+fetching the raw points in the view, which is what the map did before.
+
+    python -m benchmarks.clusters --rows 50000
+
+Exits non-zero if any view differs from the reference.
+"""
+import argparse
+import asyncio
+import math
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import select
+
+from app.models.property import Property
+from app.schemas.property import PropertySearchParams
+from app.services import property as property_service
+from app.services.clusters import ClusterIndex, mercator
+from benchmarks.common import (
+    database_url,
+    make_async_session_factory,
+    make_session_factory,
+    measure,
+    measure_async,
+    seed_properties,
+)
+
+CENTER = (0.3476, 32.5825)
+
+Point = Tuple[float, float, float]
+
+
+def random_view(rng: random.Random, zoom: int) -> Tuple[float, float, float, float]:
+    # About a 1280x800 pixel map somewhere around the seeded area
+    width = 1280 / 256 * 360 / 2 ** zoom
+    height = width * 800 / 1280 * math.cos(math.radians(CENTER[0]))
+    latitude = CENTER[0] + rng.uniform(-0.5, 0.5)
+    longitude = CENTER[1] + rng.uniform(-0.5, 0.5)
+    return (
+        longitude - width / 2, max(-90.0, latitude - height / 2),
+        longitude + width / 2, min(90.0, latitude + height / 2),
+    )
+
+
+def reference(points: Dict[int, Point], index: ClusterIndex, bbox, zoom: int) -> Dict[str, Any]:
+    """
+    The view clustered from scratch, without the index.
+    """
+    bits = min(zoom, index.max_zoom) + index.cell_bits
+    west, south, east, north = bbox
+    if zoom > index.max_zoom:
+        ids = sorted(
+            point_id for point_id, (latitude, longitude, _) in points.items()
+            if south <= latitude <= north and west <= longitude <= east
+        )
+        return {"clusters": [], "points": ids, "total": len(ids)}
+    columns, top, bottom = index._cell_ranges(bbox, zoom)
+    cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+    for point_id, (latitude, longitude, _) in points.items():
+        x, y = mercator(latitude, longitude)
+        column = min((1 << bits) - 1, int(x * (1 << bits)))
+        row = min((1 << bits) - 1, int(y * (1 << bits)))
+        if top <= row <= bottom and any(first <= column <= last for first, last in columns):
+            cells[(column, row)].append(point_id)
+    clusters, singles = [], []
+    for key in sorted(cells, key=lambda key: (key[1], key[0])):
+        members = cells[key]
+        if len(members) == 1:
+            singles.append(members[0])
+            continue
+        clusters.append((
+            len(members),
+            sum(points[i][0] for i in members) / len(members),
+            sum(points[i][1] for i in members) / len(members),
+            min(points[i][2] for i in members),
+            max(points[i][2] for i in members),
+        ))
+    return {"clusters": clusters, "points": singles, "total": sum(len(m) for m in cells.values())}
+
+
+def same(view: Dict[str, Any], expected: Dict[str, Any]) -> bool:
+    clusters = [
+        (c["count"], c["latitude"], c["longitude"], c["min_price"], c["max_price"])
+        for c in view["clusters"]
+    ]
+    return (
+        view["total"] == expected["total"]
+        and [p["id"] for p in view["points"]] == expected["points"]
+        and len(clusters) == len(expected["clusters"])
+        and all(
+            a[0] == b[0] and a[3] == b[3] and a[4] == b[4]
+            and math.isclose(a[1], b[1], abs_tol=1e-9) and math.isclose(a[2], b[2], abs_tol=1e-9)
+            for a, b in zip(clusters, expected["clusters"])
+        )
+    )
+
+
+def check(index: ClusterIndex, points: Dict[int, Point], rng: random.Random, views: int) -> int:
+    failures = 0
+    for _ in range(views):
+        zoom = rng.randint(4, index.max_zoom + 2)
+        bbox = random_view(rng, zoom)
+        if not same(index.view(bbox, zoom), reference(points, index, bbox, zoom)):
+            failures += 1
+            print(f"FAIL zoom {zoom} bbox {bbox}", file=sys.stderr)
+    return failures
+
+
+async def run(args: argparse.Namespace) -> int:
+    url = database_url("clusters")
+    with make_session_factory(url)() as db:
+        seed_properties(db, args.rows)
+    AsyncSessionLocal = make_async_session_factory(url)
+    rng = random.Random(11)
+
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            select(Property.id, Property.latitude, Property.longitude, Property.price)
+        )).all()
+        points = {point_id: (latitude, longitude, price) for point_id, latitude, longitude, price in rows}
+
+        index = ClusterIndex()
+        started = time.perf_counter()
+        index.begin_load()
+        index.finish_load(rows)
+        print(f"{len(index)} listings, index loaded in {(time.perf_counter() - started) * 1000:.0f} ms")
+        failures = check(index, points, rng, args.views)
+
+        ids = list(points)
+        started = time.perf_counter()
+        for _ in range(args.changes):
+            position = rng.randrange(len(ids))
+            point_id = ids[position]
+            change = rng.random()
+            if change < 0.2:
+                ids[position] = ids[-1]
+                ids.pop()
+                del points[point_id]
+                index.remove(point_id)
+                continue
+            latitude, longitude, price = points[point_id]
+            if change < 0.6:
+                latitude += rng.uniform(-0.01, 0.01)
+                longitude += rng.uniform(-0.01, 0.01)
+            else:
+                price = float(rng.randrange(200_000, 10_000_000, 50_000))
+            points[point_id] = (latitude, longitude, price)
+            index.upsert(point_id, latitude, longitude, price)
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"{args.changes} incremental changes in {elapsed:.0f} ms")
+        failures += check(index, points, rng, args.views)
+        print(f"{2 * args.views} views checked, {failures} mismatched")
+
+        # The service's index, loaded from the database, for the timings
+        await property_service.get_property_clusters(db, random_view(rng, 12), 12)
+        filters = PropertySearchParams(min_price=500_000, bedrooms=2)
+        print(f"{'zoom':>5} {'total':>7} {'markers':>8} {'index ms':>9} {'filtered ms':>12} {'raw ms':>8}")
+        for zoom in (int(z) for z in args.zooms.split(",")):
+            views = [random_view(rng, zoom) for _ in range(args.repeat)]
+            sample = await property_service.get_property_clusters(db, views[0], zoom)
+            queue = iter(views * 3)
+
+            def unfiltered():
+                return index.view(next(queue), zoom)
+
+            async def filtered():
+                return await property_service.get_property_clusters(db, next(queue), zoom, filters)
+
+            async def raw():
+                west, south, east, north = next(queue)
+                result = await db.execute(
+                    select(Property.id, Property.latitude, Property.longitude, Property.price).where(
+                        Property.latitude.between(south, north),
+                        Property.longitude.between(west, east)
+                    )
+                )
+                return result.all()
+
+            indexed = measure(unfiltered, args.repeat)
+            narrowed = await measure_async(filtered, args.repeat)
+            fetched = await measure_async(raw, args.repeat)
+            markers = len(sample.clusters) + len(sample.points)
+            print(
+                f"{zoom:>5} {sample.total:>7} {markers:>8} {indexed['mean']:>9.2f} "
+                f"{narrowed['mean']:>12.2f} {fetched['mean']:>8.2f}"
+            )
+
+    await AsyncSessionLocal.kw["bind"].dispose()
+    return 1 if failures else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--views", type=int, default=200, help="random views checked against the reference")
+    parser.add_argument("--changes", type=int, default=5_000)
+    parser.add_argument("--zooms", default="8,10,12,14,17")
+    parser.add_argument("--repeat", type=int, default=20)
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
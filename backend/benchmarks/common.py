@@ -0,0 +1,128 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Benchmarks run against DATABASE_URL when it is set, otherwise against a
+throwaway SQLite file so they can run without a database server.
+"""
+import os
+import random
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, get_async_database_url
+from app.models.user import User
+from app.models.property import Property, PropertyType, PropertyStatus
+from app.models.message import Message
+from app.models.review import Review
+
+CITIES = {
+    "Kampala": ["Nakawa", "Makindye", "Rubaga", "Kawempe", "Central"],
+    "Wakiso": ["Entebbe", "Kira", "Nansana", "Kajjansi"],
+    "Mukono": ["Seeta", "Goma", "Nama"],
+    "Jinja": ["Bugembe", "Walukuba", "Mpumudde"],
+    "Gulu": ["Laroo", "Pece", "Bardege"],
+    "Mbarara": ["Kakoba", "Nyamitanga", "Kamukuzi"],
+}
+
+
+def database_url(default_name: str) -> str:
+    url = os.getenv("DATABASE_URL")
+    if url:
+        return url
+    path = os.path.join(tempfile.gettempdir(), f"tenantconnect_{default_name}.db")
+    if os.path.exists(path):
+        os.remove(path)
+    return f"sqlite:///{path}"
+
+
+def make_session_factory(url: str) -> sessionmaker:
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def make_async_session_factory(url: str) -> async_sessionmaker:
+    engine = create_async_engine(get_async_database_url(url))
+    return async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+
+def seed_properties(db, count: int, owners: int = 50, seed: int = 42) -> None:
+    rng = random.Random(seed)
+    db.execute(insert(User), [
+        {
+            "email": f"owner{i}@example.com",
+            "hashed_password": "x",
+            "full_name": f"Owner {i}",
+            "phone_number": "+256700000000",
+            "role": "property_owner",
+        }
+        for i in range(owners)
+    ])
+    start = datetime(2023, 1, 1)
+    batch = []
+    for i in range(count):
+        city = rng.choice(list(CITIES))
+        batch.append({
+            "title": f"Listing {i}",
+            "description": "Benchmark listing",
+            "property_type": rng.choice(list(PropertyType)),
+            "status": PropertyStatus.AVAILABLE,
+            "address": f"Plot {i}",
+            "city": city,
+            "district": rng.choice(CITIES[city]),
+            "latitude": 0.3476 + rng.uniform(-0.5, 0.5),
+            "longitude": 32.5825 + rng.uniform(-0.5, 0.5),
+            "bedrooms": rng.randint(1, 6),
+            "bathrooms": rng.randint(1, 4),
+            "area": rng.uniform(30, 400),
+            "price": float(rng.randrange(200_000, 10_000_000, 50_000)),
+            "owner_id": rng.randint(1, owners),
+            "created_at": start + timedelta(minutes=i),
+        })
+        if len(batch) == 5000:
+            db.execute(insert(Property), batch)
+            batch = []
+    if batch:
+        db.execute(insert(Property), batch)
+    db.commit()
+
+
+@contextmanager
+def timer(samples: List[float]):
+    start = time.perf_counter()
+    yield
+    samples.append((time.perf_counter() - start) * 1000)
+
+
+def measure(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    samples: List[float] = []
+    for _ in range(repeat):
+        with timer(samples):
+            fn()
+    return summarize(samples)
+
+
+async def measure_async(fn: Callable[[], Awaitable[object]], repeat: int) -> Dict[str, float]:
+    samples: List[float] = []
+    for _ in range(repeat):
+        with timer(samples):
+            await fn()
+    return summarize(samples)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "mean": statistics.fmean(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "p99": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+    }
@@ -0,0 +1,153 @@
+"""
+Throughput and tail latency of N parallel clients running the same property
+search through a sync Session inside an `async def` route (the old pattern,
+which blocks the event loop) and through an AsyncSession.
+
+Each variant is served by uvicorn in a background thread. While the search
+clients run, a probe requests a trivial /ping route to show how long
+unrelated requests wait behind database work.
+
+    python -m benchmarks.concurrency --rows 50000 --clients 50 --requests 20
+"""
+import argparse
+import asyncio
+import socket
+import threading
+import time
+from typing import Dict, List
+
+import httpx
+import uvicorn
+from fastapi import Depends, FastAPI
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.property import Property
+from app.schemas.property import PropertySearchParams
+from app.services.property import apply_search_filters
+from benchmarks.common import (
+    database_url,
+    make_async_session_factory,
+    make_session_factory,
+    seed_properties,
+    summarize,
+    timer,
+)
+
+SEARCH = apply_search_filters(
+    select(Property),
+    PropertySearchParams(city="kampala", min_price=500_000, max_price=2_000_000),
+).order_by(Property.created_at.desc()).limit(20)
+
+
+def build_apps(url: str) -> Dict[str, FastAPI]:
+    SessionLocal = make_session_factory(url)
+    AsyncSessionLocal = make_async_session_factory(url)
+
+    async def get_async_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    blocking = FastAPI()
+
+    @blocking.get("/search")
+    async def blocking_search():
+        with SessionLocal() as db:
+            return len(db.execute(SEARCH).scalars().all())
+
+    non_blocking = FastAPI()
+
+    @non_blocking.get("/search")
+    async def async_search(db: AsyncSession = Depends(get_async_db)):
+        result = await db.execute(SEARCH)
+        return len(result.scalars().all())
+
+    async def ping():
+        return {"ok": True}
+
+    for app in (blocking, non_blocking):
+        app.get("/ping")(ping)
+    return {"sync session": blocking, "async session": non_blocking}
+
+
+class ServerThread(threading.Thread):
+    def __init__(self, app: FastAPI):
+        super().__init__(daemon=True)
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.server = uvicorn.Server(
+            uvicorn.Config(app, port=self.port, log_level="warning", limit_concurrency=10_000)
+        )
+
+    def run(self) -> None:
+        self.server.run()
+
+    def __enter__(self) -> str:
+        self.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return f"http://127.0.0.1:{self.port}"
+
+    def __exit__(self, *exc) -> None:
+        self.server.should_exit = True
+        self.join()
+
+
+async def run_clients(base_url: str, clients: int, requests: int) -> Dict[str, Dict[str, float]]:
+    search: List[float] = []
+    ping: List[float] = []
+    limits = httpx.Limits(max_connections=clients + 1)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        done = asyncio.Event()
+
+        async def worker() -> None:
+            for _ in range(requests):
+                with timer(search):
+                    response = await client.get("/search")
+                response.raise_for_status()
+
+        async def probe() -> None:
+            while not done.is_set():
+                with timer(ping):
+                    await client.get("/ping")
+                await asyncio.sleep(0.005)
+
+        probe_task = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe_task
+
+    stats = {"search": summarize(search), "ping": summarize(ping)}
+    stats["search"]["rps"] = len(search) / elapsed
+    return stats
+
+
+async def run(args: argparse.Namespace) -> None:
+    url = database_url("concurrency")
+    with make_session_factory(url)() as db:
+        seed_properties(db, args.rows)
+
+    print(f"{'variant':<14} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'ping p99 ms':>12}")
+    for name, app in build_apps(url).items():
+        with ServerThread(app) as base_url:
+            stats = await run_clients(base_url, args.clients, args.requests)
+        search, ping = stats["search"], stats["ping"]
+        print(
+            f"{name:<14} {search['rps']:>8.1f} {search['p50']:>8.1f} "
+            f"{search['p99']:>8.1f} {ping['p99']:>12.1f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+Seeded synthetic data: property owners and tenants, listings across Ugandan
+cities and districts, message threads between tenants and owners, and
+reviews, at a preset or custom scale. The same seed and scale always give
+the same rows (and, on an empty database, the same ids).
+
+Every user's password is DATAGEN_PASSWORD, hashed once at BCRYPT_ROUNDS.
+Rating summaries are filled in on the listings, as the review service would.
+
+    python -m benchmarks.datagen --scale medium --seed 1
+    python -m benchmarks.datagen --scale small --properties 5000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import func, insert, select
+
+from app.models.message import Message
+from app.models.property import Property, PropertyStatus, PropertyType
+from app.models.review import Review
+from app.models.user import User
+from app.services.review import star
+from app.utils.passwords import get_password_hash
+from benchmarks.common import CITIES, database_url, make_session_factory
+
+DATAGEN_PASSWORD = "benchmark-password"
+
+SCALES = {
+    "small": {
+        "owners": 20, "tenants": 200, "properties": 1_000,
+        "threads": 500, "messages": 8, "reviews": 3,
+    },
+    "medium": {
+        "owners": 100, "tenants": 2_000, "properties": 20_000,
+        "threads": 5_000, "messages": 12, "reviews": 4,
+    },
+    "large": {
+        "owners": 500, "tenants": 20_000, "properties": 200_000,
+        "threads": 50_000, "messages": 15, "reviews": 5,
+    },
+}
+
+# City centres; listings are scattered within about 10 km
+CITY_CENTRES = {
+    "Kampala": (0.3476, 32.5825),
+    "Wakiso": (0.4044, 32.4594),
+    "Mukono": (0.3533, 32.7553),
+    "Jinja": (0.4244, 33.2042),
+    "Gulu": (2.7724, 32.2881),
+    "Mbarara": (-0.6072, 30.6545),
+}
+# Relative share of listings
+CITY_WEIGHTS = {"Kampala": 45, "Wakiso": 25, "Mukono": 10, "Jinja": 8, "Gulu": 6, "Mbarara": 6}
+
+# Monthly rent range in UGX, and bedroom range, by type
+PRICES = {
+    PropertyType.APARTMENT: (400_000, 4_000_000, (1, 3)),
+    PropertyType.HOUSE: (600_000, 8_000_000, (2, 5)),
+    PropertyType.VILLA: (3_000_000, 25_000_000, (3, 7)),
+    PropertyType.COMMERCIAL: (1_000_000, 30_000_000, (0, 0)),
+    PropertyType.LAND: (200_000, 5_000_000, (0, 0)),
+}
+TYPE_WEIGHTS = {
+    PropertyType.APARTMENT: 40, PropertyType.HOUSE: 35, PropertyType.VILLA: 5,
+    PropertyType.COMMERCIAL: 12, PropertyType.LAND: 8,
+}
+
+FIRST_NAMES = [
+    "Aisha", "Brian", "Catherine", "Daniel", "Esther", "Francis", "Grace", "Henry",
+    "Irene", "Joseph", "Juliet", "Kenneth", "Lydia", "Moses", "Norah", "Patrick",
+    "Ruth", "Samuel", "Sarah", "Timothy", "Winnie", "Yusuf",
+]
+SURNAMES = [
+    "Akello", "Babirye", "Kato", "Mugisha", "Nakato", "Namukasa", "Ochieng", "Okello",
+    "Opio", "Ssemakula", "Tumusiime", "Wasswa", "Kiggundu", "Nabirye", "Atim", "Byaruhanga",
+]
+FEATURES = [
+    "tiled floors", "a fitted kitchen", "a borehole", "solar backup", "a gated compound",
+    "a balcony", "a garden", "en-suite bedrooms", "a servants' quarter", "fibre internet",
+]
+OPENERS = [
+    "Hello, is this still available?",
+    "Good morning, I'm interested in viewing this place.",
+    "Is the price negotiable?",
+    "Hi, when can I move in?",
+]
+REPLIES = [
+    "Yes, it's still available.",
+    "You can view it on Saturday morning.",
+    "The rent is slightly negotiable for a long lease.",
+    "Water and security are included.",
+    "Please bring a copy of your ID for the viewing.",
+    "Sure, let me know what time works for you.",
+]
+REVIEW_COMMENTS = {
+    1: "Not as advertised, and the landlord was unresponsive.",
+    2: "Frequent water cuts and poor security.",
+    3: "Decent place, but the road is bad in the rainy season.",
+    4: "Good value and a quiet neighbourhood.",
+    5: "Excellent, well kept and the owner is very helpful.",
+}
+
+
+def _name(rng: random.Random) -> str:
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(SURNAMES)}"
+
+
+def _phone(rng: random.Random) -> str:
+    return f"+2567{rng.choice('0578')}{rng.randrange(10_000_000):07d}"
+
+
+def _rating(rng: random.Random) -> float:
+    # Skewed towards good reviews, as real ones are
+    return float(rng.choices([1, 2, 3, 4, 5], weights=[5, 7, 18, 35, 35])[0])
+
+
+def _users(db, rng: random.Random, role: str, prefix: str, count: int, hashed: str, start: datetime) -> List[int]:
+    rows = [
+        {
+            "email": f"{prefix}{i}@example.com",
+            "hashed_password": hashed,
+            "full_name": _name(rng),
+            "phone_number": _phone(rng),
+            "role": role,
+            "is_verified": rng.random() < 0.6,
+            "created_at": start + timedelta(hours=i),
+        }
+        for i in range(count)
+    ]
+    ids = []
+    statement = insert(User).returning(User.id, sort_by_parameter_order=True)
+    for offset in range(0, len(rows), 5000):
+        ids += db.execute(statement, rows[offset:offset + 5000]).scalars().all()
+    return ids
+
+
+def _listing(rng: random.Random, owner_id: int, created_at: datetime) -> Dict[str, object]:
+    city = rng.choices(list(CITY_WEIGHTS), weights=list(CITY_WEIGHTS.values()))[0]
+    district = rng.choice(CITIES[city])
+    property_type = rng.choices(list(TYPE_WEIGHTS), weights=list(TYPE_WEIGHTS.values()))[0]
+    low, high, (min_bedrooms, max_bedrooms) = PRICES[property_type]
+    bedrooms = rng.randint(min_bedrooms, max_bedrooms)
+    latitude, longitude = CITY_CENTRES[city]
+    features = rng.sample(FEATURES, 3)
+    if bedrooms:
+        title = f"{bedrooms} bedroom {property_type.value} in {district}"
+    else:
+        title = f"{property_type.value.capitalize()} to let in {district}"
+    return {
+        "title": title,
+        "description": f"{title}, {city}. Comes with {features[0]}, {features[1]} and {features[2]}.",
+        "property_type": property_type,
+        "status": rng.choices(
+            [PropertyStatus.AVAILABLE, PropertyStatus.RENTED, PropertyStatus.MAINTENANCE],
+            weights=[80, 17, 3]
+        )[0],
+        "address": f"Plot {rng.randint(1, 400)}, {district} Road",
+        "city": city,
+        "district": district,
+        "latitude": round(latitude + rng.gauss(0, 0.05), 6),
+        "longitude": round(longitude + rng.gauss(0, 0.05), 6),
+        "bedrooms": bedrooms,
+        "bathrooms": max(1, bedrooms - rng.randint(0, 1)),
+        "area": round(rng.uniform(25, 60) * max(bedrooms, 1) + rng.uniform(0, 40), 1),
+        # Rounded to 50,000 like real asking prices
+        "price": float(round(rng.uniform(low, high) / 50_000) * 50_000 or 50_000),
+        "is_furnished": rng.random() < 0.3,
+        "has_parking": rng.random() < 0.55,
+        "has_security": rng.random() < 0.6,
+        "has_water": rng.random() < 0.95,
+        "has_electricity": rng.random() < 0.97,
+        "owner_id": owner_id,
+        "created_at": created_at,
+    }
+
+
+def generate(db, scale: Dict[str, int], seed: int = 1) -> Dict[str, int]:
+    """
+    Insert a data set of the given scale, returning the number of rows of
+    each kind.
+    """
+    rng = random.Random(seed)
+    start = datetime(2023, 1, 1)
+    hashed = get_password_hash(DATAGEN_PASSWORD)
+    owner_ids = _users(db, rng, "property_owner", "owner", scale["owners"], hashed, start)
+    tenant_ids = _users(db, rng, "tenant", "tenant", scale["tenants"], hashed, start)
+
+    # Listings and their reviews, with the rating summary each listing
+    # would have after its reviews were written
+    property_ids: List[int] = []
+    property_owner: Dict[int, int] = {}
+    review_rows = []
+    reviews_to_attach: List[List[Dict[str, object]]] = []
+    batch: List[Dict[str, object]] = []
+
+    def flush() -> None:
+        ids = db.execute(insert(Property).returning(
+            Property.id, Property.owner_id, sort_by_parameter_order=True
+        ), batch).all()
+        for (property_id, owner_id), reviews in zip(ids, reviews_to_attach):
+            property_ids.append(property_id)
+            property_owner[property_id] = owner_id
+            for review in reviews:
+                review["property_id"] = property_id
+            review_rows.extend(reviews)
+        batch.clear()
+        reviews_to_attach.clear()
+
+    for number in range(scale["properties"]):
+        listing = _listing(rng, rng.choice(owner_ids), start + timedelta(minutes=number * 7))
+        count = min(rng.randint(0, scale["reviews"] * 2), len(tenant_ids))
+        reviews = []
+        for reviewer_id in rng.sample(tenant_ids, count):
+            rating = _rating(rng)
+            reviews.append({
+                "reviewer_id": reviewer_id,
+                "rating": rating,
+                "comment": REVIEW_COMMENTS[int(rating)],
+                "created_at": listing["created_at"] + timedelta(days=rng.randint(1, 300)),
+            })
+        ratings = [review["rating"] for review in reviews]
+        listing.update({
+            "rating_count": len(ratings),
+            "rating_sum": sum(ratings),
+            "rating_average": sum(ratings) / len(ratings) if ratings else 0,
+            **{f"rating_{n}_count": sum(1 for rating in ratings if star(rating) == n) for n in range(1, 6)},
+        })
+        batch.append(listing)
+        reviews_to_attach.append(reviews)
+        if len(batch) == 5000:
+            flush()
+    if batch:
+        flush()
+    for offset in range(0, len(review_rows), 5000):
+        db.execute(insert(Review), review_rows[offset:offset + 5000])
+
+    # Threads alternate between a tenant and the listing's owner, and only
+    # the tail of a thread may still be unread
+    message_rows = []
+    threads = set()
+    while len(threads) < min(scale["threads"], len(tenant_ids) * len(property_ids)):
+        threads.add((rng.choice(tenant_ids), rng.choice(property_ids)))
+    for tenant_id, property_id in sorted(threads):
+        owner_id = property_owner[property_id]
+        sent_at = start + timedelta(minutes=rng.randrange(60 * 24 * 600))
+        length = rng.randint(1, scale["messages"] * 2 - 1)
+        for n in range(length):
+            from_tenant = n % 2 == 0
+            sent_at += timedelta(minutes=rng.randint(1, 60 * 24))
+            message_rows.append({
+                "sender_id": tenant_id if from_tenant else owner_id,
+                "receiver_id": owner_id if from_tenant else tenant_id,
+                "property_id": property_id,
+                "content": rng.choice(OPENERS) if n == 0 else rng.choice(REPLIES),
+                "is_read": n < length - 2 or rng.random() < 0.5,
+                "created_at": sent_at,
+            })
+        if len(message_rows) >= 5000:
+            db.execute(insert(Message), message_rows)
+            message_rows = []
+    if message_rows:
+        db.execute(insert(Message), message_rows)
+    db.commit()
+
+    counts = {}
+    for name, model in (("users", User), ("properties", Property), ("reviews", Review), ("messages", Message)):
+        counts[name] = db.scalar(select(func.count()).select_from(model))
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=1)
+    for name in SCALES["small"]:
+        parser.add_argument(f"--{name}", type=int, help=f"override the scale's {name}")
+    args = parser.parse_args()
+    scale = {name: getattr(args, name) or value for name, value in SCALES[args.scale].items()}
+
+    url = database_url("datagen")
+    started = time.perf_counter()
+    with make_session_factory(url)() as db:
+        counts = generate(db, scale, args.seed)
+    print(f"{url}: " + ", ".join(f"{count} {name}" for name, count in counts.items()))
+    print(f"generated in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
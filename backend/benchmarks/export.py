@@ -0,0 +1,95 @@
+"""
+Exporting every property: the streaming NDJSON export against scraping
+GET /properties/ page by page with skip/limit, at several table sizes.
+Reports rows per second and peak Python memory (server and client) while
+the export runs, which should stay flat as the table grows.
+
+Served by uvicorn in a background thread, since httpx's in-process ASGI
+transport buffers whole responses. The listings cache is turned off.
+
+    python -m benchmarks.export --rows 10000,50000 --page-size 100
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+import httpx
+from fastapi import FastAPI
+
+from app.api import properties as properties_api
+from app.services import cache, export
+from benchmarks.common import database_url, make_async_session_factory, make_session_factory, seed_properties
+from benchmarks.concurrency import ServerThread
+
+
+async def scrape(client: httpx.AsyncClient, page_size: int) -> int:
+    rows = skip = 0
+    while True:
+        response = await client.get("/properties/", params={"skip": skip, "limit": page_size})
+        response.raise_for_status()
+        count = len(response.json())
+        rows += count
+        skip += page_size
+        if count < page_size:
+            return rows
+
+
+async def stream(client: httpx.AsyncClient, gzip: bool) -> int:
+    rows = 0
+    async with client.stream("GET", "/properties/export", params={"gzip": gzip}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            rows += bool(line)
+    return rows
+
+
+async def run(args: argparse.Namespace) -> None:
+    cache._query_cache = cache.QueryCache(cache.NullCacheBackend())
+    print(f"{'rows':>7} {'path':<13} {'seconds':>8} {'rows/s':>9} {'peak MB':>8}")
+    for count in (int(rows) for rows in args.rows.split(",")):
+        url = database_url(f"export_{count}")
+        with make_session_factory(url)() as db:
+            seed_properties(db, count)
+
+        # Only used from the server thread's event loop
+        AsyncSessionLocal = make_async_session_factory(url)
+        export.AsyncSessionLocal = AsyncSessionLocal
+
+        async def get_db():
+            async with AsyncSessionLocal() as db:
+                yield db
+
+        app = FastAPI()
+        app.include_router(properties_api.router, prefix="/properties")
+        app.dependency_overrides[properties_api.get_async_db] = get_db
+
+        variants = [
+            ("skip/limit", lambda client: scrape(client, args.page_size)),
+            ("export", lambda client: stream(client, False)),
+            ("export gzip", lambda client: stream(client, True)),
+        ]
+        with ServerThread(app) as base_url:
+            async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+                for name, fn in variants:
+                    tracemalloc.start()
+                    start = time.perf_counter()
+                    rows = await fn(client)
+                    elapsed = time.perf_counter() - start
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    assert rows == count, (name, rows)
+                    print(f"{count:>7} {name:<13} {elapsed:>8.2f} {rows / elapsed:>9.0f} {peak / 2**20:>8.2f}")
+
+        await AsyncSessionLocal.kw["bind"].dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", default="10000,50000")
+    parser.add_argument("--page-size", type=int, default=100)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Radius search latency: a linear haversine scan over every listing against
+the spatial index (the in-memory grid on SQLite, or PostGIS with its GiST
+index when DATABASE_URL points at a migrated PostgreSQL database), and the
+end-to-end first page of a distance-ordered search.
+
+    python -m benchmarks.geo --rows 120000 --radii 1,2,5,10
+
+On PostgreSQL run `alembic upgrade head` against DATABASE_URL first so the
+geom column and its index exist.
+"""
+import argparse
+import asyncio
+import random
+
+from sqlalchemy import select
+
+from app.models.property import Property
+from app.schemas.property import PropertySearchParams, PropertySort
+from app.services import geo
+from app.services import property as property_service
+from benchmarks.common import (
+    database_url,
+    make_async_session_factory,
+    make_session_factory,
+    measure,
+    measure_async,
+    seed_properties,
+)
+
+CENTER = (0.3476, 32.5825)
+
+
+async def run(args: argparse.Namespace) -> None:
+    url = database_url("geo")
+    with make_session_factory(url)() as db:
+        seed_properties(db, args.rows)
+
+    AsyncSessionLocal = make_async_session_factory(url)
+    rng = random.Random(7)
+    centers = [
+        (CENTER[0] + rng.uniform(-0.3, 0.3), CENTER[1] + rng.uniform(-0.3, 0.3))
+        for _ in range(args.repeat)
+    ]
+
+    async with AsyncSessionLocal() as db:
+        postgis = geo.use_postgis(db)
+        points = (await db.execute(
+            select(Property.id, Property.latitude, Property.longitude)
+        )).all()
+        if not postgis:
+            await geo.ensure_grid_loaded(db)
+        print(f"{len(points)} listings, index: {'postgis' if postgis else 'grid'}")
+
+        print(f"{'radius km':>10} {'matches':>8} {'scan ms':>9} {'index ms':>9} {'page ms':>9}")
+        for radius in (float(r) for r in args.radii.split(",")):
+            queries = iter(centers * 3)
+
+            def scan():
+                lat, lon = next(queries)
+                return [
+                    (point_id, d)
+                    for point_id, plat, plon in points
+                    if (d := geo.haversine_km(lat, lon, plat, plon)) <= radius
+                ]
+
+            async def index_search():
+                lat, lon = next(queries)
+                if not postgis:
+                    return geo.grid_index.within(lat, lon, radius)
+                result = await db.execute(
+                    select(Property.id).where(geo.postgis_within(lat, lon, radius))
+                )
+                return result.all()
+
+            async def page():
+                lat, lon = next(queries)
+                params = PropertySearchParams(latitude=lat, longitude=lon, radius=radius)
+                properties, _ = await property_service.search_properties(
+                    db, params, PropertySort.DISTANCE, args.page_size
+                )
+                db.expunge_all()
+                return properties
+
+            matches = len(scan())
+            queries = iter(centers * 3)
+            scanned = measure(scan, args.repeat)
+            indexed = await measure_async(index_search, args.repeat)
+            paged = await measure_async(page, args.repeat)
+            print(
+                f"{radius:>10.1f} {matches:>8} {scanned['mean']:>9.2f} "
+                f"{indexed['mean']:>9.2f} {paged['mean']:>9.2f}"
+            )
+
+    await AsyncSessionLocal.kw["bind"].dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=120_000)
+    parser.add_argument("--radii", default="1,2,5,10")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
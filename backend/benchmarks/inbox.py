@@ -0,0 +1,94 @@
+"""
+Conversation inbox: statements issued and latency as the number of
+conversations grows. Exits non-zero if the statement count is not constant.
+
+    python -m benchmarks.inbox --conversations 10,100,1000 --messages 20
+"""
+import argparse
+import asyncio
+import random
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, insert
+
+from app.models.message import Message
+from app.models.property import Property, PropertyType
+from app.models.user import User
+from app.services import message as message_service
+from benchmarks.common import database_url, make_async_session_factory, make_session_factory, measure_async
+
+
+def seed_inbox(db, conversations: int, messages: int, seed: int = 7) -> None:
+    rng = random.Random(seed)
+    db.execute(insert(User), [
+        {"email": f"user{i}@example.com", "full_name": f"User {i}", "role": "tenant"}
+        for i in range(conversations + 1)
+    ])
+    db.execute(insert(Property), [
+        {
+            "title": f"Listing {i}", "property_type": PropertyType.HOUSE,
+            "address": "Plot 1", "city": "Kampala", "price": 1_000_000.0, "owner_id": 1,
+        }
+        for i in range(conversations)
+    ])
+    start = datetime(2024, 1, 1)
+    rows = []
+    for other in range(2, conversations + 2):
+        for n in range(messages):
+            incoming = rng.random() < 0.5
+            rows.append({
+                "sender_id": other if incoming else 1,
+                "receiver_id": 1 if incoming else other,
+                "property_id": other - 1,
+                "content": f"Message {n}",
+                "is_read": not incoming or rng.random() < 0.7,
+                "created_at": start + timedelta(seconds=rng.randrange(10_000_000)),
+            })
+    db.execute(insert(Message), rows)
+    db.commit()
+
+
+async def run(args: argparse.Namespace) -> int:
+    counts = set()
+    print(f"{'conversations':>14} {'statements':>11} {'mean ms':>9} {'p99 ms':>9}")
+    for conversations in (int(c) for c in args.conversations.split(",")):
+        url = database_url(f"inbox_{conversations}")
+        with make_session_factory(url)() as db:
+            seed_inbox(db, conversations, args.messages)
+
+        AsyncSessionLocal = make_async_session_factory(url)
+        engine = AsyncSessionLocal.kw["bind"]
+        statements = []
+        event.listen(
+            engine.sync_engine, "before_cursor_execute",
+            lambda *a, **kw: statements.append(a[2])
+        )
+        async with AsyncSessionLocal() as db:
+            await message_service.get_conversations(db, 1, args.limit)
+            issued = len(statements)
+            stats = await measure_async(
+                lambda: message_service.get_conversations(db, 1, args.limit), args.repeat
+            )
+        await engine.dispose()
+
+        counts.add(issued)
+        print(f"{conversations:>14} {issued:>11} {stats['mean']:>9.2f} {stats['p99']:>9.2f}")
+
+    if len(counts) != 1:
+        print("statement count grows with the number of conversations", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--conversations", default="10,100,1000")
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=10)
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Cost of the performance instrumentation: a request through
+MetricsMiddleware, with and without Server-Timing, against the same trivial
+ASGI app unwrapped; and a SQL statement with and without the engine's
+cursor hooks. Then the time to render /metrics with that many series.
+
+    python -m benchmarks.instrumentation --repeat 20000
+"""
+import argparse
+import asyncio
+from typing import Dict
+
+from sqlalchemy import create_engine, text
+
+from app.utils.metrics import MetricsMiddleware, instrument_engine, render
+from benchmarks.common import measure, measure_async
+
+SCOPE = {"type": "http", "method": "GET", "path": "/ping", "headers": [], "root_path": ""}
+
+
+async def ping(scope, receive, send) -> None:
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": b'{"ok":true}'})
+
+
+async def receive() -> dict:
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message: dict) -> None:
+    pass
+
+
+def report(name: str, stats: Dict[str, float], baseline: Dict[str, float]) -> None:
+    overhead = (stats["mean"] - baseline["mean"]) * 1000
+    print(f"{name:<28} {stats['mean'] * 1000:>9.1f} {stats['p99'] * 1000:>9.1f} {overhead:>+10.1f}")
+
+
+async def requests(repeat: int) -> None:
+    apps = {
+        "no middleware": ping,
+        "metrics": MetricsMiddleware(ping, server_timing=False),
+        "metrics + server-timing": MetricsMiddleware(ping, server_timing=True),
+    }
+    print(f"{'request':<28} {'mean us':>9} {'p99 us':>9} {'overhead us':>10}")
+    baseline = None
+    for name, app in apps.items():
+        stats = await measure_async(lambda: app(dict(SCOPE), receive, send), repeat)
+        baseline = baseline or stats
+        report(name, stats, baseline)
+
+
+def statements(repeat: int) -> None:
+    print(f"\n{'statement':<28} {'mean us':>9} {'p99 us':>9} {'overhead us':>10}")
+    baseline = None
+    for name, instrumented in (("SELECT 1", False), ("SELECT 1, instrumented", True)):
+        engine = create_engine("sqlite://")
+        if instrumented:
+            instrument_engine(engine)
+        with engine.connect() as connection:
+            stats = measure(lambda: connection.execute(text("SELECT 1")).scalar(), repeat)
+        engine.dispose()
+        baseline = baseline or stats
+        report(name, stats, baseline)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(requests(args.repeat))
+    statements(args.repeat)
+    stats = measure(render, 200)
+    print(f"\nrender /metrics: {stats['mean']:.2f} ms mean, {len(render().splitlines())} lines")
+
+
+if __name__ == "__main__":
+    main()
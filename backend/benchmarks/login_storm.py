@@ -0,0 +1,119 @@
+"""
+Latency of an unrelated endpoint during a login storm, with bcrypt run
+inline on the event loop, in the thread pool, and in the PasswordHasher
+process pool.
+
+Each variant is served by uvicorn in a background thread. N clients log in
+repeatedly while a probe requests a trivial /ping route.
+
+    python -m benchmarks.login_storm --clients 20 --logins 5
+"""
+import argparse
+import asyncio
+import time
+from typing import Dict, List
+
+import httpx
+from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from app.utils.passwords import (
+    HashingBusy,
+    PasswordHasher,
+    get_password_hash,
+    verify_and_update_password,
+)
+from benchmarks.common import summarize, timer
+from benchmarks.concurrency import ServerThread
+
+PASSWORD = "correct horse battery staple"
+
+
+def build_app(mode: str, hashed: str, hasher: PasswordHasher) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/login")
+    async def login():
+        if mode == "inline":
+            valid, _ = verify_and_update_password(PASSWORD, hashed)
+        elif mode == "thread pool":
+            valid, _ = await run_in_threadpool(verify_and_update_password, PASSWORD, hashed)
+        else:
+            try:
+                valid, _ = await hasher.verify(PASSWORD, hashed)
+            except HashingBusy:
+                raise HTTPException(status_code=503)
+        return {"valid": valid}
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+async def storm(base_url: str, clients: int, logins: int) -> Dict[str, Dict[str, float]]:
+    login: List[float] = []
+    ping: List[float] = []
+    rejected = 0
+    limits = httpx.Limits(max_connections=clients + 1)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        done = asyncio.Event()
+
+        async def worker() -> None:
+            nonlocal rejected
+            for _ in range(logins):
+                with timer(login):
+                    response = await client.post("/login")
+                if response.status_code == 503:
+                    rejected += 1
+                else:
+                    response.raise_for_status()
+
+        async def probe() -> None:
+            while not done.is_set():
+                with timer(ping):
+                    await client.get("/ping")
+                await asyncio.sleep(0.01)
+
+        probe_task = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe_task
+
+    stats = {"login": summarize(login), "ping": summarize(ping)}
+    stats["login"]["rps"] = len(login) / elapsed
+    stats["login"]["rejected"] = rejected
+    return stats
+
+
+async def run(args: argparse.Namespace) -> None:
+    hashed = get_password_hash(PASSWORD)
+    print(f"{'variant':<13} {'logins/s':>9} {'login p99 ms':>13} {'503s':>5} {'ping p50 ms':>12} {'ping p99 ms':>12}")
+    for mode in ("inline", "thread pool", "process pool"):
+        hasher = PasswordHasher(queue_timeout=args.queue_timeout)
+        if mode == "process pool":
+            hasher.start()
+            await hasher.verify(PASSWORD, hashed)  # wait for the workers to come up
+        with ServerThread(build_app(mode, hashed, hasher)) as base_url:
+            stats = await storm(base_url, args.clients, args.logins)
+        hasher.shutdown()
+        login, ping = stats["login"], stats["ping"]
+        print(
+            f"{mode:<13} {login['rps']:>9.1f} {login['p99']:>13.1f} {login['rejected']:>5} "
+            f"{ping['p50']:>12.1f} {ping['p99']:>12.1f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--logins", type=int, default=5)
+    parser.add_argument("--queue-timeout", type=float, default=30.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Compare page-N latency of OFFSET pagination and keyset (cursor) pagination.
+
+    python -m benchmarks.pagination --rows 200000 --pages 1,10,100,1000,5000
+"""
+import argparse
+import asyncio
+
+from app.schemas.property import PropertySearchParams, PropertySort
+from app.services import property as property_service
+from app.utils.pagination import encode_cursor
+from benchmarks.common import (
+    database_url,
+    make_async_session_factory,
+    make_session_factory,
+    measure_async,
+    seed_properties,
+)
+
+
+async def run(args: argparse.Namespace) -> None:
+    url = database_url("pagination")
+    with make_session_factory(url)() as db:
+        seed_properties(db, args.rows)
+
+    AsyncSessionLocal = make_async_session_factory(url)
+    params = PropertySearchParams()
+    columns, _ = property_service.SORT_KEYS[args.sort]
+
+    print(f"{'page':>8} {'offset mean ms':>15} {'cursor mean ms':>15}")
+    async with AsyncSessionLocal() as db:
+        for page in (int(p) for p in args.pages.split(",")):
+            skip = (page - 1) * args.page_size
+            if skip >= args.rows:
+                break
+
+            # Cursor pointing just before page N, as a client would hold after paging to it
+            cursor = None
+            if skip:
+                before = (await property_service.get_properties(db, skip - 1, 1, params, args.sort))[0]
+                cursor = encode_cursor(args.sort.value, [getattr(before, c.key) for c in columns])
+
+            offset = await measure_async(
+                lambda: property_service.get_properties(db, skip, args.page_size, params, args.sort),
+                args.repeat,
+            )
+            keyset = await measure_async(
+                lambda: property_service.get_properties_page(db, args.page_size, params, args.sort, cursor),
+                args.repeat,
+            )
+            db.expunge_all()
+            print(f"{page:>8} {offset['mean']:>15.2f} {keyset['mean']:>15.2f}")
+
+    await AsyncSessionLocal.kw["bind"].dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--pages", default="1,10,100,1000,5000")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--sort", type=PropertySort, default=PropertySort.NEWEST)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Statements issued per page of property listings, for each view and search
+path, and per page of reviews and batch of latest reviews, at several page
+sizes. Pages are serialized the way the API does so any lazy load would be
+counted (or fail). Exits non-zero if a page's statement count depends on
+its size.
+
+    python -m benchmarks.query_count --rows 2000 --limits 10,50,200
+"""
+import argparse
+import asyncio
+import sys
+from typing import List
+
+from pydantic import TypeAdapter
+from sqlalchemy import event, insert
+
+from app.models.review import Review
+from app.schemas.property import Property, PropertySearchParams, PropertyView, projection_list
+from app.schemas.review import Review as ReviewSchema, ReviewSort
+from app.services import property as property_service
+from app.services import review as review_service
+from benchmarks.common import database_url, make_async_session_factory, make_session_factory, seed_properties
+
+property_list = TypeAdapter(List[Property])
+review_list = TypeAdapter(List[ReviewSchema])
+
+SEARCHES = {
+    "filters": PropertySearchParams(city="kampala", max_price=8_000_000),
+    "radius": PropertySearchParams(latitude=0.35, longitude=32.58, radius=20),
+    "keyword": PropertySearchParams(q="listing kampala"),
+}
+
+VIEWS = {
+    "full": (PropertyView.FULL, None),
+    "compact": (PropertyView.COMPACT, None),
+    "fields": (PropertyView.FULL, "title,price,owner_id"),
+}
+
+
+async def run(args: argparse.Namespace) -> int:
+    url = database_url("query_count")
+    with make_session_factory(url)() as db:
+        seed_properties(db, args.rows)
+        # Every owner reviews each of the first 20 properties
+        db.execute(insert(Review), [
+            {
+                "property_id": property_id,
+                "reviewer_id": reviewer_id,
+                "rating": 1 + (property_id + reviewer_id) % 5,
+                "comment": "Benchmark review",
+            }
+            for property_id in range(1, 21)
+            for reviewer_id in range(1, 51)
+        ])
+        db.commit()
+
+    AsyncSessionLocal = make_async_session_factory(url)
+    engine = AsyncSessionLocal.kw["bind"]
+    statements = []
+    event.listen(engine.sync_engine, "before_cursor_execute", lambda *a, **kw: statements.append(a[2]))
+
+    limits = [int(limit) for limit in args.limits.split(",")]
+    print(f"{'search':<8} {'view':<8} " + " ".join(f"{'limit ' + str(limit):>10}" for limit in limits))
+    failed = False
+    async with AsyncSessionLocal() as db:
+        for search_name, params in SEARCHES.items():
+            sort = property_service.default_sort(params)
+            # Load the in-memory indexes outside the counted pages
+            await property_service.get_properties(db, 0, 1, params, sort)
+            for view_name, (view, fields) in VIEWS.items():
+                selected = property_service.projected_fields(view, fields)
+                counts = []
+                for limit in limits:
+                    db.expunge_all()
+                    statements.clear()
+                    properties, _ = await property_service.get_properties_page(
+                        db, limit, params, sort, "", selected
+                    )
+                    if selected is None:
+                        property_list.dump_json(properties)
+                    else:
+                        projection_list(selected).dump_json(properties)
+                    counts.append(len(statements))
+                print(f"{search_name:<8} {view_name:<8} " + " ".join(f"{count:>10}" for count in counts))
+                if len(set(counts)) != 1:
+                    failed = True
+
+        for sort in ReviewSort:
+            counts = []
+            for limit in limits:
+                statements.clear()
+                reviews, _ = await review_service.get_property_reviews(db, 1, limit, sort)
+                review_list.dump_json(reviews)
+                counts.append(len(statements))
+            print(f"{'reviews':<8} {sort.value:<8} " + " ".join(f"{count:>10}" for count in counts))
+            failed = failed or len(set(counts)) != 1
+
+        counts = []
+        for limit in limits:
+            statements.clear()
+            await review_service.get_latest_reviews(db, list(range(1, limit + 1)), 3)
+            counts.append(len(statements))
+        print(f"{'latest':<8} {'3 each':<8} " + " ".join(f"{count:>10}" for count in counts))
+        failed = failed or len(set(counts)) != 1
+
+        statements.clear()
+        db.expunge_all()
+        property_list.dump_json([await property_service.get_property(db, 1)])
+        print(f"detail: {len(statements)} statement(s)")
+        failed = failed or len(statements) != 1
+
+    await engine.dispose()
+    if failed:
+        print("statement count depends on the page size", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--limits", default="10,50,200")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
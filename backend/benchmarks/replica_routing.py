@@ -0,0 +1,127 @@
+"""
+Check read/write routing against two local SQLite databases: a primary and
+a "replica" that only catches up when this script copies the primary over
+it, so replication lag is whatever the script says it is.
+
+An owner creates a listing that hasn't reached the replica. The owner's
+own reads must find it on the primary for --window seconds, while
+anonymous reads come from the replica and don't; once the window passes the
+owner reads from the replica too, and after replication everyone sees it.
+Listing pages are cached for every client, so a page read from the lagging
+replica right after the write must not be cached: the owner's next page
+comes from the primary, not the cache, and is what anonymous reads then get.
+Exits non-zero if any read went to the wrong database.
+
+    python -m benchmarks.replica_routing --window 1
+"""
+import os
+import sys
+import tempfile
+
+# app.database binds its engines when it is imported
+DIRECTORY = tempfile.mkdtemp(prefix="tenantconnect_replica_")
+PRIMARY = os.path.join(DIRECTORY, "primary.db")
+REPLICA = os.path.join(DIRECTORY, "replica.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{PRIMARY}"
+os.environ["DATABASE_REPLICA_URL"] = f"sqlite:///{REPLICA}"
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import sqlite3  # noqa: E402
+
+import httpx  # noqa: E402
+
+from app.database import Base, async_engine, engine, recent_writers, replica_async_engine  # noqa: E402
+from main import app  # noqa: E402
+
+OWNER = {
+    "email": "owner@example.com", "password": "replica-password", "full_name": "Owner",
+    "phone_number": "+256700000000", "user_type": "property_owner",
+}
+LISTING = {
+    "title": "2 bedroom apartment in Kololo", "property_type": "apartment",
+    "address": "Plot 1, Kololo Road", "city": "Kampala", "price": 1_500_000,
+}
+
+
+def replicate() -> None:
+    source, target = sqlite3.connect(PRIMARY), sqlite3.connect(REPLICA)
+    with target:
+        source.backup(target)
+    source.close()
+    target.close()
+
+
+async def run(window: float) -> int:
+    recent_writers.window = window
+    failures = 0
+
+    async def expect(client: httpx.AsyncClient, step: str, url: str, status: int, **kwargs) -> None:
+        nonlocal failures
+        response = await client.get(url, **kwargs)
+        ok = response.status_code == status
+        failures += not ok
+        print(f"{'ok' if ok else 'FAIL':<5} {step:<48} {response.status_code} (expected {status})")
+
+    async def expect_listed(
+        client: httpx.AsyncClient, step: str, property_id: int, listed: bool, cache: str, **kwargs
+    ) -> None:
+        nonlocal failures
+        response = await client.get("/properties/", **kwargs)
+        response.raise_for_status()
+        found = property_id in [listing["id"] for listing in response.json()]
+        status = response.headers.get("x-cache")
+        ok = found == listed and status == cache
+        failures += not ok
+        print(
+            f"{'ok' if ok else 'FAIL':<5} {step:<48} {'listed' if found else 'missing'}, cache {status} "
+            f"(expected {'listed' if listed else 'missing'}, cache {cache})"
+        )
+
+    Base.metadata.create_all(bind=engine)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(app=app, base_url="http://replica-check") as client:
+            response = await client.post("/auth/register", json=OWNER)
+            response.raise_for_status()
+            response = await client.post(
+                "/auth/token", data={"username": OWNER["email"], "password": OWNER["password"]}
+            )
+            owner = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            replicate()
+
+            # Cache the listing page as it was before the write
+            (await client.get("/properties/")).raise_for_status()
+            response = await client.post("/properties/", json=LISTING, headers=owner)
+            response.raise_for_status()
+            property_id = response.json()["id"]
+            url = f"/properties/{property_id}"
+
+            await expect_listed(client, "anonymous listing (replica, lagging)", property_id, False, "MISS")
+            await expect_listed(client, "owner listing (primary, fills cache)", property_id, True, "MISS", headers=owner)
+            await expect_listed(client, "anonymous listing (cached)", property_id, True, "HIT")
+
+            await expect(client, "owner reads own write (primary)", url, 200, headers=owner)
+            await expect(client, "anonymous read (replica, lagging)", url, 404)
+            await asyncio.sleep(window + 0.2)
+            await expect(client, "owner after the window (replica, lagging)", url, 404, headers=owner)
+            replicate()
+            await expect(client, "anonymous after replication (replica)", url, 200)
+
+    await async_engine.dispose()
+    await replica_async_engine.dispose()
+    engine.dispose()
+    if failures:
+        print(f"{failures} read(s) went to the wrong database", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--window", type=float, default=1.0, help="READ_YOUR_WRITES_SECONDS")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.window)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+Throughput and latency percentiles of the whole app under a mix of
+scenarios (search, listing detail, inbox, thread, login, post message),
+optionally compared against a stored baseline.
+
+N clients each run a closed loop for --duration seconds, picking scenarios
+at random by the mix's weights (seeded, so runs repeat). The app is driven
+in-process over ASGI, through uvicorn in a background thread, or at --url
+(a server using the same DATABASE_URL, which supplies the ids to request).
+
+Data comes from benchmarks.datagen. Without DATABASE_URL, a fresh SQLite
+file is generated for each run; with it, the existing data is used unless
+--reset-data asks to drop and regenerate every table.
+
+    python -m benchmarks.scenarios --mix browse --clients 20 --duration 30 --save base.json
+    python -m benchmarks.scenarios --mix browse --clients 20 --duration 30 --baseline base.json
+    python -m benchmarks.scenarios --mix search=3,detail=1 --target server
+"""
+import os
+import tempfile
+
+# main binds the app's engines to DATABASE_URL when it is imported
+RESET_DATA = "DATABASE_URL" not in os.environ
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'tenantconnect_scenarios.db')}"
+)
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import json  # noqa: E402
+import platform  # noqa: E402
+import random  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+from datetime import timedelta  # noqa: E402
+from typing import Any, Awaitable, Callable, Dict, List, Optional  # noqa: E402
+
+import httpx  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.models.message import Message  # noqa: E402
+from app.models.property import Property  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.utils.auth import create_access_token  # noqa: E402
+from benchmarks.common import CITIES, summarize  # noqa: E402
+from benchmarks.concurrency import ServerThread  # noqa: E402
+from benchmarks.datagen import DATAGEN_PASSWORD, SCALES, generate  # noqa: E402
+from main import app  # noqa: E402
+
+MIXES = {
+    "browse": {"search": 50, "detail": 30, "inbox": 8, "thread": 4, "post_message": 4, "login": 4},
+    "messaging": {"inbox": 35, "thread": 25, "post_message": 30, "search": 10},
+    "search": {"search": 100},
+    "login": {"login": 100},
+}
+
+# Scenarios with fewer requests than this, in the run or the baseline, are
+# too noisy to call a regression on
+MIN_SAMPLES = 30
+
+
+class Context:
+    """
+    Ids and tokens the scenarios pick from, read from the database.
+    """
+
+    def __init__(self) -> None:
+        with SessionLocal() as db:
+            self.property_ids = db.scalars(select(Property.id).order_by(Property.id)).all()
+            tenants = db.execute(
+                select(User.id, User.email).where(User.role == "tenant").order_by(User.id)
+            ).all()
+            # (tenant, property, owner) of each thread
+            self.threads = db.execute(
+                select(Message.sender_id, Message.property_id, Property.owner_id)
+                .join(Property, Property.id == Message.property_id)
+                .join(User, User.id == Message.sender_id)
+                .where(User.role == "tenant")
+                .distinct()
+                .order_by(Message.sender_id, Message.property_id)
+            ).all()
+        if not self.property_ids or not tenants or not self.threads:
+            raise SystemExit("no data; run with --reset-data or load benchmarks.datagen output")
+        self.tenant_emails = [email for _, email in tenants]
+        self.tokens = {
+            user_id: create_access_token({"sub": email}, timedelta(hours=2)) for user_id, email in tenants
+        }
+
+    def auth(self, user_id: int) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.tokens[user_id]}"}
+
+
+Scenario = Callable[[httpx.AsyncClient, Context, random.Random], Awaitable[httpx.Response]]
+
+
+async def search(client: httpx.AsyncClient, ctx: Context, rng: random.Random) -> httpx.Response:
+    city = rng.choice(list(CITIES))
+    params: Dict[str, Any] = {"limit": 20}
+    kind = rng.random()
+    if kind < 0.5:
+        params.update(city=city, max_price=rng.choice([1_000_000, 3_000_000, 10_000_000]))
+        if rng.random() < 0.5:
+            params["bedrooms"] = rng.randint(1, 4)
+    elif kind < 0.75:
+        params["q"] = rng.choice(["apartment", "house", "garden", "borehole", rng.choice(CITIES[city])])
+    else:
+        params.update(latitude=0.3476, longitude=32.5825, radius=rng.choice([2, 5, 10]))
+    return await client.get("/properties/", params=params)
+
+
+async def detail(client: httpx.AsyncClient, ctx: Context, rng: random.Random) -> httpx.Response:
+    return await client.get(f"/properties/{rng.choice(ctx.property_ids)}")
+
+
+async def inbox(client: httpx.AsyncClient, ctx: Context, rng: random.Random) -> httpx.Response:
+    tenant_id, _, _ = rng.choice(ctx.threads)
+    return await client.get("/messages/conversations", headers=ctx.auth(tenant_id))
+
+
+async def thread(client: httpx.AsyncClient, ctx: Context, rng: random.Random) -> httpx.Response:
+    tenant_id, property_id, owner_id = rng.choice(ctx.threads)
+    return await client.get(f"/messages/{property_id}/{owner_id}", headers=ctx.auth(tenant_id))
+
+
+async def post_message(client: httpx.AsyncClient, ctx: Context, rng: random.Random) -> httpx.Response:
+    tenant_id, property_id, owner_id = rng.choice(ctx.threads)
+    return await client.post(
+        "/messages/",
+        json={"content": "Is it still available?", "property_id": property_id, "receiver_id": owner_id},
+        headers=ctx.auth(tenant_id),
+    )
+
+
+async def login(client: httpx.AsyncClient, ctx: Context, rng: random.Random) -> httpx.Response:
+    return await client.post(
+        "/auth/token", data={"username": rng.choice(ctx.tenant_emails), "password": DATAGEN_PASSWORD}
+    )
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "search": search,
+    "detail": detail,
+    "inbox": inbox,
+    "thread": thread,
+    "post_message": post_message,
+    "login": login,
+}
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    if value in MIXES:
+        return MIXES[value]
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        try:
+            mix[name] = int(weight or 1)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid weight {weight!r} for {name}")
+    return mix
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    ctx: Context,
+    mix: Dict[str, int],
+    clients: int,
+    duration: float,
+    warmup: float,
+    seed: int
+) -> Dict[str, Any]:
+    samples: Dict[str, List[float]] = {name: [] for name in mix}
+    errors: Dict[str, int] = {name: 0 for name in mix}
+    names, weights = list(mix), list(mix.values())
+    started = time.perf_counter()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+
+    async def worker(number: int) -> None:
+        rng = random.Random(seed * 1000 + number)
+        while True:
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            if start >= deadline:
+                return
+            response = await SCENARIOS[name](client, ctx, rng)
+            if start >= measure_from:
+                samples[name].append((time.perf_counter() - start) * 1000)
+                if response.status_code >= 400:
+                    errors[name] += 1
+
+    await asyncio.gather(*(worker(number) for number in range(clients)))
+    elapsed = time.perf_counter() - measure_from
+
+    results: Dict[str, Dict[str, float]] = {}
+    for name in names:
+        if samples[name]:
+            results[name] = {
+                **summarize(samples[name]),
+                "requests": len(samples[name]),
+                "errors": errors[name],
+                "rps": len(samples[name]) / elapsed,
+            }
+    every = [sample for name in names for sample in samples[name]]
+    results["total"] = {
+        **summarize(every),
+        "requests": len(every),
+        "errors": sum(errors.values()),
+        "rps": len(every) / elapsed,
+    }
+    return results
+
+
+def print_results(results: Dict[str, Dict[str, float]], baseline: Optional[Dict[str, Dict[str, float]]]) -> None:
+    header = f"{'scenario':<13} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    if baseline is not None:
+        header += f" {'req/s Δ':>8} {'p95 Δ':>8}"
+    print(header)
+    for name, stats in results.items():
+        line = (
+            f"{name:<13} {stats['requests']:>9} {stats['errors']:>7} {stats['rps']:>8.1f} "
+            f"{stats['p50']:>8.1f} {stats['p95']:>8.1f} {stats['p99']:>8.1f}"
+        )
+        if baseline is not None and name in baseline:
+            line += (
+                f" {_change(stats['rps'], baseline[name]['rps']):>8}"
+                f" {_change(stats['p95'], baseline[name]['p95']):>8}"
+            )
+        print(line)
+
+
+def _change(value: float, base: float) -> str:
+    return f"{(value - base) / base * 100:+.0f}%" if base else "n/a"
+
+
+def regressions(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float
+) -> List[str]:
+    """
+    Scenarios whose throughput fell, or whose p95 latency rose, by more
+    than `tolerance` (a fraction) against the baseline.
+    """
+    found = []
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if base is None or min(stats["requests"], base["requests"]) < MIN_SAMPLES:
+            continue
+        if stats["rps"] < base["rps"] * (1 - tolerance):
+            found.append(f"{name}: {stats['rps']:.1f} req/s against {base['rps']:.1f}")
+        if stats["p95"] > base["p95"] * (1 + tolerance):
+            found.append(f"{name}: p95 {stats['p95']:.1f} ms against {base['p95']:.1f} ms")
+    return found
+
+
+async def run(args: argparse.Namespace) -> int:
+    if args.reset_data or RESET_DATA:
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        scale = {name: getattr(args, name) or value for name, value in SCALES[args.scale].items()}
+        with SessionLocal() as db:
+            counts = generate(db, scale, args.seed)
+        print(", ".join(f"{count} {name}" for name, count in counts.items()))
+    ctx = Context()
+
+    meta = {
+        "mix": args.mix,
+        "scale": args.scale if args.reset_data or RESET_DATA else "existing",
+        "seed": args.seed,
+        "clients": args.clients,
+        "duration": args.duration,
+        "target": args.url or args.target,
+        "database": engine.dialect.name,
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            stored = json.load(file)
+        differing = {key: (value, meta.get(key)) for key, value in stored["meta"].items() if meta.get(key) != value}
+        if differing:
+            print(f"warning: the baseline was recorded with different settings: {differing}", file=sys.stderr)
+        baseline = stored["results"]
+
+    mix = parse_mix(args.mix)
+    limits = httpx.Limits(max_connections=args.clients)
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+            results = await drive(client, ctx, mix, args.clients, args.duration, args.warmup, args.seed)
+    elif args.target == "server":
+        with ServerThread(app) as base_url:
+            async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+                results = await drive(client, ctx, mix, args.clients, args.duration, args.warmup, args.seed)
+    else:
+        transport = httpx.ASGITransport(app=app)
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60) as client:
+                results = await drive(client, ctx, mix, args.clients, args.duration, args.warmup, args.seed)
+
+    print(f"mix {args.mix}, {args.clients} clients, {args.duration:.0f}s, target {meta['target']}")
+    print_results(results, baseline)
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump({"meta": meta, "results": results}, file, indent=2)
+        print(f"saved to {args.save}")
+    if baseline is not None:
+        found = regressions(results, baseline, args.tolerance)
+        for regression in found:
+            print(f"regression: {regression}", file=sys.stderr)
+        return 1 if found else 0
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mix", default="browse", help=f"{', '.join(MIXES)} or weights like search=3,detail=1")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--target", choices=["asgi", "server"], default="asgi")
+    parser.add_argument("--url", help="benchmark a server that is already running")
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    for name in SCALES["small"]:
+        parser.add_argument(f"--{name}", type=int, help=f"override the scale's {name}")
+    parser.add_argument("--reset-data", action="store_true", help="drop every table in DATABASE_URL and regenerate")
+    parser.add_argument("--save", help="write the results as a baseline to this file")
+    parser.add_argument("--baseline", help="compare against a baseline saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression against the baseline")
+    args = parser.parse_args()
+    try:
+        parse_mix(args.mix)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
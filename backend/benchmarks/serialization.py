@@ -0,0 +1,109 @@
+"""
+Time to serialize a page of property listings (with embedded owners) to
+JSON bytes: FastAPI's response_model path (validate, dump to Python, then
+json.dumps or orjson), jsonable_encoder, and model_response, which dumps
+straight to JSON with pydantic-core. Then the size of the fastest body and
+the time to compress it with gzip and, when installed, brotli.
+
+    python -m benchmarks.serialization --limit 100 --repeat 200
+"""
+import argparse
+import asyncio
+import zlib
+from typing import Any, Callable, Coroutine, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.schemas.property import Property, PropertySearchParams, PropertySort
+from app.services import property as property_service
+from app.utils.compression import brotli
+from app.utils.responses import model_response
+from benchmarks.common import database_url, make_async_session_factory, make_session_factory, measure, seed_properties
+
+
+def report(name: str, stats: Dict[str, float], size: int) -> None:
+    print(f"{name:<28} {stats['mean']:>9.2f} {stats['p99']:>9.2f} {size:>9}")
+
+
+async def run(args: argparse.Namespace) -> None:
+    url = database_url("serialization")
+    with make_session_factory(url)() as db:
+        seed_properties(db, args.limit)
+
+    AsyncSessionLocal = make_async_session_factory(url)
+    engine = AsyncSessionLocal.kw["bind"]
+    async with AsyncSessionLocal() as db:
+        properties = await property_service.get_properties(
+            db, 0, args.limit, PropertySearchParams(), PropertySort.NEWEST
+        )
+    await engine.dispose()
+    assert len(properties) == args.limit, len(properties)
+
+    field = create_response_field(name="response", type_=List[Property])
+    models = [Property.model_validate(item, from_attributes=True) for item in properties]
+
+    def response_model(response_class: type) -> Callable[[], bytes]:
+        def serialize() -> bytes:
+            content = _complete(serialize_response(field=field, response_content=properties))
+            return response_class(content).body
+        return serialize
+
+    variants = {
+        "response_model + json": response_model(JSONResponse),
+        "response_model + orjson": response_model(ORJSONResponse),
+        "jsonable_encoder + json": lambda: JSONResponse(jsonable_encoder(models)).body,
+        "model_response": lambda: model_response(List[Property], properties, from_attributes=True).body,
+    }
+
+    print(f"{args.limit} listings, {args.repeat} runs")
+    print(f"{'serializer':<28} {'mean ms':>9} {'p99 ms':>9} {'bytes':>9}")
+    bodies = {}
+    for name, serialize in variants.items():
+        bodies[name] = serialize()
+        report(name, measure(serialize, args.repeat), len(bodies[name]))
+
+    body = bodies["model_response"]
+    compressors = {
+        f"gzip level {level}": (lambda level=level: _gzip(body, level))
+        for level in (1, 6, 9)
+    }
+    if brotli is not None:
+        for quality in (4, 11):
+            compressors[f"brotli quality {quality}"] = lambda quality=quality: brotli.compress(body, quality=quality)
+    print(f"\n{'compression':<28} {'mean ms':>9} {'p99 ms':>9} {'bytes':>9}")
+    report("none", {"mean": 0.0, "p99": 0.0}, len(body))
+    for name, compress in compressors.items():
+        report(name, measure(compress, args.repeat), len(compress()))
+    if brotli is None:
+        print("(brotli not installed)")
+
+
+def _complete(coroutine: Coroutine) -> Any:
+    """
+    Run a coroutine that never suspends, as serialize_response doesn't for
+    async routes, without an event loop in the timings.
+    """
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("coroutine suspended")
+
+
+def _gzip(body: bytes, level: int) -> bytes:
+    compressor = zlib.compressobj(level, wbits=31)
+    return compressor.compress(body) + compressor.flush()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
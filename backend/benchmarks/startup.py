@@ -0,0 +1,162 @@
+"""
+Cold start of the app, each run in a fresh interpreter: the time to import
+main, to run the lifespan startup (worker pools, broker, connection
+warm-up), and the latency of the first and second requests to a few
+routes. Reports the median and worst run, and optionally the slowest
+top-level imports (from python -X importtime).
+
+Results can be saved and compared against a stored baseline like the
+scenario benchmark; the run exits non-zero if a median is more than
+--tolerance slower.
+
+    python -m benchmarks.startup --runs 5 --save startup.json
+    python -m benchmarks.startup --runs 5 --baseline startup.json --imports 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+# Nothing from the app is imported at module level: the child runs import
+# this module first and must time the app's imports themselves.
+
+REQUESTS = {
+    "health": "/health",
+    "search": "/properties/?limit=20",
+    "detail": "/properties/1",
+}
+
+
+def child() -> None:
+    import asyncio
+    import httpx
+
+    started = time.perf_counter()
+    from main import app
+    timings = {"import": time.perf_counter() - started}
+
+    async def run() -> None:
+        started = time.perf_counter()
+        async with app.router.lifespan_context(app):
+            timings["startup"] = time.perf_counter() - started
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+                for attempt in ("first", "second"):
+                    for name, url in REQUESTS.items():
+                        started = time.perf_counter()
+                        response = await client.get(url)
+                        response.raise_for_status()
+                        timings[f"{attempt} {name}"] = time.perf_counter() - started
+
+    asyncio.run(run())
+    print(json.dumps({name: seconds * 1000 for name, seconds in timings.items()}))
+
+
+def prepare(directory: str) -> Dict[str, str]:
+    from benchmarks.common import make_session_factory, seed_properties
+
+    url = f"sqlite:///{os.path.join(directory, 'startup.db')}"
+    SessionLocal = make_session_factory(url)
+    with SessionLocal() as db:
+        seed_properties(db, 1000)
+    SessionLocal.kw["bind"].dispose()
+    return {
+        **os.environ,
+        "DATABASE_URL": url,
+        "UPLOAD_DIR": os.path.join(directory, "uploads"),
+    }
+
+
+def slowest_imports(env: Dict[str, str], count: int) -> List[str]:
+    """
+    The modules main imports directly, by cumulative import time.
+    """
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        env=env, capture_output=True, text=True, check=True,
+    ).stderr
+    entries = []
+    for line in output.splitlines():
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            # Names are indented two spaces per level below the import
+            # that pulled them in
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            entries.append((depth, int(cumulative), name.strip()))
+    # A module is listed after everything it imported, so main's direct
+    # imports are the depth-one entries since the previous top-level one
+    main_index = max(i for i, (depth, _, name) in enumerate(entries) if depth == 0 and name == "main")
+    start = max([i for i, (depth, _, _) in enumerate(entries[:main_index]) if depth == 0], default=-1) + 1
+    imports = [(micros, name) for depth, micros, name in entries[start:main_index] if depth == 1]
+    return [f"{name:<40} {micros / 1000:>8.1f} ms" for micros, name in sorted(imports, reverse=True)[:count]]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--imports", type=int, default=0, help="show the N slowest imports of main")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return
+
+    with tempfile.TemporaryDirectory(prefix="tenantconnect_startup_") as directory:
+        env = prepare(directory)
+        runs: List[Dict[str, float]] = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.startup", "--child"],
+                env=env, capture_output=True, text=True, check=True,
+            ).stdout
+            timings = json.loads(output.splitlines()[-1])
+            timings["process"] = (time.perf_counter() - started) * 1000
+            runs.append(timings)
+        imports = slowest_imports(env, args.imports) if args.imports else []
+
+    results = {
+        name: {"median": statistics.median(run[name] for run in runs), "max": max(run[name] for run in runs)}
+        for name in runs[0]
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    print(f"{args.runs} cold starts")
+    print(f"{'phase':<16} {'median ms':>10} {'max ms':>10}" + (f" {'baseline':>10}" if baseline else ""))
+    for name, stats in results.items():
+        line = f"{name:<16} {stats['median']:>10.1f} {stats['max']:>10.1f}"
+        if baseline and name in baseline:
+            line += f" {baseline[name]['median']:>10.1f}"
+        print(line)
+    if imports:
+        print("\nslowest imports of main")
+        print("\n".join(imports))
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"saved to {args.save}")
+    if baseline is not None:
+        found = [
+            f"{name}: {stats['median']:.1f} ms against {baseline[name]['median']:.1f} ms"
+            for name, stats in results.items()
+            if name in baseline and stats["median"] > baseline[name]["median"] * (1 + args.tolerance)
+        ]
+        for regression in found:
+            print(f"regression: {regression}", file=sys.stderr)
+        sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,50 @@
-from fastapi import FastAPI
+import os
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from fastapi.staticfiles import StaticFiles
-from typing import Dict
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy.orm import configure_mappers
+from typing import Any, AsyncIterator, Dict
 from app.api import auth, properties, messages, reviews, users
-from app.database import engine, Base
+from app.database import async_engine, dispose_engines, engine, replica_async_engine, warm_up_engines
+from app.services.broker import get_broker
+from app.services.cache import get_query_cache
+from app.utils.auth import require_metrics_token, user_cache
+from app.utils.compression import CompressionMiddleware
+from app.utils.images import UPLOAD_DIR, get_image_processor
+from app.utils.metrics import MetricsMiddleware, instrument_engine, render as render_metrics
+from app.utils.passwords import get_password_hasher
+from app.utils.query_detector import QUERY_DETECTOR, QueryDetectorMiddleware, watch_engine
+from app.utils.responses import default_response_class
+from app.utils.static import UploadFiles
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Importing this module has no side effects: the schema is managed by the
+# migrations (alembic upgrade head), and connections, worker processes and
+# the uploads directory are set up when the server starts the app.
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    try:
+        # Spawn the worker processes first so they start up while we connect
+        get_password_hasher().start()
+        get_image_processor().start()
+        await get_broker().start()
+        # Otherwise done by the first query, which would take ~150 ms longer
+        configure_mappers()
+        await warm_up_engines()
+        yield
+    finally:
+        await get_broker().stop()
+        get_image_processor().shutdown()
+        get_password_hasher().shutdown()
+        await dispose_engines()
 
 app = FastAPI(
     title="TenantConnect API",
     description="API for TenantConnect - A smart platform connecting tenants and property owners in Uganda",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=default_response_class(),
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -22,10 +54,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Cache"],
 )
 
-# Mount static files for profile pictures
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# gzip/brotli for JSON and other text responses over COMPRESSION_MIN_SIZE
+app.add_middleware(CompressionMiddleware)
+
+# N+1, slow statement and query budget reports, for development and CI
+if QUERY_DETECTOR:
+    app.add_middleware(QueryDetectorMiddleware)
+    watch_engine(engine)
+    watch_engine(async_engine.sync_engine)
+    watch_engine(replica_async_engine.sync_engine)
+
+# Per-route latency, size and database metrics for /metrics, outermost so
+# they cover the whole request and the bytes actually sent
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+instrument_engine(replica_async_engine.sync_engine)
+
+# Uploaded files, such as profile pictures; the directory is created at startup
+app.mount("/uploads", UploadFiles(directory=UPLOAD_DIR, check_dir=False), name="uploads")
 
 # Include routers
 app.include_router(auth.router, prefix="/auth", tags=["authentication"])
@@ -47,6 +97,17 @@ async def health_check() -> JSONResponse:
         }
     )
 
+@app.get("/cache/stats", dependencies=[Depends(require_metrics_token)])
+async def cache_stats() -> Dict[str, Any]:
+    return {
+        "queries": get_query_cache().stats(),
+        "users": user_cache.stats(),
+    }
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_metrics_token)])
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
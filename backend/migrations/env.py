@@ -0,0 +1,66 @@
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import engine_from_config, pool
+
+from app.database import Base, SQLALCHEMY_DATABASE_URL
+from app.models import message, property, review, user  # noqa: F401 - register tables
+
+config = context.config
+config.set_main_option("sqlalchemy.url", SQLALCHEMY_DATABASE_URL.replace("%", "%%"))
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+# Database objects managed only by migrations, not declared on the models
+UNMAPPED_OBJECTS = {
+    ("column", "geom"),
+    ("index", "ix_properties_geom"),
+    ("column", "search_vector"),
+    ("index", "ix_properties_search_vector"),
+    ("index", "ix_properties_city_trgm"),
+    ("index", "ix_properties_district_trgm"),
+}
+
+
+def include_object(object, name, type_, reflected, compare_to) -> bool:
+    return not (reflected and (type_, name) in UNMAPPED_OBJECTS)
+
+
+def run_migrations_offline() -> None:
+    context.configure(
+        url=config.get_main_option("sqlalchemy.url"),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        include_object=include_object,
+        dialect_opts={"paramstyle": "named"},
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    connectable = engine_from_config(
+        config.get_section(config.config_ini_section, {}),
+        prefix="sqlalchemy.",
+        poolclass=pool.NullPool,
+    )
+
+    with connectable.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_object=include_object,
+        )
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
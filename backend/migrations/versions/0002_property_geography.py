@@ -0,0 +1,46 @@
+"""Add a PostGIS geography column for property locations
+
+The column is generated from latitude/longitude, so existing rows are
+backfilled when it is added and it stays in sync on every insert and
+update without application code. Only applies to PostgreSQL; other
+databases use the in-memory index in app/services/geo.py.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 13:40:02.118245
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS postgis")
+    op.execute(
+        """
+        ALTER TABLE properties ADD COLUMN geom geography(Point, 4326)
+        GENERATED ALWAYS AS (
+            CASE WHEN latitude IS NOT NULL AND longitude IS NOT NULL
+            THEN ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography
+            END
+        ) STORED
+        """
+    )
+    op.execute("CREATE INDEX ix_properties_geom ON properties USING GIST (geom)")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("DROP INDEX IF EXISTS ix_properties_geom")
+    op.execute("ALTER TABLE properties DROP COLUMN IF EXISTS geom")
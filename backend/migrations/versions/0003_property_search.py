@@ -0,0 +1,52 @@
+"""Add full-text and trigram search indexes for properties
+
+search_vector is a generated tsvector over the title (weight A), city and
+district (B) and description (C), so existing rows are backfilled when it
+is added and it stays in sync without application code. The trigram
+indexes serve fuzzy matching of place names and the ILIKE city/district
+filters. Only applies to PostgreSQL; other databases use the in-memory
+index in app/services/search.py.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 15:12:47.503918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute(
+        """
+        ALTER TABLE properties ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(city, '') || ' ' || coalesce(district, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(description, '')), 'C')
+        ) STORED
+        """
+    )
+    op.execute("CREATE INDEX ix_properties_search_vector ON properties USING GIN (search_vector)")
+    op.execute("CREATE INDEX ix_properties_city_trgm ON properties USING GIN (city gin_trgm_ops)")
+    op.execute("CREATE INDEX ix_properties_district_trgm ON properties USING GIN (district gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("DROP INDEX IF EXISTS ix_properties_district_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_properties_city_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_properties_search_vector")
+    op.execute("ALTER TABLE properties DROP COLUMN IF EXISTS search_vector")
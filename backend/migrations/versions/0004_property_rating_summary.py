@@ -0,0 +1,71 @@
+"""Add the rating summary columns to properties
+
+rating_count, rating_sum, rating_average and the per-star counts are
+maintained by app/services/review.py on every review write. Existing
+reviews are counted in when the columns are added.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 17:02:11.418206
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+STAR_COLUMNS = [f"rating_{star}_count" for star in range(1, 6)]
+
+
+def upgrade() -> None:
+    op.add_column('properties', sa.Column('rating_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('properties', sa.Column('rating_sum', sa.Float(), server_default='0', nullable=False))
+    op.add_column('properties', sa.Column('rating_average', sa.Float(), server_default='0', nullable=False))
+    for column in STAR_COLUMNS:
+        op.add_column('properties', sa.Column(column, sa.Integer(), server_default='0', nullable=False))
+    op.create_index(
+        'ix_properties_rating_average_rating_count_id',
+        'properties',
+        ['rating_average', 'rating_count', 'id'],
+        unique=False
+    )
+
+    # Backfill from the existing reviews. Stars are the nearest whole star
+    # with halves rounding up, as in app.services.review.star.
+    rated = "FROM reviews WHERE reviews.property_id = properties.id AND reviews.rating IS NOT NULL"
+    stars = {
+        1: "reviews.rating < 1.5",
+        2: "reviews.rating >= 1.5 AND reviews.rating < 2.5",
+        3: "reviews.rating >= 2.5 AND reviews.rating < 3.5",
+        4: "reviews.rating >= 3.5 AND reviews.rating < 4.5",
+        5: "reviews.rating >= 4.5",
+    }
+    op.execute(
+        "UPDATE properties SET "
+        f"rating_count = (SELECT count(*) {rated}), "
+        f"rating_sum = coalesce((SELECT sum(reviews.rating) {rated}), 0), "
+        + ", ".join(
+            f"rating_{star}_count = (SELECT count(*) {rated} AND {condition})"
+            for star, condition in stars.items()
+        )
+    )
+    op.execute(
+        "UPDATE properties SET rating_average = rating_sum / rating_count WHERE rating_count > 0"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_properties_rating_average_rating_count_id', table_name='properties')
+    with op.batch_alter_table('properties') as batch_op:
+        for column in reversed(STAR_COLUMNS):
+            batch_op.drop_column(column)
+        batch_op.drop_column('rating_average')
+        batch_op.drop_column('rating_sum')
+        batch_op.drop_column('rating_count')
@@ -0,0 +1,27 @@
+"""Add indexes for paging a property's reviews
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 18:24:40.771930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_reviews_property_id_created_at_id', 'reviews', ['property_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_reviews_property_id_rating_id', 'reviews', ['property_id', 'rating', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_reviews_property_id_rating_id', table_name='reviews')
+    op.drop_index('ix_reviews_property_id_created_at_id', table_name='reviews')
@@ -0,0 +1,25 @@
+"""Add an index on property coordinates for map views
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 21:07:12.418305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_properties_latitude_longitude', 'properties', ['latitude', 'longitude'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_properties_latitude_longitude', table_name='properties')
@@ -0,0 +1,37 @@
+"""Add indexes for paging listings and messages
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 22:05:12.418306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_properties_created_at_id', 'properties', ['created_at', 'id'], unique=False)
+    op.create_index('ix_properties_price_id', 'properties', ['price', 'id'], unique=False)
+    op.create_index('ix_properties_owner_id_created_at_id', 'properties', ['owner_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_messages_sender_id_created_at', 'messages', ['sender_id', 'created_at'], unique=False)
+    op.create_index('ix_messages_receiver_id_created_at', 'messages', ['receiver_id', 'created_at'], unique=False)
+    op.create_index('ix_messages_receiver_id_is_read', 'messages', ['receiver_id', 'is_read'], unique=False)
+    op.create_index('ix_messages_thread', 'messages', ['sender_id', 'receiver_id', 'property_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_thread', table_name='messages')
+    op.drop_index('ix_messages_receiver_id_is_read', table_name='messages')
+    op.drop_index('ix_messages_receiver_id_created_at', table_name='messages')
+    op.drop_index('ix_messages_sender_id_created_at', table_name='messages')
+    op.drop_index('ix_properties_owner_id_created_at_id', table_name='properties')
+    op.drop_index('ix_properties_price_id', table_name='properties')
+    op.drop_index('ix_properties_created_at_id', table_name='properties')
@@ -0,0 +1,49 @@
+"""Delete a property's reviews and messages with it
+
+Deleting a property used to leave its reviews with a NULL property_id
+(and, where foreign keys aren't enforced, its messages pointing at the
+deleted row); those rows are removed before the foreign keys are made to
+cascade.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 09:12:37.520194
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ("reviews", "messages")
+
+# PostgreSQL's names for the unnamed constraints of the initial schema;
+# on SQLite this convention names them so batch mode can drop them
+NAMING_CONVENTION = {"fk": "%(table_name)s_%(column_0_name)s_fkey"}
+
+
+def _replace_foreign_key(table: str, ondelete: Union[str, None]) -> None:
+    name = f"{table}_property_id_fkey"
+    with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.drop_constraint(name, type_="foreignkey")
+        batch_op.create_foreign_key(name, "properties", ["property_id"], ["id"], ondelete=ondelete)
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.execute(
+            f"DELETE FROM {table} WHERE property_id IS NULL "
+            f"OR property_id NOT IN (SELECT id FROM properties)"
+        )
+        _replace_foreign_key(table, "CASCADE")
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        _replace_foreign_key(table, None)
@@ -0,0 +1,88 @@
+"""
+Tests run the API against a throwaway SQLite database, with the query
+budget plugin checking the statements every request in a test runs.
+
+Requests a test makes while arranging data belong in fixtures: a test's
+@pytest.mark.query_budget(n) applies to every request made while it runs.
+"""
+import itertools
+import os
+import tempfile
+
+# Before the app reads its settings
+_directory = tempfile.mkdtemp(prefix="tenantconnect_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_directory, 'test.db')}"
+os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_directory, 'test.db')}"
+os.environ["UPLOAD_DIR"] = os.path.join(_directory, "uploads")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+import pytest
+from fastapi.testclient import TestClient
+
+pytest_plugins = ["app.utils.query_budget", "pytester"]
+
+PASSWORD = "correct horse battery"
+
+_emails = itertools.count()
+
+@pytest.fixture(scope="session")
+def api():
+    from app.database import Base, engine
+    from main import app
+    Base.metadata.create_all(bind=engine)
+    return app
+
+@pytest.fixture
+def client(api):
+    with TestClient(api) as client:
+        yield client
+
+@pytest.fixture(autouse=True)
+def query_cache():
+    """
+    An empty listing cache for each test: a cached page runs no statements,
+    so it would pass any budget.
+    """
+    from app.services import cache
+    cache._query_cache = None
+    yield
+    cache._query_cache = None
+
+@pytest.fixture
+def make_user(client):
+    """
+    Register a user and return its id and the headers to act as it.
+    """
+    def make_user(role: str = "tenant"):
+        email = f"user{next(_emails)}@example.com"
+        response = client.post("/auth/register", json={
+            "email": email,
+            "password": PASSWORD,
+            "full_name": f"User {email}",
+            "phone_number": "+256700000000",
+            "role": role,
+        })
+        assert response.status_code == 200, response.text
+        token = client.post("/auth/token", data={"username": email, "password": PASSWORD})
+        assert token.status_code == 200, token.text
+        return response.json()["id"], {"Authorization": f"Bearer {token.json()['access_token']}"}
+    return make_user
+
+@pytest.fixture
+def make_property(client):
+    """
+    Create a listing as the given owner and return it.
+    """
+    def make_property(headers, **fields):
+        body = {
+            "title": "Two bedroom house",
+            "property_type": "house",
+            "address": "Plot 1",
+            "city": "Kampala",
+            "price": 1_500_000,
+            **fields,
+        }
+        response = client.post("/properties/", headers=headers, json=body)
+        assert response.status_code == 200, response.text
+        return response.json()
+    return make_property
@@ -0,0 +1,136 @@
+import asyncio
+from collections import OrderedDict
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app.services.broker import (
+    InMemoryRelay,
+    LocalBroker,
+    NOTIFY_MAX_BYTES,
+    RelayBroker,
+    SUBSCRIPTION_QUEUE_SIZE,
+    Subscription,
+    join_message,
+    split_message,
+)
+
+def test_relay_fans_out_to_every_worker():
+    async def run():
+        relay = InMemoryRelay()
+        workers = [RelayBroker(relay), RelayBroker(relay)]
+        for broker in workers:
+            await broker.start()
+        try:
+            first, second = (broker.subscribe(1) for broker in workers)
+            other = workers[1].subscribe(2)
+            await workers[0].publish_many([1, 1], {"type": "message", "id": 7})
+            events = [await asyncio.wait_for(subscription.get(), 1) for subscription in (first, second)]
+            assert events == [{"type": "message", "id": 7}] * 2
+            # Once each, for the subscribed user only
+            assert first.queue.empty() and second.queue.empty() and other.queue.empty()
+
+            workers[1].unsubscribe(second)
+            await workers[0].publish(1, {"type": "message", "id": 8})
+            assert await asyncio.wait_for(first.get(), 1) == {"type": "message", "id": 8}
+            assert second.queue.empty()
+        finally:
+            for broker in workers:
+                await broker.stop()
+    asyncio.run(run())
+
+def test_full_subscription_drops_typing_events():
+    async def run():
+        subscription = Subscription(1, maxsize=1)
+        subscription.offer({"type": "message", "id": 1})
+        subscription.offer({"type": "typing", "sender_id": 2, "property_id": 3})
+        assert subscription.dropped == 1
+        assert not subscription.overflowed.is_set()
+        subscription.offer({"type": "message", "id": 2})
+        assert subscription.overflowed.is_set()
+        # Nothing more is queued once it has overflowed
+        await subscription.get()
+        subscription.offer({"type": "message", "id": 3})
+        assert subscription.queue.empty()
+    asyncio.run(run())
+
+def test_local_broker_delivers_to_every_connection():
+    async def run():
+        broker = LocalBroker()
+        connections = [broker.subscribe(1), broker.subscribe(1)]
+        await broker.publish(1, {"type": "read", "id": 5})
+        assert [await connection.get() for connection in connections] == [{"type": "read", "id": 5}] * 2
+        for connection in connections:
+            broker.unsubscribe(connection)
+        assert broker.connection_count() == 0
+    asyncio.run(run())
+
+@pytest.mark.parametrize("message", ["{}", "x" * 20_000, "\u00e9\u6f22\U0001f600" * 3_000])
+def test_long_messages_fit_notify_payloads(message):
+    payloads = split_message(message, "sender:1")
+    assert all(len(payload.encode()) <= NOTIFY_MAX_BYTES for payload in payloads)
+    pending = OrderedDict()
+    assert [join_message(pending, payload) for payload in payloads][-1] == message
+    assert not pending
+
+def test_parts_from_several_senders_are_reassembled():
+    first, second = split_message("a" * 20_000, "one:1"), split_message("b" * 9_000, "two:1")
+    pending = OrderedDict()
+    interleaved = [payload for pair in zip(first, second) for payload in pair] + first[len(second):]
+    joined = [message for message in (join_message(pending, payload) for payload in interleaved) if message]
+    assert sorted(joined) == ["a" * 20_000, "b" * 9_000]
+    # A message missing a part is dropped, not delivered corrupted
+    assert [join_message(pending, payload) for payload in first[:1] + first[2:]] == [None] * (len(first) - 1)
+
+@pytest.fixture
+def thread(client, make_user, make_property):
+    """
+    An owner and a tenant who asked about one of the owner's two listings.
+    """
+    owner_id, owner = make_user("property_owner")
+    tenant_id, tenant = make_user()
+    listing, other_listing = make_property(owner), make_property(owner)
+    response = client.post("/messages/", headers=tenant, json={
+        "content": "Is it still available?", "property_id": listing["id"], "receiver_id": owner_id,
+    })
+    assert response.status_code == 200, response.text
+    return owner_id, owner, tenant_id, tenant, listing["id"], other_listing["id"]
+
+def token(headers):
+    return headers["Authorization"].split(" ", 1)[1]
+
+def test_websocket_closes_slow_consumer(client, thread, monkeypatch):
+    owner_id, owner, tenant_id, tenant, listing_id, _ = thread
+
+    async def stalled(websocket, subscription):
+        # A client too slow to take any event off the queue
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr("app.api.messages._send_events", stalled)
+    with client.websocket_connect(f"/messages/ws?token={token(owner)}") as websocket:
+        for n in range(SUBSCRIPTION_QUEUE_SIZE + 1):
+            response = client.post("/messages/", headers=tenant, json={
+                "content": f"Hello {n}", "property_id": listing_id, "receiver_id": owner_id,
+            })
+            assert response.status_code == 200, response.text
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+    assert closed.value.code == 1013
+
+def test_typing_only_reaches_existing_threads(client, thread, make_user):
+    owner_id, owner, tenant_id, tenant, listing_id, other_listing_id = thread
+    _, stranger = make_user()
+    with client.websocket_connect(f"/messages/ws?token={token(owner)}") as receiving, \
+            client.websocket_connect(f"/messages/ws?token={token(tenant)}") as typing, \
+            client.websocket_connect(f"/messages/ws?token={token(stranger)}") as spam:
+        spam.send_json({"type": "typing", "receiver_id": owner_id, "property_id": listing_id})
+        typing.send_json({"type": "typing", "receiver_id": owner_id, "property_id": other_listing_id})
+        typing.send_json({"type": "typing", "receiver_id": owner_id + 1000, "property_id": listing_id})
+        typing.send_json({"type": "typing", "receiver_id": owner_id, "property_id": listing_id})
+        # Only the last one is about a thread the sender is in
+        assert receiving.receive_json() == {"type": "typing", "sender_id": tenant_id, "property_id": listing_id}
+        response = client.post("/messages/", headers=tenant, json={
+            "content": "Hello?", "property_id": listing_id, "receiver_id": owner_id,
+        })
+        assert response.status_code == 200, response.text
+        assert receiving.receive_json()["type"] == "message"
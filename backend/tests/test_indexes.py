@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from app.services import clusters, geo, search
+
+class SlowSession:
+    """
+    Stands in for the session a cold load reads its snapshot with,
+    counting the snapshots read.
+    """
+    def __init__(self, rows):
+        self.rows = rows
+        self.snapshots = 0
+
+    async def execute(self, statement):
+        self.snapshots += 1
+        await asyncio.sleep(0.01)
+        return self
+
+    def all(self):
+        return self.rows
+
+def load_concurrently(ensure_loaded, db, loads=5):
+    async def run():
+        return await asyncio.gather(*(ensure_loaded(db) for _ in range(loads)))
+    return asyncio.run(run())
+
+def test_grid_is_loaded_once(monkeypatch):
+    monkeypatch.setattr(geo, "grid_index", geo.GridIndex())
+    monkeypatch.setattr(geo, "_grid_load_lock", asyncio.Lock())
+    db = SlowSession([(1, 0.3, 32.5), (2, 0.31, 32.51)])
+    indexes = load_concurrently(geo.ensure_grid_loaded, db)
+    assert db.snapshots == 1
+    assert all(index is geo.grid_index for index in indexes)
+    assert [point_id for point_id, _ in geo.grid_index.within(0.3, 32.5, 5)] == [1, 2]
+
+def test_text_index_is_loaded_once(monkeypatch):
+    monkeypatch.setattr(search, "text_index", search.TextIndex())
+    monkeypatch.setattr(search, "_text_index_load_lock", asyncio.Lock())
+    db = SlowSession([(1, "House near the lake", None, "Entebbe", None)])
+    indexes = load_concurrently(search.ensure_text_index_loaded, db)
+    assert db.snapshots == 1
+    assert all(index is search.text_index for index in indexes)
+    assert list(search.text_index.search("lake")) == [1]
+
+def test_cluster_index_is_loaded_once(monkeypatch):
+    monkeypatch.setattr(clusters, "cluster_index", clusters.ClusterIndex())
+    monkeypatch.setattr(clusters, "_cluster_index_load_lock", asyncio.Lock())
+    db = SlowSession([(1, 0.3, 32.5, 1_000_000), (2, 0.31, 32.51, 2_000_000)])
+    indexes = load_concurrently(clusters.ensure_cluster_index_loaded, db)
+    assert db.snapshots == 1
+    assert all(index is clusters.cluster_index for index in indexes)
+    assert len(clusters.cluster_index) == 2
+
+def test_stale_cluster_index_is_reloaded_once(monkeypatch):
+    monkeypatch.setattr(clusters, "cluster_index", clusters.ClusterIndex())
+    monkeypatch.setattr(clusters, "_cluster_index_load_lock", asyncio.Lock())
+    monkeypatch.setattr(clusters, "CLUSTER_INDEX_MAX_AGE", 60)
+    load_concurrently(clusters.ensure_cluster_index_loaded, SlowSession([]), loads=1)
+    clusters.cluster_index.loaded_at -= 61
+    db = SlowSession([(1, 0.3, 32.5, 1_000_000)])
+    load_concurrently(clusters.ensure_cluster_index_loaded, db)
+    assert db.snapshots == 1
+    assert len(clusters.cluster_index) == 1
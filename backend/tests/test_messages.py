@@ -0,0 +1,50 @@
+import pytest
+
+@pytest.fixture(params=[1, 12], ids=lambda count: f"{count} conversations")
+def inbox(request, client, make_user, make_property):
+    """
+    A user with a conversation about their listing with each of
+    `request.param` tenants, some of them unread.
+    """
+    owner_id, owner = make_user("property_owner")
+    listing = make_property(owner)
+    for n in range(request.param):
+        tenant_id, tenant = make_user()
+        for content in ("Is it still available?", "Can I view it on Saturday?"):
+            response = client.post("/messages/", headers=tenant, json={
+                "content": content, "property_id": listing["id"], "receiver_id": owner_id,
+            })
+            assert response.status_code == 200, response.text
+        if n % 2:
+            response = client.post("/messages/", headers=owner, json={
+                "content": "Yes", "property_id": listing["id"], "receiver_id": tenant_id,
+            })
+            assert response.status_code == 200, response.text
+    return owner, request.param
+
+# The inbox runs the same statements however many conversations there are
+@pytest.mark.query_budget(2)
+def test_inbox_statements_are_constant(client, inbox):
+    headers, conversations = inbox
+    response = client.get("/messages/conversations", headers=headers)
+    assert response.status_code == 200, response.text
+    assert len(response.json()) == conversations
+
+@pytest.mark.query_budget(2)
+def test_inbox_pages_stay_in_budget(client, inbox):
+    headers, conversations = inbox
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 5, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/messages/conversations", headers=headers, params=params)
+        assert response.status_code == 200, response.text
+        seen += [conversation["user_id"] for conversation in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert len(seen) == len(set(seen)) == conversations
+
+def test_inbox_rejects_malformed_cursor(client, inbox):
+    headers, _ = inbox
+    response = client.get("/messages/conversations", headers=headers, params={"cursor": "W10"})
+    assert response.status_code == 400
@@ -0,0 +1,14 @@
+import pytest
+
+from app.utils import auth
+
+@pytest.mark.parametrize("path", ["/metrics", "/cache/stats"])
+def test_operational_endpoints_need_the_metrics_token(client, make_user, monkeypatch, path):
+    _, user = make_user()
+    monkeypatch.setattr(auth, "METRICS_TOKEN", None)
+    assert client.get(path, headers={"Authorization": "Bearer anything"}).status_code == 404
+
+    monkeypatch.setattr(auth, "METRICS_TOKEN", "scraper-secret")
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers=user).status_code == 401
+    assert client.get(path, headers={"Authorization": "Bearer scraper-secret"}).status_code == 200
@@ -0,0 +1,110 @@
+import base64
+import json
+
+import pytest
+
+LISTINGS = 30
+
+@pytest.fixture
+def listings(client, make_user, make_property):
+    """
+    LISTINGS listings from two owners, with a review on some of them.
+    """
+    owners = [make_user("property_owner")[1] for _ in range(2)]
+    created = []
+    for n in range(LISTINGS):
+        created.append(make_property(
+            owners[n % 2],
+            title=f"Listing {n} near the lake",
+            city="Kampala" if n % 3 else "Entebbe",
+            price=500_000 + 50_000 * n,
+            bedrooms=1 + n % 4,
+            latitude=0.3 + n / 1000,
+            longitude=32.5 + n / 1000,
+        ))
+    _, reviewer = make_user()
+    for listing in created[::5]:
+        response = client.post("/reviews/", headers=reviewer, json={
+            "property_id": listing["id"], "rating": 4, "comment": "Quiet and clean",
+        })
+        assert response.status_code == 200, response.text
+    return created
+
+def walk(client, params):
+    seen, cursor = [], ""
+    while True:
+        response = client.get("/properties/", params={**params, "cursor": cursor})
+        assert response.status_code == 200, response.text
+        seen += [listing["id"] for listing in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return seen
+
+# Each page runs the same statements, whatever its size, view or sort
+@pytest.mark.query_budget(3)
+@pytest.mark.parametrize("limit", [4, 25])
+@pytest.mark.parametrize("params", [
+    {"sort": "newest"},
+    {"sort": "price_asc", "view": "compact"},
+    {"sort": "rating", "fields": "title,price,owner_id"},
+    {"city": "kampala", "max_price": 1_500_000},
+    {"latitude": 0.31, "longitude": 32.51, "radius": 10},
+    {"q": "lake"},
+])
+def test_listing_pages_stay_in_budget(client, listings, params, limit):
+    seen = walk(client, {**params, "limit": limit})
+    assert len(seen) == len(set(seen))
+    if set(params) <= {"sort", "view", "fields"}:
+        # Other tests' listings are in the database too
+        assert {listing["id"] for listing in listings} <= set(seen)
+
+def test_cached_listing_runs_no_statements(client, listings):
+    from app.utils import query_detector
+    logs = []
+    query_detector.add_listener(logs.append)
+    try:
+        for _ in range(2):
+            assert client.get("/properties/", params={"limit": 10}).status_code == 200
+    finally:
+        query_detector.remove_listener(logs.append)
+    assert [log.count for log in logs][1] == 0
+
+def test_deleting_a_property_deletes_its_reviews_and_messages(client, make_user, make_property):
+    owner_id, owner = make_user("property_owner")
+    _, tenant = make_user()
+    listing = make_property(owner)
+    review = client.post("/reviews/", headers=tenant, json={
+        "property_id": listing["id"], "rating": 5, "comment": "Lovely garden",
+    })
+    assert review.status_code == 200, review.text
+    message = client.post("/messages/", headers=tenant, json={
+        "content": "Is it still available?", "property_id": listing["id"], "receiver_id": owner_id,
+    })
+    assert message.status_code == 200, message.text
+
+    response = client.delete(f"/properties/{listing['id']}", headers=owner)
+    assert response.status_code == 200, response.text
+    assert client.get(f"/properties/{listing['id']}").status_code == 404
+    assert client.get(f"/reviews/property/{listing['id']}").json() == []
+    response = client.put(f"/reviews/{review.json()['id']}", headers=tenant, json={"comment": "Gone"})
+    assert response.status_code == 404
+    assert client.get("/messages/conversations", headers=owner).json() == []
+
+@pytest.mark.parametrize("key", [
+    {"s": "newest", "k": [1]},
+    {"s": "newest", "k": [{"x": 1}, 2]},
+    {"s": "price_asc", "k": [1, 2]},
+    [1, 2, 3],
+])
+def test_malformed_cursor_is_rejected(client, key):
+    cursor = base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+    response = client.get("/properties/", params={"sort": "newest", "cursor": cursor})
+    assert response.status_code == 400
+    response = client.get("/reviews/property/1", params={"cursor": cursor})
+    assert response.status_code == 400
+
+@pytest.mark.parametrize("params", [{"skip": -1}, {"limit": 0}, {"limit": 101}])
+def test_page_bounds_are_enforced(client, make_user, params):
+    _, owner = make_user("property_owner")
+    assert client.get("/properties/", params=params).status_code == 422
+    assert client.get("/properties/owner/me", headers=owner, params=params).status_code == 422
@@ -0,0 +1,36 @@
+import asyncio
+import codecs
+import json
+
+from app.services import property_import
+
+def records(parse, body, chunk_size=7):
+    async def chunks():
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+
+    async def run():
+        return [record async for record in parse(chunks())]
+    return asyncio.run(run())
+
+def test_record_limit_counts_utf8_bytes(monkeypatch):
+    monkeypatch.setattr(property_import, "IMPORT_MAX_RECORD_BYTES", 60)
+    short = json.dumps({"title": "Kampala house, near the lake"}, ensure_ascii=False)
+    wide = json.dumps({"title": "é" * 30}, ensure_ascii=False)
+    # Under the limit in characters, over it in bytes
+    assert len(wide) < 60 < len(wide.encode())
+    body = codecs.BOM_UTF8 + f"{short}\n{wide}\n{short}".encode()
+    assert records(property_import._ndjson_records, body) == [
+        (1, {"title": "Kampala house, near the lake"}, None),
+        (2, None, property_import.TOO_LONG),
+        (3, {"title": "Kampala house, near the lake"}, None),
+    ]
+
+def test_multi_line_csv_record_limit_counts_utf8_bytes(monkeypatch):
+    monkeypatch.setattr(property_import, "IMPORT_MAX_RECORD_BYTES", 60)
+    # A quoted field still open after two lines of 20 characters, 40 bytes each
+    body = 'title,description\nFlat,"two\nlines"\nHouse,"' + "é" * 20 + "\n" + "é" * 20 + "\n"
+    assert records(property_import._csv_records, body.encode()) == [
+        (2, {"title": "Flat", "description": "two\nlines"}, None),
+        (4, None, property_import.TOO_LONG),
+    ]
@@ -0,0 +1,23 @@
+import pytest
+
+REQUESTS = """
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+
+@pytest.mark.query_budget(0)
+def test_over_marked_budget():
+    assert TestClient(app).get("/reviews/property/1").status_code == 200
+
+def test_within_route_budget():
+    assert TestClient(app).get("/reviews/property/1").status_code == 200
+"""
+
+# The inner run's requests reach this test's listener too, with the inner
+# marker's budget applied; this marker overrides it so only the inner test fails
+@pytest.mark.query_budget(100)
+def test_requests_over_budget_fail(api, pytester):
+    pytester.makepyfile(REQUESTS)
+    result = pytester.runpytest("-p", "app.utils.query_budget")
+    result.assert_outcomes(passed=1, failed=1)
+    result.stdout.fnmatch_lines(["*query budget exceeded*", "*GET /reviews/property/{property_id}: 1 statements, budget 0*"])